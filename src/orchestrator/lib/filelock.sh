@@ -7,6 +7,11 @@
 #
 # Mailbox lock: mailbox_lock() / mailbox_unlock()
 #   All writers to .cmux/mailbox MUST use these to prevent JSONL corruption.
+#   mailbox_records prints every record still on disk, across segments.
+#
+# Router lease: router_lease_trylock() / router_lease_release()
+#   Only the holder routes .cmux/mailbox. The server's MailboxRouter holds it
+#   while running; router.sh takes it for one cycle at a time.
 #
 # Tmux send lock: tmux_send_lock(window) / tmux_send_unlock()
 #   All scripts that send-keys to agent tmux windows SHOULD use these to
@@ -39,6 +44,41 @@ mailbox_unlock() {
     eval "exec ${_CMUX_LOCK_FD}>&-"
 }
 
+# Mailbox records oldest first: sealed segments in .cmux/mailbox.d/ (see
+# src/server/services/mailbox_segments.py), then the active file. Routed
+# segments are compacted away, so this is recent history, not all of it.
+mailbox_records() {
+    local mailbox="${1:-${CMUX_MAILBOX:-.cmux/mailbox}}"
+    local segment
+    for segment in "${mailbox}.d"/*.jsonl; do
+        [[ -f "$segment" ]] && cat "$segment"
+    done
+    [[ -f "$mailbox" ]] && cat "$mailbox"
+    return 0
+}
+
+#-------------------------------------------------------------------------------
+# Router lease (shared with src/server/services/mailbox_router.py)
+#-------------------------------------------------------------------------------
+
+CMUX_ROUTER_LEASE="${CMUX_ROUTER_LEASE:-.cmux/router.lock}"
+_CMUX_LEASE_FD=6
+
+# Non-blocking: returns 1 if another router holds the lease
+router_lease_trylock() {
+    eval "exec ${_CMUX_LEASE_FD}>\"${CMUX_ROUTER_LEASE}\""
+
+    if command -v flock &>/dev/null; then
+        flock -x -n ${_CMUX_LEASE_FD}
+    else
+        python3 -c "import fcntl; fcntl.flock(${_CMUX_LEASE_FD}, fcntl.LOCK_EX | fcntl.LOCK_NB)" 2>/dev/null
+    fi
+}
+
+router_lease_release() {
+    eval "exec ${_CMUX_LEASE_FD}>&-"
+}
+
 #-------------------------------------------------------------------------------
 # Per-window tmux send locking
 # Prevents router, journal-nudge, and compact from interleaving send-keys
@@ -251,7 +251,9 @@ tmux_pane_state() {
 # Flags:
 #   --force    Send regardless of pane state (for emergencies like sentry)
 #   --retry N  Wait 3s and retry up to N times if not at prompt
-#   --queue    Queue message for later delivery if not at prompt
+#   --queue    Queue message for later delivery if not at prompt. While the
+#              server is up it takes the message straight away (no retries)
+#              and types it in when the agent's turn ends.
 tmux_safe_send() {
     local session="$1"
     local window="$2"
@@ -287,6 +289,15 @@ tmux_safe_send() {
         return 0
     fi
 
+    # Not at prompt — hand it to the server's delivery queue if allowed to queue
+    if $queue; then
+        local server_rc=0
+        _tmux_server_deliver "$session" "$window" "$text" || server_rc=$?
+        if ((server_rc != 1)); then
+            return "$server_rc"
+        fi
+    fi
+
     # Not at prompt — try retries
     local attempt=0
     while ((attempt < retry)); do
@@ -310,6 +321,27 @@ tmux_safe_send() {
     return 1
 }
 
+# Give a message to the server's per-agent delivery queue (internal helper)
+# Returns: 0 = typed in now, 2 = queued by the server, 1 = server unavailable
+_tmux_server_deliver() {
+    local session="$1"
+    local window="$2"
+    local text="$3"
+
+    command -v jq &>/dev/null || return 1
+
+    local payload response
+    payload=$(jq -n --arg session "$session" --arg window "$window" --arg text "$text" \
+        '{session: $session, window: $window, text: $text}')
+    response=$(curl -sf -m 5 -X POST "http://localhost:${CMUX_PORT:-8000}/api/messages/delivery" \
+        -H "Content-Type: application/json" -d "$payload" 2>/dev/null) || return 1
+
+    if [[ "$(jq -r '.delivered' <<< "$response" 2>/dev/null)" == "true" ]]; then
+        return 0
+    fi
+    return 2
+}
+
 # Queue a message for later delivery (internal helper)
 _tmux_queue_message() {
     local session="$1"
@@ -15,6 +15,7 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 source "${SCRIPT_DIR}/lib/common.sh"
 source "${SCRIPT_DIR}/lib/tmux.sh"
 source "${SCRIPT_DIR}/lib/logging.sh"
+source "${SCRIPT_DIR}/lib/filelock.sh"
 
 # Configuration
 CMUX_SESSION="${CMUX_SESSION:-cmux}"
@@ -502,7 +503,7 @@ check_supervisor_heartbeat() {
         local hb_supervisor="active (${staleness}s idle)"
         local hb_workers hb_mailbox hb_backlog hb_health hb_git
         hb_workers=$(tmux list-windows -t "$CMUX_SESSION" -F '#{window_name}' 2>/dev/null | { grep -v -e '^supervisor$' -e '^monitor$' -e '^sup-' -e '^sentry$' || true; } | wc -l | xargs)
-        hb_mailbox=$(grep -c '"status":"submitted"' "$CMUX_MAILBOX" 2>/dev/null || echo "0")
+        hb_mailbox=$(mailbox_records "$CMUX_MAILBOX" | grep -c '"status":"submitted"' || true)
         hb_backlog=$(sqlite3 "${CMUX_PROJECT_ROOT}/.cmux/tasks.db" "SELECT COUNT(*) FROM tasks WHERE status='backlog';" 2>/dev/null || echo "0")
         hb_health=$(curl -sf --max-time 1 "http://localhost:${CMUX_PORT}/api/webhooks/health" 2>/dev/null | grep -q '"api":"healthy"' && echo "healthy" || echo "degraded")
         hb_git=$(git -C "$CMUX_PROJECT_ROOT" diff --stat HEAD 2>/dev/null | tail -1 | sed 's/^ *//')
@@ -801,7 +802,7 @@ spawn_sentry() {
     # Gather context: recent mailbox
     local mailbox_context=""
     if [[ -f "$CMUX_MAILBOX" ]]; then
-        mailbox_context=$(tail -10 "$CMUX_MAILBOX" 2>/dev/null || echo "(empty)")
+        mailbox_context=$(mailbox_records "$CMUX_MAILBOX" | tail -10 || echo "(empty)")
     fi
 
     # Gather context: backlog items
@@ -813,7 +814,7 @@ spawn_sentry() {
     # Gather context: recent mailbox subjects
     local mailbox_subjects=""
     if [[ -f "$CMUX_MAILBOX" ]]; then
-        mailbox_subjects=$(tail -5 "$CMUX_MAILBOX" 2>/dev/null | { grep -o '"subject":"[^"]*"' || true; } | sed 's/"subject":"//;s/"$//' || echo "(empty)")
+        mailbox_subjects=$(mailbox_records "$CMUX_MAILBOX" | tail -5 | { grep -o '"subject":"[^"]*"' || true; } | sed 's/"subject":"//;s/"$//' || echo "(empty)")
     fi
     [[ -z "$mailbox_subjects" ]] && mailbox_subjects="(no recent messages)"
 
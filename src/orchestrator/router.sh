@@ -11,6 +11,16 @@
 # Examples:
 #   {"ts":"2026-01-31T06:00:00Z","from":"cmux:worker-auth","to":"cmux:supervisor","subject":"[DONE] JWT complete"}
 #   {"ts":"2026-01-31T06:00:00Z","from":"cmux:worker","to":"user","subject":"Bug fixed","body":"path/to/file.md"}
+#
+# The server routes the mailbox itself (src/server/services/mailbox_router.py)
+# and holds the router lease while it runs. This daemon takes the lease for
+# one cycle at a time, so it stands by while the server is up and routes
+# only when it is not.
+#
+# Position: .cmux/.router_offset holds {"segment": N, "offset": bytes}, shared
+# with the server. The server seals .cmux/mailbox into .cmux/mailbox.d/ once it
+# grows large; sealed segments are read from the saved offset to their end
+# before the active file.
 #===============================================================================
 
 set -euo pipefail
@@ -27,7 +37,9 @@ CMUX_PORT="${CMUX_PORT:-8000}"
 CMUX_ROUTER_LOG="${CMUX_ROUTER_LOG:-.cmux/router.log}"
 
 POLL_INTERVAL=2
+POSITION_FILE=".cmux/.router_offset"
 LINE_MARKER=".cmux/.router_line"
+SEGMENT_INDEX="${CMUX_MAILBOX}.d/index.json"
 
 #-------------------------------------------------------------------------------
 # Logging
@@ -42,27 +54,50 @@ log_route() {
 }
 
 #-------------------------------------------------------------------------------
-# Position Tracking (line-based)
+# Position Tracking (segment + byte offset)
 #-------------------------------------------------------------------------------
 
-get_last_line() {
-    if [[ -f "$LINE_MARKER" ]]; then
-        local val
-        val=$(cat "$LINE_MARKER")
-        # Validate: must be a non-negative integer
-        if [[ "$val" =~ ^[0-9]+$ ]]; then
-            echo "$val"
-        else
-            log_route "WARN" "router" "self" "invalid line marker '$val', resetting to 0"
-            echo "0"
+get_active_segment() {
+    local active
+    active=$(jq -r '.active // 1' "$SEGMENT_INDEX" 2>/dev/null) || active=1
+    [[ "$active" =~ ^[0-9]+$ ]] || active=1
+    echo "$active"
+}
+
+segment_file() {
+    printf '%s.d/%08d.jsonl' "$CMUX_MAILBOX" "$1"
+}
+
+# Prints "segment offset"
+get_position() {
+    local position
+    if [[ -f "$POSITION_FILE" ]]; then
+        position=$(jq -r '"\(.segment // "") \(.offset // "")"' "$POSITION_FILE" 2>/dev/null) || position=""
+        if [[ "$position" =~ ^[0-9]+\ [0-9]+$ ]]; then
+            echo "$position"
+            return 0
+        fi
+        # Byte offset into the mailbox from before it was segmented
+        if [[ "$position" =~ ^\ [0-9]+$ ]]; then
+            echo "$(get_active_segment)${position}"
+            return 0
+        fi
+        log_route "WARN" "router" "self" "invalid position '$position', resetting to 0"
+    elif [[ -f "$LINE_MARKER" ]]; then
+        # Line count from before positions were byte offsets
+        local lines
+        lines=$(cat "$LINE_MARKER")
+        if [[ "$lines" =~ ^[0-9]+$ ]] && [[ -f "$CMUX_MAILBOX" ]]; then
+            echo "$(get_active_segment) $(head -n "$lines" "$CMUX_MAILBOX" | wc -c | xargs)"
+            return 0
         fi
-    else
-        echo "0"
     fi
+    echo "1 0"
 }
 
-save_line() {
-    echo "$1" > "$LINE_MARKER"
+save_position() {
+    printf '{"segment": %d, "offset": %d}\n' "$1" "$2" > "${POSITION_FILE}.tmp"
+    mv -f "${POSITION_FILE}.tmp" "$POSITION_FILE"
 }
 
 #-------------------------------------------------------------------------------
@@ -301,47 +336,57 @@ route_message() {
 #-------------------------------------------------------------------------------
 
 process_mailbox() {
-    if [[ ! -f "$CMUX_MAILBOX" ]]; then
-        return 0
-    fi
-
-    # Get current line count
-    local last_line current_line
-    last_line=$(get_last_line)
-    current_line=$(wc -l < "$CMUX_MAILBOX" | xargs)
+    local segment offset active size
+    read -r segment offset <<< "$(get_position)"
 
-    # Detect mailbox truncation/recreation: reset marker if file shrunk
-    if ((current_line < last_line)); then
-        log_route "WARN" "router" "self" "mailbox shrunk (${last_line} -> ${current_line}), resetting position"
-        last_line=0
-    fi
+    # Lock mailbox during read + position update to prevent reading partial writes
+    mailbox_lock
 
-    if ((current_line <= last_line)); then
-        return 0
+    active=$(get_active_segment)
+    if ((segment > active)); then
+        log_route "WARN" "router" "self" "position is past the active segment ($segment > $active), resetting"
+        segment=$active
+        offset=0
     fi
 
-    # Lock mailbox during read + line marker update to prevent reading partial writes
-    mailbox_lock
+    # Snapshot the new lines while holding the lock: first the rest of any
+    # segments sealed since the last cycle, then the active file
+    local new_lines=""
+    while ((segment < active)); do
+        local sealed
+        sealed=$(segment_file "$segment")
+        if [[ -f "$sealed" ]]; then
+            new_lines+="$(tail -c +"$((offset + 1))" "$sealed")"$'\n'
+        fi
+        segment=$((segment + 1))
+        offset=0
+    done
 
-    # Re-check line count under lock (may have changed)
-    current_line=$(wc -l < "$CMUX_MAILBOX" | xargs)
-    if ((current_line <= last_line)); then
-        mailbox_unlock
-        return 0
+    if [[ -f "$CMUX_MAILBOX" ]]; then
+        size=$(wc -c < "$CMUX_MAILBOX" | xargs)
+        # Detect mailbox truncation/recreation: reset offset if file shrunk
+        if ((size < offset)); then
+            log_route "WARN" "router" "self" "mailbox shrunk (${offset} -> ${size} bytes), resetting position"
+            offset=0
+        fi
+        if ((size > offset)); then
+            new_lines+="$(tail -c +"$((offset + 1))" "$CMUX_MAILBOX")"
+            offset=$size
+        fi
     fi
 
-    # Snapshot the new lines while holding the lock
-    local line_num=$((last_line + 1))
-    local new_lines
-    new_lines=$(tail -n +"$line_num" "$CMUX_MAILBOX")
-    local lines_processed=0
-    lines_processed=$(echo "$new_lines" | wc -l | xargs)
-
-    # Update line marker while still holding lock
-    save_line $((last_line + lines_processed))
+    # Update position while still holding lock
+    save_position "$segment" "$offset"
     mailbox_unlock
 
     # Process lines outside the lock (routing can take time)
+    if [[ -n "$new_lines" ]]; then
+        route_lines "$new_lines"
+    fi
+}
+
+route_lines() {
+    local line
     while IFS= read -r line || [[ -n "$line" ]]; do
         # Skip empty lines
         [[ -z "$line" ]] && continue
@@ -364,7 +409,7 @@ process_mailbox() {
         else
             log_route "SKIP" "unknown" "unknown" "invalid line: ${line:0:50}..."
         fi
-    done <<< "$new_lines"
+    done <<< "$1"
 }
 
 #-------------------------------------------------------------------------------
@@ -396,7 +441,7 @@ main() {
     log_info "Message router started (JSONL format)"
 
     # Ensure directories exist
-    mkdir -p "$(dirname "$LINE_MARKER")"
+    mkdir -p "$(dirname "$POSITION_FILE")"
     mkdir -p "$(dirname "$CMUX_ROUTER_LOG")"
 
     # Verify jq is available
@@ -408,9 +453,20 @@ main() {
     # Log startup
     log_route "STARTUP" "router" "all" "Router daemon started (v3 - JSONL format)"
 
+    local standby=false
     while true; do
-        process_mailbox
-        drain_all_queues
+        if router_lease_trylock; then
+            if [[ "$standby" == "true" ]]; then
+                log_route "ACTIVE" "router" "all" "server router not running, routing from router.sh"
+                standby=false
+            fi
+            process_mailbox
+            drain_all_queues
+            router_lease_release
+        elif [[ "$standby" == "false" ]]; then
+            log_route "STANDBY" "router" "all" "server router holds the lease"
+            standby=true
+        fi
         sleep "$POLL_INTERVAL"
     done
 }
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from typing import Literal
 
 
 class Settings(BaseSettings):
@@ -27,6 +28,110 @@ class Settings(BaseSettings):
     # Startup delay for Claude to initialize (seconds)
     claude_startup_delay: int = 8
 
+    # Send tmux commands over one persistent `tmux -C` connection instead of
+    # a process per command (falls back automatically when unavailable)
+    tmux_control_mode: bool = True
+
+    # Agent topology cache: re-sweep tmux at most this often when control-mode
+    # notifications are unavailable, and at most once per miss interval when
+    # a lookup misses
+    topology_refresh_seconds: float = 5.0
+    topology_miss_refresh_seconds: float = 1.0
+
+    # Live terminal streams (/api/agents/{id}/terminal/stream): bytes of pane
+    # output kept per pane for viewers that join late, and scrollback lines
+    # captured to seed a new stream
+    terminal_stream_buffer_bytes: int = 256 * 1024
+    terminal_stream_seed_lines: int = 200
+
+    # Route .cmux/mailbox inside the server (services/mailbox_router.py).
+    # router.sh stays on standby and only routes while no server holds the
+    # router lease. New lines are picked up from filesystem notifications
+    # (or the server's own appends) and checked for every poll interval.
+    mailbox_router: bool = True
+    mailbox_router_poll_seconds: float = 2.0
+    # The active mailbox file is sealed into .cmux/mailbox.d/ past this size
+    # or age (0 disables the age limit); the router deletes sealed segments
+    # it has read past every compact interval
+    mailbox_compact_seconds: float = 60.0
+    mailbox_segment_max_bytes: int = 4 * 1024 * 1024
+    mailbox_segment_max_age_hours: float = 24
+    # Message bodies shorter than this (in characters) go inline in the
+    # mailbox record, as tools/mailbox does; longer ones are written to
+    # .cmux/journal/<date>/attachments/ and the record holds the path
+    mailbox_inline_body_max: int = 500
+
+    # Messages for agents that aren't at a prompt wait in a per-agent queue
+    # (services/delivery_queue.py), dispatched when the agent's Stop hook
+    # arrives; panes are also checked every poll interval in case it doesn't
+    delivery_poll_seconds: float = 2.0
+
+    # conversations.db write-behind: flush buffered events/thoughts/messages
+    # every N milliseconds, or as soon as M rows are pending
+    db_flush_interval_ms: int = 50
+    db_flush_max_rows: int = 500
+
+    # Thread pool that runs all blocking SQLite work off the event loop
+    db_executor_workers: int = 4
+    # Database calls slower than this are logged and counted as slow
+    db_slow_query_ms: float = 100.0
+    # Message totals are cached and recounted at most this often
+    db_count_cache_seconds: float = 60.0
+
+    # conversations.db retention, enforced by the background maintenance task.
+    # Rows older than *_days or beyond the newest *_max_rows are pruned;
+    # 0 disables that limit. Everything is kept unless a limit is set.
+    retention_events_days: float = 0
+    retention_events_max_rows: int = 0
+    retention_thoughts_days: float = 0
+    retention_thoughts_max_rows: int = 0
+    retention_messages_days: float = 0
+    retention_messages_max_rows: int = 0
+    retention_ws_events_days: float = 0
+    retention_ws_events_max_rows: int = 0
+    retention_heartbeats_days: float = 0
+    # Heartbeats older than this are thinned to one per hour (0 = never)
+    heartbeat_downsample_after_hours: float = 0
+
+    # Maintenance cadence (the first pass runs one interval after startup),
+    # and rows deleted per transaction while pruning
+    db_maintenance_interval_seconds: float = 3600
+    db_maintenance_batch_rows: int = 1000
+    # Switch conversations.db to incremental auto_vacuum on the next pass.
+    # This needs one full VACUUM, which holds the write lock for as long as
+    # it takes; POST /api/db/maintenance?vacuum=true does it on demand.
+    db_enable_incremental_vacuum: bool = False
+
+    # Per-client WebSocket outbound queue (frames). When a slow client's queue
+    # is full: drop its oldest frame, first collapse superseded state frames
+    # (coalesce), or disconnect it.
+    ws_queue_size: int = 256
+    ws_overflow_policy: Literal["drop_oldest", "coalesce", "disconnect"] = "coalesce"
+    # Offer permessage-deflate during the WebSocket handshake (used when the
+    # server is started through main.py; the uvicorn CLI flag is
+    # --ws-per-message-deflate)
+    ws_per_message_deflate: bool = True
+    # Window for grouping agent_event/agent_thought into event_batch frames
+    # (clients opt in), and a per-agent token bucket applied to those events
+    # for batching clients (events/second and burst; 0 disables)
+    ws_batch_window_ms: int = 50
+    ws_agent_rate_limit: float = 50.0
+    ws_agent_rate_burst: int = 200
+    # Recent sequenced broadcasts kept in memory for reconnecting clients
+    # (?resume_from=<seq>); older gaps are read back from ws_event_log
+    ws_replay_buffer_size: int = 1000
+    # Larger JSON frames (in characters) are not written to ws_event_log;
+    # a resume that needs one resyncs instead
+    ws_event_log_max_frame_size: int = 16384
+
+    # Server worker processes. With more than one, broadcasts and in-memory
+    # caches are shared through the event bus: "unix" (datagram sockets in
+    # .cmux/bus) or "sqlite" (.cmux/event_bus.db, polled every
+    # event_bus_poll_ms). "memory" only works for a single worker.
+    workers: int = 1
+    event_bus: Literal["memory", "unix", "sqlite"] = "memory"
+    event_bus_poll_ms: int = 50
+
     model_config = {
         "env_prefix": "CMUX_",
         "env_file": ".env",
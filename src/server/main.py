@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import fcntl
 import logging
 import os
 from pathlib import Path
@@ -36,27 +37,80 @@ from .routes import (
     prefs,
     budget,
     telegram,
+    db,
+    search,
 )
 from .integrations.telegram import telegram_bot
 from .websocket.manager import ws_manager
+from .services.db import close_all_pools, db_executor
+from .services.conversation_store import conversation_store
+from .services.maintenance import db_maintenance
+from .services.event_bus import event_bus
+from .services.tmux_service import tmux_service
+from .services.agent_manager import agent_manager
+from .services.terminal_stream import terminal_streamer
+from .services.mailbox_router import mailbox_router
+from .services.delivery_queue import delivery_queue
 
 logging.basicConfig(level=getattr(logging, settings.log_level))
 logger = logging.getLogger(__name__)
 
 
+def _acquire_leader_lock():
+    """Return an flock'd file if this worker should run the singleton tasks.
+
+    Telegram polling and database maintenance must run once per server,
+    not once per worker. The lock is released when the process exits.
+    """
+    settings.cmux_dir.mkdir(parents=True, exist_ok=True)
+    lock_file = open(settings.cmux_dir / "server.leader.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting cmux server...")
     ws_manager.start_ping_task()
-    if telegram_bot.is_configured:
-        await telegram_bot.start_polling()
+    await tmux_service.start_control()
+    agent_manager.start()
+    conversation_store.start_write_behind()
+    await event_bus.start()
+    if not event_bus.distributed:
+        # Replay from conversations.db needs one sequence for the whole
+        # server; with several workers, resumes use each worker's memory
+        await ws_manager.attach_event_log(conversation_store)
+    # Routes only once it holds the router lease (one worker, no router.sh cycle)
+    delivery_queue.start()
+    mailbox_router.start()
+    leader_lock = _acquire_leader_lock()
+    if leader_lock:
+        db_maintenance.start()
+        if telegram_bot.is_configured:
+            await telegram_bot.start_polling()
     yield
     # Shutdown
     if telegram_bot.is_running:
         await telegram_bot.stop()
     await ws_manager.stop_ping_task()
     await ws_manager.disconnect_all()
+    await db_maintenance.stop()
+    await event_bus.stop()
+    await mailbox_router.stop()
+    await delivery_queue.stop()
+    await agent_manager.stop()
+    await terminal_streamer.stop()
+    await tmux_service.stop_control()
+    await conversation_store.stop_write_behind()
+    if leader_lock:
+        leader_lock.close()
+    db_executor.shutdown()
+    close_all_pools()
     logger.info("Shutting down cmux server...")
 
 
@@ -92,6 +146,8 @@ app.include_router(heartbeat.router, prefix="/api/heartbeat", tags=["heartbeat"]
 app.include_router(prefs.router, prefix="/api/prefs", tags=["prefs"])
 app.include_router(budget.router, prefix="/api/budget", tags=["budget"])
 app.include_router(telegram.router, prefix="/api/telegram", tags=["telegram"])
+app.include_router(db.router, prefix="/api/db", tags=["db"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
 
 # Static files (frontend) - only mount if directory exists
 frontend_dir = Path("src/frontend/dist")
@@ -102,4 +158,13 @@ if frontend_dir.exists():
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host=settings.host, port=settings.port)
+    if settings.workers > 1 and settings.event_bus == "memory":
+        logger.warning("CMUX_WORKERS > 1 without CMUX_EVENT_BUS; workers will not see each other's events")
+    uvicorn.run(
+        # Multiple workers need an import string rather than the app object
+        "src.server.main:app" if settings.workers > 1 else app,
+        host=settings.host,
+        port=settings.port,
+        workers=settings.workers,
+        ws_per_message_deflate=settings.ws_per_message_deflate,
+    )
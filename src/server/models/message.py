@@ -37,6 +37,10 @@ class MessageList(BaseModel):
     messages: list[Message]
     total: int
     has_more: bool = False
+    # Keyset cursors: pass next_cursor as `before` for older messages,
+    # prev_cursor as `after` for newer ones
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
 
 
 class UserMessage(BaseModel):
@@ -59,8 +63,20 @@ class InboxResponse(BaseModel):
     pinned_task: Optional[Message] = None
     messages: list[Message]
     total: int
+    has_more: bool = False
+    # Keyset cursors: pass next_cursor as `after` for newer messages,
+    # prev_cursor as `before` for older ones
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
 
 
 class StatusUpdateRequest(BaseModel):
     """Request to update a message's task lifecycle status."""
     status: TaskStatus
+
+
+class DeliveryRequest(BaseModel):
+    """Text for the server to type into an agent's pane once it is at a prompt."""
+    session: Optional[str] = None  # defaults to settings.main_session
+    window: str
+    text: str
@@ -1,4 +1,4 @@
 # Routes package
-from . import webhooks, agents, messages, agent_events, journal, filesystem, thoughts, projects, tasks, budget, telegram
+from . import webhooks, agents, messages, agent_events, journal, filesystem, thoughts, projects, tasks, budget, telegram, db, search
 
-__all__ = ["webhooks", "agents", "messages", "agent_events", "journal", "filesystem", "thoughts", "projects", "tasks", "budget", "telegram"]
+__all__ = ["webhooks", "agents", "messages", "agent_events", "journal", "filesystem", "thoughts", "projects", "tasks", "budget", "telegram", "db", "search"]
@@ -1,4 +1,4 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
 from datetime import datetime, timezone
 from typing import Any
 import uuid
@@ -6,8 +6,14 @@ import logging
 
 from ..models.agent_event import AgentEvent, AgentEventResponse, AgentEventType
 from ..models.message import Message, MessageType
-from ..services.conversation_store import conversation_store
+from ..services.conversation_store import (
+    async_conversation_store,
+    decode_cursor,
+    encode_cursor,
+    trim_page,
+)
 from ..services.mailbox import mailbox_service
+from ..services.delivery_queue import delivery_queue
 from ..integrations.telegram import telegram_bot
 from ..websocket.manager import ws_manager
 
@@ -34,6 +40,7 @@ async def receive_agent_event(event: AgentEvent):
 
     Events are persisted to SQLite. On Stop events, all preceding unlinked
     tool calls for the agent are linked to the resulting message via message_id.
+    Both also tell the delivery queue whether the agent is mid-turn or idle.
     """
     event_id = str(uuid.uuid4())[:8]
 
@@ -66,11 +73,18 @@ async def receive_agent_event(event: AgentEvent):
     }
 
     # Persist to SQLite
-    conversation_store.store_event(event_data)
+    await async_conversation_store.store_event(event_data)
 
     # Broadcast agent_event to WebSocket clients
     await ws_manager.broadcast("agent_event", event_data)
 
+    # The agent's window is named after CMUX_AGENT_NAME
+    if event.agent_id and event.agent_id != "unknown":
+        if event.event_type == AgentEventType.STOP:
+            delivery_queue.mark_idle(event.agent_id)
+        else:
+            delivery_queue.mark_busy(event.agent_id)
+
     # For Stop events with response_content, create a message and broadcast it
     if event.event_type == AgentEventType.STOP and event.response_content:
         response_content = event.response_content
@@ -94,11 +108,11 @@ async def receive_agent_event(event: AgentEvent):
         mailbox_service.store_message(msg)
 
         # Link all unlinked tool call events for this agent to this message
-        linked = conversation_store.link_events_to_message(display_agent_id, msg.id)
+        linked = await async_conversation_store.link_events_to_message(display_agent_id, msg.id)
         logger.debug(f"Linked {linked} tool call events to message {msg.id}")
 
         # Broadcast to frontend so it appears in the chat
-        await ws_manager.broadcast("new_message", msg.model_dump(mode="json"))
+        await ws_manager.broadcast("new_message", msg)
 
         # Forward to Telegram if configured (skip system messages — too noisy)
         if telegram_bot.is_configured and msg_type != MessageType.SYSTEM:
@@ -116,27 +130,45 @@ async def list_agent_events(
     session_id: str | None = None,
     agent_id: str | None = None,
     limit: int = 50,
+    before: str | None = Query(default=None, description="Cursor: return events older than this"),
+    after: str | None = Query(default=None, description="Cursor: return events newer than this"),
 ):
     """
-    List recent agent events from SQLite.
+    List recent agent events from SQLite, newest first.
 
     Args:
         session_id: Filter by session ID (optional)
         agent_id: Filter by agent ID (optional)
         limit: Maximum number of events to return
+        before: Cursor from a previous page's next_cursor (older events)
+        after: Cursor from a previous page's prev_cursor (newer events)
     """
-    events = conversation_store.get_events(
+    try:
+        before_key, after_key = decode_cursor(before), decode_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    events = await async_conversation_store.get_events(
         session_id=session_id,
         agent_id=agent_id,
-        limit=limit,
+        limit=limit + 1,
+        before=before_key,
+        after=after_key,
     )
-    return {"events": events, "total": len(events)}
+    events, has_more = trim_page(events, limit, from_front=bool(after_key and not before_key))
+    return {
+        "events": events,
+        "total": len(events),
+        "has_more": has_more,
+        "next_cursor": encode_cursor(events[-1]["timestamp"], events[-1]["id"]) if events else None,
+        "prev_cursor": encode_cursor(events[0]["timestamp"], events[0]["id"]) if events else None,
+    }
 
 
 @router.get("/by-message/{message_id}")
 async def get_events_by_message(message_id: str):
     """Get all agent events (tool calls) linked to a specific message."""
-    events = conversation_store.get_events_by_message(message_id)
+    events = await async_conversation_store.get_events_by_message(message_id)
     return {"events": events, "total": len(events)}
 
 
@@ -150,14 +182,14 @@ async def get_events_by_messages(payload: dict):
     message_ids = payload.get("message_ids", [])
     result: dict[str, list] = {}
     for mid in message_ids:
-        result[mid] = conversation_store.get_events_by_message(mid)
+        result[mid] = await async_conversation_store.get_events_by_message(mid)
     return {"events_by_message": result}
 
 
 @router.get("/sessions")
 async def list_sessions():
     """List all sessions that have sent events."""
-    sessions = conversation_store.get_event_sessions()
+    sessions = await async_conversation_store.get_event_sessions()
     return {"sessions": sessions}
 
 
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Body
+from fastapi.responses import StreamingResponse
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Optional
 import asyncio
 import json
 import logging
@@ -11,14 +12,18 @@ from ..models.agent import Agent, AgentList, AgentMessage
 from ..models.message import Message, MessageType
 from ..services.agent_manager import agent_manager
 from ..services.tmux_service import tmux_service
+from ..services.terminal_stream import terminal_streamer
 from ..services.mailbox import mailbox_service
 from ..services.agent_registry import agent_registry
 from ..services.conversation_store import (
-    conversation_store,
+    async_conversation_store,
     ArchivedAgent,
     ArchivedAgentSummary,
+    ArchiveIncompleteError,
 )
 from ..websocket.manager import ws_manager
+from ..websocket.encoding import negotiate_format
+from ..websocket.subscriptions import DIMENSIONS as SUBSCRIPTION_DIMENSIONS
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +33,9 @@ MENTION_PATTERN = re.compile(r"@([\w-]+)")
 # Timeout for WebSocket receive operations (seconds)
 WS_RECEIVE_TIMEOUT = 60
 
+# Archive chunks decompressed per database round trip when streaming
+ARCHIVE_STREAM_BATCH = 16
+
 router = APIRouter()
 
 
@@ -43,18 +51,68 @@ async def list_agents():
 @router.get("/archived", response_model=List[ArchivedAgentSummary])
 async def list_archived_agents():
     """List all archived agents."""
-    return conversation_store.get_archived_agents()
+    return await async_conversation_store.get_archived_agents()
 
 
 @router.get("/archived/{archive_id}", response_model=ArchivedAgent)
 async def get_archived_agent(archive_id: str):
     """Get a specific archived agent with terminal output."""
-    archive = conversation_store.get_archive(archive_id)
+    try:
+        archive = await async_conversation_store.get_archive(archive_id)
+    except ArchiveIncompleteError as e:
+        raise HTTPException(status_code=409, detail=f"Archive incomplete: {e}")
     if not archive:
         raise HTTPException(status_code=404, detail="Archive not found")
     return archive
 
 
+@router.get("/archived/{archive_id}/terminal")
+async def download_archived_terminal(archive_id: str):
+    """Stream an archive's terminal output as a plain-text download.
+
+    Chunks are read and decompressed a batch at a time, so large archives
+    never have to be held in memory whole.
+    """
+    try:
+        manifest = await async_conversation_store.get_archive_manifest(archive_id)
+    except ArchiveIncompleteError as e:
+        raise HTTPException(status_code=409, detail=f"Archive incomplete: {e}")
+    if not manifest:
+        raise HTTPException(status_code=404, detail="Archive not found")
+    summary, hashes = manifest
+
+    async def stream():
+        for start in range(0, len(hashes), ARCHIVE_STREAM_BATCH):
+            chunks = await async_conversation_store.read_archive_chunks(
+                hashes[start:start + ARCHIVE_STREAM_BATCH]
+            )
+            for chunk in chunks:
+                yield chunk.encode()
+
+    filename = f"{summary.agent_name}-{summary.archived_at:%Y%m%dT%H%M%S}.log"
+    return StreamingResponse(
+        stream(),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/ws/stats")
+async def get_websocket_stats():
+    """Per-client WebSocket queue depth, drops and send lag."""
+    return ws_manager.stats()
+
+
+@router.get("/tmux/stats")
+async def get_tmux_stats():
+    """Whether tmux commands go over the control-mode connection, and how many forked instead."""
+    return {
+        **tmux_service.control_stats(),
+        "topology": agent_manager.topology_stats(),
+        "terminal": terminal_streamer.stats(),
+    }
+
+
 @router.get("/by-project/{project_id}")
 async def list_agents_by_project(project_id: str):
     """List agents belonging to a specific project.
@@ -110,7 +168,7 @@ async def send_message_to_agent(agent_id: str, message: AgentMessage):
         "content": message.content[:100]
     })
     # Also broadcast the full message for chat UI
-    await ws_manager.broadcast("new_message", msg.model_dump(mode="json"))
+    await ws_manager.broadcast("new_message", msg)
 
     # Route @mentions to mentioned agents (works from any agent context)
     mentioned_names = MENTION_PATTERN.findall(message.content)
@@ -137,7 +195,7 @@ async def send_message_to_agent(agent_id: str, message: AgentMessage):
                 metadata={"mention_routed": True, "original_target": agent_id},
             )
             mailbox_service.store_message(mention_msg)
-            await ws_manager.broadcast("new_message", mention_msg.model_dump(mode="json"))
+            await ws_manager.broadcast("new_message", mention_msg)
             routed_to.append(name)
             logger.info(f"@mention routed message to {name}")
 
@@ -177,6 +235,54 @@ async def get_agent_terminal(agent_id: str, lines: int = 50):
     return {"agent_id": agent_id, "output": output, "lines": lines}
 
 
+@router.websocket("/{agent_id}/terminal/stream")
+async def stream_agent_terminal(websocket: WebSocket, agent_id: str):
+    """Live terminal output of an agent's pane, ANSI escapes included.
+
+    The first frame is a JSON header ({"event": "terminal_stream", ...});
+    every following frame is binary pane output, starting with recent
+    scrollback. All viewers of a pane share one tmux subscription (see
+    services/terminal_stream.py). The socket is closed when the pane goes
+    away.
+    """
+    agent = await agent_manager.get_agent(agent_id)
+    viewer = await terminal_streamer.attach(agent.session, agent.tmux_window) if agent else None
+    if viewer is None:
+        await websocket.close(code=4404, reason="Agent not found")
+        return
+    try:
+        await websocket.accept()
+        await websocket.send_json({
+            "event": "terminal_stream",
+            "data": {"agent_id": agent_id, "pane": viewer.stream.pane, "source": viewer.stream.source},
+        })
+        # Incoming frames are only read to notice the client leaving
+        receiver = asyncio.create_task(_drain_until_disconnect(websocket))
+        try:
+            while True:
+                read = asyncio.ensure_future(viewer.read())
+                await asyncio.wait({read, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if not read.done():
+                    read.cancel()
+                    break
+                data = read.result()
+                if not data:
+                    await websocket.close()
+                    break
+                await websocket.send_bytes(data)
+        finally:
+            receiver.cancel()
+    except (WebSocketDisconnect, RuntimeError):
+        logger.debug(f"Terminal stream for {agent_id} closed")
+    finally:
+        await terminal_streamer.detach(viewer)
+
+
+async def _drain_until_disconnect(websocket: WebSocket):
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
 @router.get("/{agent_id}/history")
 async def get_agent_history(agent_id: str, limit: int = 50):
     """Get conversation history for an agent from the conversation store.
@@ -184,7 +290,7 @@ async def get_agent_history(agent_id: str, limit: int = 50):
     Returns the last N messages involving this agent (both sent and received).
     Useful for agents recovering context after compaction.
     """
-    messages = conversation_store.get_messages(limit=limit, agent_id=agent_id)
+    messages = await async_conversation_store.get_messages(limit=limit, agent_id=agent_id)
     return {
         "agent_id": agent_id,
         "messages": [msg.model_dump(mode="json") for msg in messages],
@@ -207,7 +313,7 @@ async def archive_agent(agent_id: str, lines: int = 2000):
     terminal_output = await tmux_service.capture_pane(agent.tmux_window, lines)
 
     # Archive the agent
-    archive_id = conversation_store.archive_agent(
+    archive_id = await async_conversation_store.archive_agent(
         agent_id=agent_id,
         agent_name=agent.name,
         agent_type=agent.type,
@@ -231,11 +337,58 @@ async def archive_agent(agent_id: str, lines: int = 2000):
     }
 
 
+def _agent_project(agent: str) -> Optional[str]:
+    """Project of an agent by window name or agent_id (for project subscriptions)."""
+    entry = agent_registry.get_agent_metadata(agent)
+    if entry is None:
+        found = agent_registry.find_by_agent_id(agent)
+        entry = found[1] if found else None
+    return entry.get("project_id") if entry else None
+
+
+async def _broadcast_topology(change: dict):
+    await ws_manager.broadcast("topology_changed", change)
+
+
+ws_manager.project_resolver = _agent_project
+agent_manager.add_topology_listener(_broadcast_topology)
+
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time updates."""
+    """WebSocket endpoint for real-time updates.
+
+    Clients receive every event until they narrow the feed with
+    subscribe/unsubscribe frames (see websocket/subscriptions.py). An
+    initial filter can also be given as comma-separated query params,
+    e.g. /api/agents/ws?events=agent_event,agent_thought&agents=worker-1.
+    `?batch=1` opts into event_batch frames, and `?format=msgpack` switches
+    the feed to binary frames when msgpack is installed (see
+    websocket/batching.py and websocket/encoding.py).
+
+    Every broadcast carries a `seq`. A reconnecting client passes the last
+    one it saw as `?resume_from=<seq>` (plus `&stream=` from the previous
+    resume reply when running several workers) to have the missed frames
+    replayed, followed by a "resumed" frame, or gets "resync_required" if
+    they are no longer available.
+    """
     client_id = str(uuid.uuid4())
-    await ws_manager.connect(websocket, client_id)
+    initial = {
+        dim: websocket.query_params[dim].split(",")
+        for dim in SUBSCRIPTION_DIMENSIONS
+        if websocket.query_params.get(dim)
+    }
+    if websocket.query_params.get("batch") in ("1", "true"):
+        initial["batch"] = True
+    resume_from = websocket.query_params.get("resume_from")
+    await ws_manager.connect(
+        websocket,
+        client_id,
+        subscribe=initial,
+        encoding=negotiate_format(websocket.query_params.get("format")),
+        resume_from=int(resume_from) if resume_from and resume_from.isdigit() else None,
+        stream=websocket.query_params.get("stream"),
+    )
     try:
         while True:
             try:
@@ -250,8 +403,12 @@ async def websocket_endpoint(websocket: WebSocket):
                         msg = json.loads(data)
                         if msg.get("event") == "pong":
                             logger.debug(f"Received pong from {client_id}")
+                        elif msg.get("event") in ("subscribe", "unsubscribe"):
+                            await ws_manager.update_subscription(
+                                client_id, msg["event"], msg.get("data") or {}
+                            )
                     except (json.JSONDecodeError, TypeError):
-                        # Not JSON or not a pong, ignore
+                        # Not JSON or not a recognised control frame, ignore
                         pass
             except asyncio.TimeoutError:
                 # Timeout is expected - just continue the loop
@@ -1,28 +1,41 @@
+from datetime import datetime
+from typing import Literal, Optional
+
 from fastapi import APIRouter, Query
 
-from ..services.conversation_store import conversation_store
+from ..services.conversation_store import async_conversation_store
 
 router = APIRouter()
 
+Bucket = Literal["hour", "day"]
+
 
 @router.get("")
-async def get_budget_summary():
+async def get_budget_summary(
+    since: Optional[datetime] = Query(None, description="Only count usage at or after this time (rounded down to the hour)"),
+    until: Optional[datetime] = Query(None, description="Only count usage before this time"),
+    bucket: Optional[Bucket] = Query(None, description="Also return a time series at this granularity"),
+):
     """Get per-agent token usage totals.
 
     Returns aggregated input/output/cache token counts for each agent
-    that has usage data in their events.
+    that has usage data in their events, read from the hourly rollups.
     """
-    agents = conversation_store.get_budget_summary()
-    return {"agents": agents}
+    return await async_conversation_store.get_budget_summary(since=since, until=until, bucket=bucket)
 
 
 @router.get("/{agent_id}")
 async def get_agent_budget(
     agent_id: str,
     limit: int = Query(default=50, le=200),
+    since: Optional[datetime] = Query(None, description="Only count usage at or after this time (rounded down to the hour)"),
+    until: Optional[datetime] = Query(None, description="Only count usage before this time"),
+    bucket: Optional[Bucket] = Query(None, description="Also return a time series at this granularity"),
 ):
     """Get token usage detail for a single agent.
 
     Returns totals and recent events with usage data.
     """
-    return conversation_store.get_agent_budget(agent_id, limit=limit)
+    return await async_conversation_store.get_agent_budget(
+        agent_id, limit=limit, since=since, until=until, bucket=bucket,
+    )
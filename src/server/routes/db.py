@@ -0,0 +1,29 @@
+"""Database observability and maintenance routes."""
+
+from fastapi import APIRouter, Query
+
+from ..services.conversation_store import async_conversation_store, conversation_store
+from ..services.db import db_executor, pool_stats
+from ..services.maintenance import db_maintenance
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def get_db_stats():
+    """Pool, executor timing, write-behind and maintenance stats for the server's SQLite databases."""
+    return {
+        "pools": pool_stats(),
+        "executor": db_executor.stats(),
+        "write_behind": conversation_store.write_behind_stats(),
+        "archives": await async_conversation_store.archive_storage_stats(),
+        "maintenance": db_maintenance.stats(),
+    }
+
+
+@router.post("/maintenance")
+async def run_db_maintenance(
+    vacuum: bool = Query(False, description="Enable incremental auto_vacuum first (one full VACUUM if not yet enabled)"),
+):
+    """Run a retention/vacuum pass now and return what it deleted and reclaimed."""
+    return await db_maintenance.run_once(vacuum=vacuum)
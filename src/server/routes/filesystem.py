@@ -143,6 +143,30 @@ async def get_file_content(
     return FileContentResponse(content=content, path=str(path))
 
 
+@router.get("/body", response_model=FileContentResponse)
+async def get_message_body(
+    ref: str = Query(..., description="A mailbox record's body field: inline text or an attachment path")
+) -> FileContentResponse:
+    """Resolve a mailbox message body, whether inlined in the record or written to a file.
+
+    The field is an attachment file when it is an absolute path, or a
+    path relative to the project naming a file in .cmux (records written
+    before attachment paths were absolute). Anything else is the body.
+    """
+    cmux_dir = get_cmux_dir()
+    if ref.startswith("/"):
+        try:
+            path = Path(ref).resolve().relative_to(cmux_dir.resolve().parent)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid path: must be within .cmux directory")
+        return await get_file_content(str(path))
+
+    candidate = cmux_dir.parent / ref
+    if "\n" not in ref and candidate.is_file() and candidate.resolve().is_relative_to(cmux_dir.resolve()):
+        return await get_file_content(ref)
+    return FileContentResponse(content=ref, path="")
+
+
 @router.get("/raw")
 async def get_file_raw(
     path: str = Query(..., description="Relative path to file within .cmux directory")
@@ -1,6 +1,5 @@
 import json
 import sqlite3
-from contextlib import contextmanager
 
 from fastapi import APIRouter, Query
 from pydantic import BaseModel
@@ -9,6 +8,8 @@ from typing import Dict, List, Optional
 import logging
 
 from ..config import settings
+from ..services.db import db_executor, get_pool
+from ..services.event_bus import event_bus
 from ..websocket.manager import ws_manager
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,9 @@ router = APIRouter()
 
 DB_PATH = settings.cmux_dir / "conversations.db"
 
+# Shared with ConversationStore (same file, same pool)
+_pool = get_pool(DB_PATH)
+
 
 class HeartbeatData(BaseModel):
     timestamp: float
@@ -42,42 +46,51 @@ class HeartbeatHistoryResponse(BaseModel):
 _latest_heartbeat: Optional[HeartbeatResponse] = None
 
 
+def _on_remote_heartbeat(payload: dict):
+    """Another server worker received a heartbeat; keep our cache current."""
+    global _latest_heartbeat
+    _latest_heartbeat = HeartbeatResponse(**payload)
+
+
+def _on_bus_resync():
+    """A heartbeat from another worker may have been lost; reload on next read."""
+    global _latest_heartbeat
+    _latest_heartbeat = None
+
+
+event_bus.subscribe("heartbeat.latest", _on_remote_heartbeat)
+event_bus.on_resync(_on_bus_resync)
+
+
 # --- Database ---
 
 
 def _init_db():
     """Create heartbeat_history table if it doesn't exist."""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute(
-        """CREATE TABLE IF NOT EXISTS heartbeat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp REAL NOT NULL,
-            sections TEXT NOT NULL,
-            highest_priority TEXT,
-            all_clear BOOLEAN NOT NULL DEFAULT 0,
-            received_at TEXT NOT NULL
-        )"""
-    )
-    conn.commit()
-    conn.close()
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with _get_connection() as conn:
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS heartbeat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp REAL NOT NULL,
+                sections TEXT NOT NULL,
+                highest_priority TEXT,
+                all_clear BOOLEAN NOT NULL DEFAULT 0,
+                received_at TEXT NOT NULL
+            )"""
+        )
+        # Retention and downsampling (services.maintenance) range-scan by time
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_heartbeat_history_timestamp ON heartbeat_history(timestamp)"
+        )
 
 
-_init_db()
+def _get_connection():
+    """Check out this thread's pooled connection (WAL, busy_timeout applied once)."""
+    return _pool.connection()
 
 
-@contextmanager
-def _get_connection():
-    """Get a database connection with WAL mode and proper cleanup."""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA busy_timeout=5000")
-    try:
-        yield conn
-        conn.commit()
-    finally:
-        conn.close()
+_init_db()
 
 
 def _store_heartbeat(hb: HeartbeatResponse):
@@ -96,6 +109,26 @@ def _store_heartbeat(hb: HeartbeatResponse):
         )
 
 
+def _get_history(limit: int) -> tuple[List[HeartbeatResponse], int]:
+    """Most recent heartbeats (newest first) plus the total row count."""
+    with _get_connection() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM heartbeat_history").fetchone()[0]
+        cursor = conn.execute(
+            "SELECT * FROM heartbeat_history ORDER BY id DESC LIMIT ?",
+            (limit,),
+        )
+        return [_row_to_heartbeat(row) for row in cursor.fetchall()], total
+
+
+def _get_latest() -> Optional[HeartbeatResponse]:
+    """Latest persisted heartbeat, if any."""
+    with _get_connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM heartbeat_history ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        return _row_to_heartbeat(row) if row else None
+
+
 def _row_to_heartbeat(row: sqlite3.Row) -> HeartbeatResponse:
     """Convert a database row to a HeartbeatResponse."""
     sections_raw = row["sections"]
@@ -129,9 +162,10 @@ async def post_heartbeat(data: HeartbeatData):
         received_at=datetime.now(timezone.utc).isoformat(),
     )
 
-    _store_heartbeat(_latest_heartbeat)
+    await db_executor.run(_store_heartbeat, _latest_heartbeat)
+    event_bus.publish("heartbeat.latest", _latest_heartbeat.model_dump())
 
-    await ws_manager.broadcast("heartbeat_update", _latest_heartbeat.model_dump())
+    await ws_manager.broadcast("heartbeat_update", _latest_heartbeat)
 
     return {"success": True}
 
@@ -141,15 +175,7 @@ async def get_heartbeat_history(
     limit: int = Query(50, ge=1, le=500, description="Number of recent heartbeats to return"),
 ):
     """Return recent heartbeat history from the database."""
-    with _get_connection() as conn:
-        total = conn.execute("SELECT COUNT(*) FROM heartbeat_history").fetchone()[0]
-        cursor = conn.execute(
-            "SELECT * FROM heartbeat_history ORDER BY id DESC LIMIT ?",
-            (limit,),
-        )
-        rows = cursor.fetchall()
-        heartbeats = [_row_to_heartbeat(row) for row in rows]
-
+    heartbeats, total = await db_executor.run(_get_history, limit)
     return HeartbeatHistoryResponse(heartbeats=heartbeats, total=total)
 
 
@@ -162,12 +188,7 @@ async def get_heartbeat():
     """
     global _latest_heartbeat
     if _latest_heartbeat is None:
-        with _get_connection() as conn:
-            row = conn.execute(
-                "SELECT * FROM heartbeat_history ORDER BY id DESC LIMIT 1"
-            ).fetchone()
-            if row:
-                _latest_heartbeat = _row_to_heartbeat(row)
+        _latest_heartbeat = await db_executor.run(_get_latest)
     if _latest_heartbeat is None:
         return {"status": "no_data", "message": "No heartbeat received yet"}
     return _latest_heartbeat.model_dump()
@@ -3,9 +3,19 @@ from datetime import datetime, timezone
 from typing import Optional
 import uuid
 
-from ..models.message import Message, MessageList, UserMessage, InternalMessage, InboxResponse, MessageType, TaskStatus, StatusUpdateRequest
+from ..models.message import Message, MessageList, UserMessage, InternalMessage, InboxResponse, MessageType, TaskStatus, StatusUpdateRequest, DeliveryRequest
+from ..config import settings
 from ..services.mailbox import mailbox_service
-from ..services.conversation_store import conversation_store
+from ..services.mailbox_router import mailbox_router
+from ..services.delivery_queue import delivery_queue
+from ..services.conversation_store import (
+    Cursor,
+    async_conversation_store,
+    decode_cursor,
+    encode_cursor,
+    trim_page,
+)
+from ..services.db import db_executor
 from ..integrations.telegram import telegram_bot
 
 from ..websocket.manager import ws_manager
@@ -13,21 +23,47 @@ from ..websocket.manager import ws_manager
 router = APIRouter()
 
 
+def _parse_cursors(before: Optional[str], after: Optional[str]) -> tuple[Optional[Cursor], Optional[Cursor]]:
+    try:
+        return decode_cursor(before), decode_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _message_cursor(msg: Message) -> str:
+    return encode_cursor(msg.timestamp, msg.id)
+
+
 @router.get("", response_model=MessageList)
 async def get_messages(
     limit: int = Query(default=50, le=200),
     offset: int = Query(default=0, ge=0),
-    agent_id: Optional[str] = None
+    agent_id: Optional[str] = None,
+    before: Optional[str] = Query(default=None, description="Cursor: return messages older than this"),
+    after: Optional[str] = Query(default=None, description="Cursor: return messages newer than this"),
 ):
-    """Get message history with optional filtering and pagination."""
-    total = conversation_store.count_messages(agent_id=agent_id)
-    messages = conversation_store.get_messages(
-        limit=limit,
+    """Get message history (newest first) with optional filtering and pagination.
+
+    Prefer the before/after cursors over offset for deep pages. `total` is
+    an approximate, cached count.
+    """
+    before_key, after_key = _parse_cursors(before, after)
+    total = await async_conversation_store.count_messages(agent_id=agent_id)
+    messages = await async_conversation_store.get_messages(
+        limit=limit + 1,
         offset=offset,
-        agent_id=agent_id
+        agent_id=agent_id,
+        before=before_key,
+        after=after_key,
+    )
+    messages, has_more = trim_page(messages, limit, from_front=bool(after_key and not before_key))
+    return MessageList(
+        messages=messages,
+        total=total,
+        has_more=has_more,
+        next_cursor=_message_cursor(messages[-1]) if messages else None,
+        prev_cursor=_message_cursor(messages[0]) if messages else None,
     )
-    has_more = (offset + len(messages)) < total
-    return MessageList(messages=messages, total=total, has_more=has_more)
 
 
 @router.get("/tasks", response_model=MessageList)
@@ -35,10 +71,44 @@ async def get_tasks(
     status: Optional[TaskStatus] = Query(default=None, description="Filter by task status"),
     limit: int = Query(default=50, le=200),
     offset: int = Query(default=0, ge=0),
+    before: Optional[str] = Query(default=None, description="Cursor: return tasks older than this"),
 ):
     """Get all messages with task lifecycle status, optionally filtered by status."""
-    messages = conversation_store.get_tasks(status=status, limit=limit, offset=offset)
-    return MessageList(messages=messages, total=len(messages))
+    before_key, _ = _parse_cursors(before, None)
+    messages = await async_conversation_store.get_tasks(
+        status=status, limit=limit + 1, offset=offset, before=before_key,
+    )
+    messages, has_more = trim_page(messages, limit, from_front=False)
+    return MessageList(
+        messages=messages,
+        total=len(messages),
+        has_more=has_more,
+        next_cursor=_message_cursor(messages[-1]) if messages else None,
+    )
+
+
+@router.get("/router/stats")
+async def get_router_stats():
+    """Whether this server is routing the mailbox, its position and delivery counts."""
+    return mailbox_router.stats()
+
+
+@router.get("/delivery")
+async def get_delivery_queues():
+    """Per-agent delivery queues: depth, wait times and readiness hints."""
+    return delivery_queue.stats()
+
+
+@router.post("/delivery")
+async def deliver_to_agent(request: DeliveryRequest):
+    """Type text into an agent's pane now if it is at a prompt, else queue it.
+
+    Used by tmux_safe_send --queue so scripts hand busy panes to the server
+    instead of polling them.
+    """
+    session = request.session or settings.main_session
+    delivered = await delivery_queue.deliver(session, request.window, request.text)
+    return {"delivered": delivered, "queued": not delivered}
 
 
 @router.get("/inbox/{agent_id}", response_model=InboxResponse)
@@ -46,6 +116,8 @@ async def get_inbox(
     agent_id: str,
     limit: int = Query(default=200, le=500),
     offset: int = Query(default=0, ge=0),
+    before: Optional[str] = Query(default=None, description="Cursor: return messages older than this"),
+    after: Optional[str] = Query(default=None, description="Cursor: return messages newer than this"),
 ):
     """Get inbox for an agent: pinned task assignment and all messages.
 
@@ -53,18 +125,29 @@ async def get_inbox(
     plus all messages where the agent is sender or recipient, ordered
     timestamp ASC (oldest first).
     """
-    pinned_task, messages, total = conversation_store.get_inbox(
+    before_key, after_key = _parse_cursors(before, after)
+    pinned_task, messages, total = await async_conversation_store.get_inbox(
         agent_id=agent_id,
-        limit=limit,
+        limit=limit + 1,
         offset=offset,
+        before=before_key,
+        after=after_key,
+    )
+    messages, has_more = trim_page(messages, limit, from_front=bool(before_key and not after_key))
+    return InboxResponse(
+        pinned_task=pinned_task,
+        messages=messages,
+        total=total,
+        has_more=has_more,
+        next_cursor=_message_cursor(messages[-1]) if messages else None,
+        prev_cursor=_message_cursor(messages[0]) if messages else None,
     )
-    return InboxResponse(pinned_task=pinned_task, messages=messages, total=total)
 
 
 @router.patch("/{message_id}/status")
 async def update_message_status(message_id: str, body: StatusUpdateRequest):
     """Update a message's task lifecycle status."""
-    updated = mailbox_service.update_message_status(message_id, body.status)
+    updated = await db_executor.run(mailbox_service.update_message_status, message_id, body.status)
     if not updated:
         raise HTTPException(status_code=404, detail="Message not found")
     # Broadcast status change to frontend
@@ -100,7 +183,7 @@ async def send_to_user(message: UserMessage):
         content=message.content
     )
 
-    await ws_manager.broadcast("user_message", msg.model_dump(mode="json"))
+    await ws_manager.broadcast("user_message", msg)
 
     # Forward to Telegram if configured
     if telegram_bot.is_configured:
@@ -114,7 +197,8 @@ async def send_to_user(message: UserMessage):
 async def store_internal_message(data: InternalMessage):
     """Store agent-to-agent message from router daemon.
 
-    Called by router.sh when routing messages between agents.
+    Called by router.sh when it is routing instead of the server's
+    MailboxRouter (which stores messages directly).
     Stores message in SQLite and broadcasts to frontend via WebSocket.
     """
     msg = Message(
@@ -132,6 +216,10 @@ async def store_internal_message(data: InternalMessage):
     mailbox_service.store_message(msg)
 
     # Broadcast to frontend
-    await ws_manager.broadcast("new_message", msg.model_dump(mode="json"))
+    await ws_manager.broadcast("new_message", msg)
 
     return {"status": "stored", "id": msg.id}
+
+
+# Messages routed in-process reach the dashboard like /internal ones
+mailbox_router.add_listener(ws_manager.broadcast)
@@ -0,0 +1,77 @@
+"""Full-text search over conversation history (messages, thoughts, archives)."""
+
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+from ..services.conversation_store import (
+    SEARCH_SOURCES,
+    async_conversation_store,
+    to_fts_query,
+    trim_page,
+)
+
+router = APIRouter()
+
+Source = Literal["messages", "thoughts", "archives"]
+
+
+class SearchResult(BaseModel):
+    source: str
+    id: str
+    agent_id: str
+    to_agent: Optional[str] = None
+    kind: str
+    timestamp: str
+    snippet: str
+    score: float
+
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+    has_more: bool
+    next_offset: Optional[int] = None
+
+
+@router.get("", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, description="Words to find (all must match; trailing * for prefix)"),
+    source: Optional[List[Source]] = Query(None, description="Limit to these sources (repeatable)"),
+    agent_id: Optional[str] = Query(None, description="Only results involving this agent"),
+    since: Optional[datetime] = Query(None, description="Only results at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only results before this time"),
+    order: Literal["rank", "recent"] = Query("rank", description="Sort by relevance or newest first"),
+    raw: bool = Query(False, description="Treat q as FTS5 query syntax (AND/OR/NEAR, column filters)"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Search messages, thoughts and archived terminal output.
+
+    Results carry a highlighted snippet and a bm25 relevance score (higher
+    is better). Page with `offset`/`next_offset`.
+    """
+    fts_query = q if raw else to_fts_query(q)
+    try:
+        results = await async_conversation_store.search(
+            fts_query,
+            sources=source or SEARCH_SOURCES,
+            agent_id=agent_id,
+            since=since,
+            until=until,
+            order=order,
+            limit=limit + 1,
+            offset=offset,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    results, has_more = trim_page(results, limit, from_front=False)
+    return SearchResponse(
+        query=q,
+        results=results,
+        has_more=has_more,
+        next_offset=offset + limit if has_more else None,
+    )
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException
 
 from ..models.session import Session, SessionCreate, SessionList, SessionMessage
 from ..services.session_manager import session_manager
+from ..services.tmux_service import tmux_service
 from ..websocket.manager import ws_manager
 from ..config import settings
 
@@ -32,7 +33,7 @@ async def create_session(data: SessionCreate):
         # Broadcast session creation event
         await ws_manager.broadcast(
             "session_created",
-            {"session": session.model_dump(mode="json")}
+            {"session": session}
         )
 
         return session
@@ -129,9 +130,11 @@ async def send_message_to_session(session_id: str, data: SessionMessage):
 @router.get("/{session_id}/agents")
 async def list_session_agents(session_id: str):
     """List all agents in a session."""
-    session = await session_manager.get_session(session_id)
+    # One tmux call serves both the session check and the window listing
+    snapshot = await tmux_service.snapshot()
+    session = await session_manager.get_session(session_id, snapshot)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    agents = await session_manager.list_session_agents(session_id)
+    agents = await session_manager.list_session_agents(session_id, snapshot)
     return {"session_id": session_id, "agents": agents, "total": len(agents)}
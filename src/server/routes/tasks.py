@@ -12,6 +12,7 @@ from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 
 from ..config import settings
+from ..services.db import add_column, db_executor, get_pool
 
 router = APIRouter()
 
@@ -84,20 +85,47 @@ class TaskStatsResponse(BaseModel):
 # --- Database ---
 
 
+# Second-resolution ISO timestamps (both writers use %Y-%m-%dT%H:%M:%SZ) as epoch microseconds
+_EPOCH_US_SQL = "CAST(strftime('%s', {}) AS INTEGER) * 1000000"
+
+
+def _migrate_epoch_timestamps(conn: sqlite3.Connection):
+    """Integer created_at_us/updated_at_us columns for ordering.
+
+    The tools/tasks CLI writes this database too, so triggers (not the API)
+    keep the columns in sync with the TEXT timestamps.
+    """
+    for column in ("created_at", "updated_at"):
+        add_column(conn, "tasks", f"{column}_us", "INTEGER")
+        conn.execute(f"UPDATE tasks SET {column}_us = {_EPOCH_US_SQL.format(column)}")
+        for event in ("INSERT", f"UPDATE OF {column}"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS tasks_{column}_us_{event.split()[0].lower()}
+                AFTER {event} ON tasks
+                BEGIN
+                    UPDATE tasks SET {column}_us = {_EPOCH_US_SQL.format(f"NEW.{column}")}
+                    WHERE rowid = NEW.rowid;
+                END
+            """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created_at_us ON tasks(created_at_us)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_parent_created_at_us ON tasks(parent_id, created_at_us)")
+
+
+# Append only (see services.db.migrate); the base schema is owned by tools/tasks
+_MIGRATIONS = [
+    _migrate_epoch_timestamps,
+]
+
+
 @contextmanager
 def _get_connection():
-    """Get a database connection with WAL mode and proper cleanup."""
+    """Check out a pooled tasks.db connection; commits on exit."""
     if not DB_PATH.exists():
         raise HTTPException(status_code=404, detail="tasks.db not found — no tasks created yet")
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA busy_timeout=5000")
-    try:
+    pool = get_pool(DB_PATH)
+    pool.migrate(_MIGRATIONS)
+    with pool.connection() as conn:
         yield conn
-        conn.commit()
-    finally:
-        conn.close()
 
 
 def _gen_id() -> str:
@@ -148,6 +176,16 @@ async def list_tasks(
     include_done: bool = Query(False, description="Include done tasks"),
 ):
     """List tasks with optional filters."""
+    return await db_executor.run(_list_tasks, project, status, assigned_to, parent_id, include_done)
+
+
+def _list_tasks(
+    project: Optional[str],
+    status: Optional[str],
+    assigned_to: Optional[str],
+    parent_id: Optional[str],
+    include_done: bool,
+) -> TaskListResponse:
     with _get_connection() as conn:
         conditions: list[str] = []
         params: list = []
@@ -174,7 +212,7 @@ async def list_tasks(
         where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
 
         cursor = conn.execute(
-            f"SELECT * FROM tasks {where} ORDER BY created_at",
+            f"SELECT * FROM tasks {where} ORDER BY created_at_us",
             params,
         )
         rows = cursor.fetchall()
@@ -189,6 +227,10 @@ async def get_task_tree(
     include_done: bool = Query(False, description="Include done tasks"),
 ):
     """Get hierarchical task tree — top-level tasks with nested children."""
+    return await db_executor.run(_get_task_tree, project, include_done)
+
+
+def _get_task_tree(project: Optional[str], include_done: bool) -> TaskTreeResponse:
     with _get_connection() as conn:
         conditions: list[str] = []
         params: list = []
@@ -203,7 +245,7 @@ async def get_task_tree(
         where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
 
         cursor = conn.execute(
-            f"SELECT * FROM tasks {where} ORDER BY created_at",
+            f"SELECT * FROM tasks {where} ORDER BY created_at_us",
             params,
         )
         all_tasks = [_row_to_task(row) for row in cursor.fetchall()]
@@ -236,6 +278,10 @@ async def get_task_tree(
 @router.get("/stats", response_model=TaskStatsResponse)
 async def get_task_stats():
     """Dashboard stats: counts by status, priority, assignee, plus attention items."""
+    return await db_executor.run(_get_task_stats)
+
+
+def _get_task_stats() -> TaskStatsResponse:
     with _get_connection() as conn:
         total = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
 
@@ -279,6 +325,10 @@ async def get_task_stats():
 @router.get("/{task_id}", response_model=TaskResponse)
 async def get_task(task_id: str):
     """Get a single task with its children."""
+    return await db_executor.run(_get_task, task_id)
+
+
+def _get_task(task_id: str) -> TaskResponse:
     with _get_connection() as conn:
         cursor = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
         row = cursor.fetchone()
@@ -289,7 +339,7 @@ async def get_task(task_id: str):
 
         # Fetch children
         children_cursor = conn.execute(
-            "SELECT * FROM tasks WHERE parent_id = ? ORDER BY created_at",
+            "SELECT * FROM tasks WHERE parent_id = ? ORDER BY created_at_us",
             (task_id,),
         )
         task.children = [_row_to_task(r) for r in children_cursor.fetchall()]
@@ -311,6 +361,10 @@ async def create_task(body: TaskCreate):
             detail=f"Invalid source: {body.source}. Valid: {', '.join(sorted(VALID_SOURCES))}",
         )
 
+    return await db_executor.run(_create_task, body)
+
+
+def _create_task(body: TaskCreate) -> TaskResponse:
     with _get_connection() as conn:
         # Validate parent exists if given
         if body.parent_id:
@@ -370,6 +424,10 @@ async def update_task(task_id: str, update: TaskUpdate):
             detail=f"Invalid source: {update.source}. Valid: {', '.join(sorted(VALID_SOURCES))}",
         )
 
+    return await db_executor.run(_update_task, task_id, update)
+
+
+def _update_task(task_id: str, update: TaskUpdate) -> TaskResponse:
     with _get_connection() as conn:
         # Verify task exists
         cursor = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
@@ -422,7 +480,7 @@ async def update_task(task_id: str, update: TaskUpdate):
 
         # Fetch children
         children_cursor = conn.execute(
-            "SELECT * FROM tasks WHERE parent_id = ? ORDER BY created_at",
+            "SELECT * FROM tasks WHERE parent_id = ? ORDER BY created_at_us",
             (task_id,),
         )
         task.children = [_row_to_task(r) for r in children_cursor.fetchall()]
@@ -433,6 +491,10 @@ async def update_task(task_id: str, update: TaskUpdate):
 @router.delete("/{task_id}")
 async def delete_task(task_id: str):
     """Delete a task and all its children recursively."""
+    return await db_executor.run(_delete_task, task_id)
+
+
+def _delete_task(task_id: str) -> dict:
     with _get_connection() as conn:
         cursor = conn.execute("SELECT id FROM tasks WHERE id = ?", (task_id,))
         if not cursor.fetchone():
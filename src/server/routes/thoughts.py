@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from datetime import datetime, timezone
 from typing import Optional
@@ -8,7 +8,13 @@ import time
 import uuid
 
 from ..websocket.manager import ws_manager
-from ..services.conversation_store import conversation_store
+from ..services.event_bus import event_bus
+from ..services.conversation_store import (
+    async_conversation_store,
+    decode_cursor,
+    encode_cursor,
+    trim_page,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +51,14 @@ def _cleanup_expired():
     }
 
 
+def _on_remote_thought(payload: dict):
+    """Another server worker accepted a thought; dedup against it here too."""
+    _recent_thoughts[payload["key"]] = (payload["thought_id"], time.monotonic())
+
+
+event_bus.subscribe("thoughts.dedup", _on_remote_thought)
+
+
 @router.post("")
 async def receive_thought(event: ThoughtEvent):
     """
@@ -69,6 +83,7 @@ async def receive_thought(event: ThoughtEvent):
 
     thought_id = str(uuid.uuid4())[:8]
     _recent_thoughts[key] = (thought_id, now)
+    event_bus.publish("thoughts.dedup", {"key": key, "thought_id": thought_id})
 
     thought_data = {
         "id": thought_id,
@@ -81,7 +96,7 @@ async def receive_thought(event: ThoughtEvent):
         "timestamp": event.timestamp or datetime.now(timezone.utc).isoformat(),
     }
 
-    conversation_store.store_thought(thought_data)
+    await async_conversation_store.store_thought(thought_data)
     await ws_manager.broadcast("agent_thought", thought_data)
 
     return {"success": True, "thought_id": thought_id}
@@ -91,10 +106,26 @@ async def receive_thought(event: ThoughtEvent):
 async def get_thoughts(
     agent_name: Optional[str] = Query(None, description="Filter by agent name"),
     limit: int = Query(50, ge=1, le=500, description="Max number of thoughts to return"),
+    before: Optional[str] = Query(None, description="Cursor: return thoughts older than this"),
+    after: Optional[str] = Query(None, description="Cursor: return thoughts newer than this"),
 ):
-    """Retrieve persisted thoughts, optionally filtered by agent name."""
-    thoughts = conversation_store.get_thoughts(agent_name=agent_name, limit=limit)
-    return {"thoughts": thoughts, "count": len(thoughts)}
+    """Retrieve persisted thoughts (newest first), optionally filtered by agent name."""
+    try:
+        before_key, after_key = decode_cursor(before), decode_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    thoughts = await async_conversation_store.get_thoughts(
+        agent_name=agent_name, limit=limit + 1, before=before_key, after=after_key,
+    )
+    thoughts, has_more = trim_page(thoughts, limit, from_front=bool(after_key and not before_key))
+    return {
+        "thoughts": thoughts,
+        "count": len(thoughts),
+        "has_more": has_more,
+        "next_cursor": encode_cursor(thoughts[-1]["timestamp"], thoughts[-1]["id"]) if thoughts else None,
+        "prev_cursor": encode_cursor(thoughts[0]["timestamp"], thoughts[0]["id"]) if thoughts else None,
+    }
 
 
 def _truncate(text: Optional[str], max_length: int) -> Optional[str]:
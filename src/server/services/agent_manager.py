@@ -1,4 +1,7 @@
-from typing import List, Optional
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
 from datetime import datetime, timezone
 
 from ..config import settings
@@ -6,10 +9,52 @@ from ..models.agent import Agent, AgentType, AgentRole, AgentStatus
 from .tmux_service import tmux_service
 from .agent_registry import agent_registry
 
+logger = logging.getLogger(__name__)
+
+# tmux control-mode notifications that mean windows or sessions changed
+TOPOLOGY_NOTIFICATIONS = {
+    "window-add",
+    # Windows created in sessions other than the attached one (every
+    # cmux-<project> session) only produce the unlinked- form
+    "unlinked-window-add",
+    "window-close",
+    "unlinked-window-close",
+    "window-renamed",
+    "unlinked-window-renamed",
+    "sessions-changed",
+    "session-renamed",
+    "control-attached",
+}
+
+# Notifications arriving within this window trigger one refresh
+TOPOLOGY_DEBOUNCE_SECONDS = 0.1
+
+# Called with {"added": [...], "removed": [...], "total": n}
+TopologyListener = Callable[[dict], Awaitable[None]]
+
 
 class AgentManager:
+    """Agents derived from tmux windows, held as an in-memory topology.
+
+    The topology (window id -> Agent, plus ag_ id and display name
+    indexes) is rebuilt by a tmux sweep only when it may have changed: on
+    control-mode notifications while attached, otherwise on a periodic
+    diff every topology_refresh_seconds. Lookups are dict reads; a miss
+    forces a sweep at most once per topology_miss_refresh_seconds, and
+    never while notifications keep the topology authoritative.
+    """
+
     def __init__(self):
         self._agents: dict[str, Agent] = {}
+        self._by_agent_id: dict[str, str] = {}
+        self._by_display_name: dict[str, str] = {}
+        self._dirty = True
+        self._refreshed_at = 0.0
+        self._refreshes = 0
+        self._inflight: Optional[asyncio.Task] = None
+        self._debounce: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[TopologyListener] = []
 
     def _is_supervisor(self, window: str, session: str) -> bool:
         """Determine if a window is a supervisor based on naming convention."""
@@ -45,25 +90,14 @@ class AgentManager:
             agent.display_name = agent.name
         return agent
 
-    async def list_agents(self, session: Optional[str] = None) -> List[Agent]:
-        """List all active agents based on tmux windows.
-
-        Args:
-            session: If provided, only list agents from this session.
-                     If None, list agents from all cmux sessions.
-        """
-        agents = []
-
-        # Get list of sessions to query
-        if session:
-            sessions = [session]
-        else:
-            sessions = await tmux_service.list_sessions()
-
-        for sess in sessions:
-            windows = await tmux_service.list_windows(sess)
+    # --- Topology ---
 
-            for window in windows:
+    async def _sweep(self) -> dict[str, Agent]:
+        """Build the agent map from a full tmux enumeration."""
+        agents: dict[str, Agent] = {}
+        snapshot = await tmux_service.snapshot()
+        for sess in snapshot.sessions:
+            for window in snapshot.window_names(sess):
                 # Filter out system windows (like "monitor")
                 if window in settings.system_windows:
                     continue
@@ -79,44 +113,191 @@ class AgentManager:
                     session=sess,
                     status=AgentStatus.IDLE
                 )
-                agent = self._enrich_from_registry(agent)
-                agents.append(agent)
-                self._agents[agent_id] = agent
+                agents[agent_id] = self._enrich_from_registry(agent)
+        return agents
 
-        # Clean up stale registry entries
-        all_windows = {a.id for a in agents}
-        agent_registry.cleanup_stale(all_windows)
+    async def refresh_topology(self) -> dict:
+        """Re-sweep tmux, swap in the new topology and report what changed.
 
+        Concurrent callers share one sweep.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._inflight
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = self._inflight = loop.create_task(self._refresh())
+        return await asyncio.shield(task)
+
+    async def _refresh(self) -> dict:
+        # Changes notified during the sweep mark it dirty again
+        self._dirty = False
+        agents = await self._sweep()
+        first = self._refreshes == 0
+        added = sorted(agents.keys() - self._agents.keys())
+        removed = sorted(self._agents.keys() - agents.keys())
+        self._agents = agents
+        self._reindex()
+        self._refreshed_at = time.monotonic()
+        self._refreshes += 1
+
+        if first or removed:
+            # Clean up stale registry entries
+            agent_registry.cleanup_stale(set(agents))
+        change = {"added": added, "removed": removed, "total": len(agents)}
+        if (added or removed) and not first:
+            for listener in self._listeners:
+                try:
+                    await listener(change)
+                except Exception as e:
+                    logger.error(f"Topology listener failed: {e}")
+        return change
+
+    def _reindex(self):
+        self._by_agent_id = {a.agent_id: a.id for a in self._agents.values() if a.agent_id}
+        self._by_display_name = {
+            a.display_name: a.id for a in self._agents.values() if a.display_name and a.display_name != a.id
+        }
+
+    def _authoritative(self) -> bool:
+        """True while control-mode notifications keep the topology current."""
+        return tmux_service.control_attached and not self._dirty and self._refreshes > 0
+
+    async def _ensure_fresh(self):
+        if self._authoritative():
+            return
+        if self._dirty or time.monotonic() - self._refreshed_at > settings.topology_refresh_seconds:
+            await self.refresh_topology()
+
+    async def _refresh_on_miss(self) -> bool:
+        """Re-sweep after a lookup miss unless that can't help; True if it swept."""
+        if self._authoritative():
+            return False
+        if not self._dirty and time.monotonic() - self._refreshed_at < settings.topology_miss_refresh_seconds:
+            return False
+        await self.refresh_topology()
+        return True
+
+    def _on_tmux_notification(self, name: str, args: str):
+        if name not in TOPOLOGY_NOTIFICATIONS:
+            return
+        self._dirty = True
+        if self._debounce is None:
+            loop = asyncio.get_running_loop()
+            self._debounce = loop.call_later(TOPOLOGY_DEBOUNCE_SECONDS, self._debounced_refresh)
+
+    def _debounced_refresh(self):
+        self._debounce = None
+        asyncio.get_running_loop().create_task(self._refresh_logged())
+
+    async def _refresh_logged(self):
+        try:
+            await self.refresh_topology()
+        except Exception as e:
+            logger.error(f"Agent topology refresh failed: {e}")
+
+    def add_topology_listener(self, listener: TopologyListener):
+        self._listeners.append(listener)
+
+    def start(self):
+        """Follow tmux notifications and run the periodic diff (called from the app lifespan)."""
+        if self._task is None or self._task.done():
+            tmux_service.add_listener(self._on_tmux_notification)
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._debounce:
+            self._debounce.cancel()
+            self._debounce = None
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(settings.topology_refresh_seconds)
+                if not self._authoritative():
+                    await self.refresh_topology()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Agent topology refresh failed: {e}")
+
+    def topology_stats(self) -> dict:
+        return {
+            "agents": len(self._agents),
+            "refreshes": self._refreshes,
+            "authoritative": self._authoritative(),
+            "age_seconds": round(time.monotonic() - self._refreshed_at, 3) if self._refreshes else None,
+        }
+
+    # --- Lookups ---
+
+    async def list_agents(self, session: Optional[str] = None) -> List[Agent]:
+        """List all active agents based on tmux windows.
+
+        Args:
+            session: If provided, only list agents from this session.
+                     If None, list agents from all cmux sessions.
+        """
+        await self._ensure_fresh()
+        # Registry metadata (display names, projects, roles) changes without
+        # tmux noticing; re-reading it is an in-memory operation
+        agents = [
+            self._enrich_from_registry(agent)
+            for agent in list(self._agents.values())
+            if session is None or agent.session == session
+        ]
+        self._reindex()
         return agents
 
+    def _lookup(self, identifier: str) -> Optional[Agent]:
+        if identifier.startswith("ag_"):
+            window_id = self._by_agent_id.get(identifier)
+            if window_id is None:
+                # Registered since the last sweep (e.g. by the CLI)
+                found = agent_registry.find_by_agent_id(identifier)
+                window_id = found[0] if found else None
+                if window_id in self._agents:
+                    self._enrich_from_registry(self._agents[window_id])
+                    self._by_agent_id[identifier] = window_id
+            return self._agents.get(window_id) if window_id else None
+        agent = self._agents.get(identifier)
+        if agent is None and identifier in self._by_display_name:
+            agent = self._agents.get(self._by_display_name[identifier])
+        return agent
+
     async def get_agent(self, identifier: str) -> Optional[Agent]:
-        """Get a specific agent by window-based ID or agent_id (ag_xxx).
+        """Get a specific agent by window-based ID, agent_id (ag_xxx) or display name.
 
         Identifiers can be:
         - "ag_xxxxxxxx" — unique agent ID (tried first)
         - "window_name" for main session (e.g., "supervisor", "worker-1")
         - "session:window_name" for other sessions (e.g., "cmux-feature:supervisor-feature")
         """
-        # Try agent_id lookup first (ag_xxx format)
-        if identifier.startswith("ag_"):
-            agent = self._find_by_agent_id(identifier)
-            if agent:
-                return agent
-            # Not in cache — refresh and try again
-            await self.list_agents()
-            return self._find_by_agent_id(identifier)
-
-        # Fall back to window-based ID lookup
-        if identifier not in self._agents:
-            await self.list_agents()
-        return self._agents.get(identifier)
+        if self._refreshes == 0:
+            await self.refresh_topology()
+        agent = self._lookup(identifier)
+        if agent is None and await self._refresh_on_miss():
+            agent = self._lookup(identifier)
+        return agent
 
     def _find_by_agent_id(self, agent_id: str) -> Optional[Agent]:
         """Find a cached agent by its agent_id (ag_xxx)."""
-        for agent in self._agents.values():
-            if agent.agent_id == agent_id:
-                return agent
-        return None
+        window_id = self._by_agent_id.get(agent_id)
+        return self._agents.get(window_id) if window_id else None
+
+    async def _window_exists(self, session: str, window: str) -> bool:
+        """Whether a window is live, answered from the topology when possible."""
+        if window in settings.system_windows:
+            return await tmux_service.window_exists(window, session)
+        window_id = f"{session}:{window}" if session != settings.main_session else window
+        if window_id in self._agents:
+            return True
+        return await self._refresh_on_miss() and window_id in self._agents
 
     def resolve_to_window_id(self, identifier: str) -> str:
         """Resolve an identifier (ag_xxx or name) to a window-based ID.
@@ -174,6 +355,9 @@ class AgentManager:
             project_id=entry.get("project_id", "cmux"),
         )
         self._agents[window_id] = agent
+        self._reindex()
+        # The sweep triggered by tmux's notification will confirm it
+        self._dirty = True
 
         return agent
 
@@ -194,8 +378,8 @@ class AgentManager:
         session, window = self.parse_agent_id(agent.id)
         success = await tmux_service.kill_window(window, session)
         if success:
-            if agent.id in self._agents:
-                del self._agents[agent.id]
+            self._agents.pop(agent.id, None)
+            self._reindex()
             # Unregister from persistent registry
             agent_registry.unregister(agent.id)
         return success
@@ -203,7 +387,7 @@ class AgentManager:
     async def send_message_to_agent(self, identifier: str, message: str) -> bool:
         """Send a message to an agent via tmux."""
         session, window = self.parse_agent_id(identifier)
-        if not await tmux_service.window_exists(window, session):
+        if not await self._window_exists(session, window):
             return False
         await tmux_service.send_input(window, message, session)
         return True
@@ -211,7 +395,7 @@ class AgentManager:
     async def interrupt_agent(self, identifier: str) -> bool:
         """Send Ctrl+C to an agent."""
         session, window = self.parse_agent_id(identifier)
-        if not await tmux_service.window_exists(window, session):
+        if not await self._window_exists(session, window):
             return False
         await tmux_service.send_interrupt(window, session)
         return True
@@ -219,7 +403,7 @@ class AgentManager:
     async def get_agent_terminal(self, identifier: str, lines: int = 100) -> Optional[str]:
         """Capture terminal output from an agent."""
         session, window = self.parse_agent_id(identifier)
-        if not await tmux_service.window_exists(window, session):
+        if not await self._window_exists(session, window):
             return None
         return await tmux_service.capture_pane(window, lines, session)
 
@@ -0,0 +1,46 @@
+"""Content-defined chunking and compression for archived terminal output.
+
+Archived scrollback is split into blocks of lines whose boundaries depend
+only on line content (a line whose hash hits the boundary mask ends a
+block), so two captures of the same long-running pane share most of their
+blocks even when new output shifts everything down. Each block is stored
+once, zlib-compressed, under the hash of its contents.
+"""
+
+import hashlib
+import zlib
+from typing import Iterator
+
+# A line ends a block when crc32(line) % AVG_LINES == 0 (so ~AVG_LINES per
+# block), bounded so tiny or pathological blocks can't happen.
+AVG_LINES = 32
+MIN_LINES = 8
+MAX_LINES = 256
+
+COMPRESSION_LEVEL = 6
+
+
+def split_chunks(text: str) -> Iterator[str]:
+    """Yield consecutive blocks of lines that concatenate back to `text`."""
+    block: list[str] = []
+    for line in text.splitlines(keepends=True):
+        block.append(line)
+        if len(block) >= MAX_LINES or (
+            len(block) >= MIN_LINES and zlib.crc32(line.encode()) % AVG_LINES == 0
+        ):
+            yield "".join(block)
+            block = []
+    if block:
+        yield "".join(block)
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.blake2b(chunk.encode(), digest_size=16).hexdigest()
+
+
+def compress(chunk: str) -> bytes:
+    return zlib.compress(chunk.encode(), COMPRESSION_LEVEL)
+
+
+def inflate(data: bytes) -> str:
+    return zlib.decompress(data).decode()
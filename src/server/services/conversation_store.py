@@ -2,20 +2,569 @@
 
 Provides durability across server restarts and archives worker conversations
 before they are killed.
+
+Messages, agent events and thoughts go through a write-behind buffer: while
+the server is running they are flushed in batches (one transaction per
+flush) instead of one commit per hook post. Every read or update flushes
+the buffer first, so callers always see their own writes.
+
+Messages, thoughts and archived terminal output are full-text indexed
+with FTS5 external-content tables that triggers keep in sync.
+
+Archived terminal output is stored as deduplicated, zlib-compressed line
+blocks (see archive_chunks) and reassembled on read. Its FTS index reads
+through a view that needs the server's `inflate` function, so other
+sqlite clients may write and delete archives but not search them:
+deleting an archive only records it in deleted_archives, and the
+server's maintenance pass drops its index entries and unused chunks.
+
+Timestamps are kept twice: the original ISO-8601 TEXT (returned to API
+clients unchanged) and an integer microsecond epoch (`ts_us`) that every
+ORDER BY, range filter and pagination cursor uses.
 """
 
+import asyncio
+import base64
+import logging
 import sqlite3
 import json
+import threading
+import time
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Sequence, Tuple, Union
 from contextlib import contextmanager
 
 from pydantic import BaseModel
 
 from ..config import settings
 from ..models.message import Message, MessageType, TaskStatus
+from .archive_chunks import chunk_hash, compress, inflate, split_chunks
+from .db import AsyncFacade, add_column, db_executor, get_pool
+
+logger = logging.getLogger(__name__)
+
+# Keyset pagination position: (ts_us, id) of a row
+Cursor = Tuple[int, str]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class ArchiveIncompleteError(LookupError):
+    """Some of an archive's terminal output chunks are missing."""
+
+
+def to_epoch_us(value: Union[str, datetime, int]) -> int:
+    """Microseconds since the Unix epoch. Naive datetimes are taken as UTC.
+
+    Unparseable strings map to 0 so legacy rows sort first instead of
+    failing the write.
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return 0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def encode_cursor(timestamp: Union[str, datetime, int], row_id: str) -> str:
+    """Encode a row position as an opaque, URL-safe pagination token."""
+    raw = json.dumps([to_epoch_us(timestamp), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Cursor]:
+    """Decode a pagination token. Raises ValueError if it is malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        ts_us, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+    if type(ts_us) is not int or not isinstance(row_id, str):
+        raise ValueError(f"Invalid cursor: {token}")
+    return ts_us, row_id
+
+
+def trim_page(items: list, limit: int, from_front: bool) -> tuple[list, bool]:
+    """Trim a `limit + 1` fetch down to `limit` rows and report whether more exist.
+
+    The extra row sits at the front when the query ran against display order
+    (see ConversationStore._keyset) and at the back otherwise.
+    """
+    if len(items) <= limit:
+        return items, False
+    return (items[-limit:] if from_front else items[:limit]), True
+
+
+# Insert statements for the write-behind buffer, keyed by table
+_BUFFERED_INSERTS = {
+    "messages": """
+        INSERT OR REPLACE INTO messages
+        (id, timestamp, from_agent, to_agent, type, content, metadata, task_status, ts_us)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "agent_events": """
+        INSERT OR REPLACE INTO agent_events
+        (id, event_type, session_id, agent_id, tool_name, tool_input, tool_output, timestamp, message_id, usage, ts_us,
+         input_tokens, output_tokens, cache_read_tokens, cache_creation_tokens)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "thoughts": """
+        INSERT OR REPLACE INTO thoughts
+        (id, agent_name, thought_type, content, tool_name, tool_input, tool_response, timestamp, ts_us)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "ws_event_log": """
+        INSERT OR REPLACE INTO ws_event_log (seq, event, frame, ts_us)
+        VALUES (?, ?, ?, ?)
+    """,
+}
+
+
+# Token usage series granularities -> bucket width in microseconds. Only
+# hourly rollups are stored; wider buckets are summed from them.
+USAGE_BUCKETS = {
+    "hour": 3_600_000_000,
+    "day": 86_400_000_000,
+}
+
+# Typed usage columns on agent_events, in the order they appear in a row
+# tuple, paired with the key they come from in the hook's usage payload
+_USAGE_FIELDS = (
+    ("input_tokens", "input_tokens"),
+    ("output_tokens", "output_tokens"),
+    ("cache_read_tokens", "cache_read_input_tokens"),
+    ("cache_creation_tokens", "cache_creation_input_tokens"),
+)
+
+_UPSERT_USAGE_ROLLUP = """
+    INSERT INTO usage_rollup
+    (agent_id, bucket_start, event_count,
+     input_tokens, output_tokens, cache_read_tokens, cache_creation_tokens)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (agent_id, bucket_start) DO UPDATE SET
+        event_count = event_count + excluded.event_count,
+        input_tokens = input_tokens + excluded.input_tokens,
+        output_tokens = output_tokens + excluded.output_tokens,
+        cache_read_tokens = cache_read_tokens + excluded.cache_read_tokens,
+        cache_creation_tokens = cache_creation_tokens + excluded.cache_creation_tokens
+"""
+
+
+def _usage_tokens(usage: Optional[dict]) -> tuple:
+    """Typed usage column values for an event (all NULL when it has no usage)."""
+    if usage is None:
+        return (None,) * len(_USAGE_FIELDS)
+    values = []
+    for _, key in _USAGE_FIELDS:
+        try:
+            values.append(int(usage.get(key) or 0))
+        except (TypeError, ValueError):
+            values.append(0)
+    return tuple(values)
+
+
+# Searchable sources (see ConversationStore.search)
+SEARCH_SOURCES = ("messages", "thoughts", "archives")
+
+_SNIPPET_OPEN = "<mark>"
+_SNIPPET_CLOSE = "</mark>"
+_SNIPPET_TOKENS = 16
+
+
+def to_fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word is quoted and all must match.
+
+    Quoting keeps punctuation like "auth.py" or "--force" from being parsed
+    as query syntax; a trailing `*` still requests a prefix match.
+    """
+    terms = []
+    for word in text.split():
+        prefix = len(word) > 1 and word.endswith("*")
+        word = word.rstrip("*") if prefix else word
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def _from_epoch_us(ts_us: int) -> str:
+    return datetime.fromtimestamp(ts_us / 1_000_000, tz=timezone.utc).isoformat()
+
+
+# --- Schema migrations (see db.migrate) ---
+
+def _migrate_base_schema(conn: sqlite3.Connection):
+    """Tables and indexes from before versioning, including the old ad-hoc column migrations."""
+    for statement in (
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            from_agent TEXT NOT NULL,
+            to_agent TEXT NOT NULL,
+            type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            metadata TEXT,
+            task_status TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_messages_from_agent ON messages(from_agent)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_to_agent ON messages(to_agent)",
+        """
+        CREATE TABLE IF NOT EXISTS agent_archives (
+            id TEXT PRIMARY KEY,
+            agent_id TEXT NOT NULL,
+            agent_name TEXT NOT NULL,
+            agent_type TEXT NOT NULL,
+            archived_at TEXT NOT NULL,
+            terminal_output TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_archives_agent_id ON agent_archives(agent_id)",
+        """
+        CREATE TABLE IF NOT EXISTS agent_events (
+            id TEXT PRIMARY KEY,
+            event_type TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            agent_id TEXT NOT NULL,
+            tool_name TEXT,
+            tool_input TEXT,
+            tool_output TEXT,
+            timestamp TEXT NOT NULL,
+            message_id TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_agent_events_session ON agent_events(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_agent_events_agent ON agent_events(agent_id)",
+        "CREATE INDEX IF NOT EXISTS idx_agent_events_message ON agent_events(message_id)",
+        """
+        CREATE TABLE IF NOT EXISTS thoughts (
+            id TEXT PRIMARY KEY,
+            agent_name TEXT NOT NULL,
+            thought_type TEXT NOT NULL,
+            content TEXT,
+            tool_name TEXT,
+            tool_input TEXT,
+            tool_response TEXT,
+            timestamp TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_thoughts_agent_name ON thoughts(agent_name)",
+    ):
+        conn.execute(statement)
+    add_column(conn, "messages", "task_status", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_task_status ON messages(task_status)")
+    add_column(conn, "agent_events", "usage", "TEXT")
+
+
+def _migrate_epoch_timestamps(conn: sqlite3.Connection):
+    """Integer microsecond-epoch columns for ordering, range filters and cursors."""
+    conn.create_function("epoch_us", 1, to_epoch_us, deterministic=True)
+    for table, column, source in (
+        ("messages", "ts_us", "timestamp"),
+        ("agent_events", "ts_us", "timestamp"),
+        ("thoughts", "ts_us", "timestamp"),
+        ("agent_archives", "archived_at_us", "archived_at"),
+    ):
+        add_column(conn, table, column, "INTEGER NOT NULL DEFAULT 0")
+        conn.execute(f"UPDATE {table} SET {column} = epoch_us({source})")
+
+    # TEXT timestamp indexes (including the old (timestamp, id) keyset ones) are superseded
+    for index in (
+        "idx_messages_timestamp",
+        "idx_messages_timestamp_id",
+        "idx_archives_archived_at",
+        "idx_agent_events_timestamp",
+        "idx_agent_events_timestamp_id",
+        "idx_thoughts_timestamp",
+        "idx_thoughts_timestamp_id",
+    ):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    for statement in (
+        "CREATE INDEX idx_messages_ts ON messages(ts_us, id)",
+        "CREATE INDEX idx_archives_archived_at_us ON agent_archives(archived_at_us)",
+        "CREATE INDEX idx_agent_events_ts ON agent_events(ts_us, id)",
+        "CREATE INDEX idx_agent_events_agent_ts ON agent_events(agent_id, ts_us)",
+        "CREATE INDEX idx_thoughts_ts ON thoughts(ts_us, id)",
+        "CREATE INDEX idx_thoughts_agent_ts ON thoughts(agent_name, ts_us)",
+    ):
+        conn.execute(statement)
+
+
+def _migrate_message_participants(conn: sqlite3.Connection):
+    """Per-agent participant index: one row per (agent, message).
+
+    Per-agent history, counts and inbox become single index range scans
+    instead of an OR over from_agent/to_agent plus a sort.
+    """
+    conn.execute("DROP TABLE IF EXISTS message_participants")
+    conn.execute("""
+        CREATE TABLE message_participants (
+            agent_id TEXT NOT NULL,
+            ts_us INTEGER NOT NULL,
+            message_id TEXT NOT NULL,
+            PRIMARY KEY (agent_id, ts_us, message_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_message_participants_message ON message_participants(message_id)")
+    conn.execute("""
+        INSERT OR IGNORE INTO message_participants (agent_id, ts_us, message_id)
+        SELECT from_agent, ts_us, id FROM messages
+        UNION
+        SELECT to_agent, ts_us, id FROM messages
+    """)
+
+
+def _migrate_usage_rollup(conn: sqlite3.Connection):
+    """Typed token columns on agent_events plus hourly per-agent rollups."""
+    for column, key in _USAGE_FIELDS:
+        add_column(conn, "agent_events", column, "INTEGER")
+        conn.execute(
+            f"UPDATE agent_events SET {column} = COALESCE(json_extract(usage, '$.{key}'), 0) "
+            "WHERE usage IS NOT NULL"
+        )
+    conn.execute("CREATE INDEX idx_agent_events_usage ON agent_events(agent_id, ts_us) WHERE usage IS NOT NULL")
+    conn.execute("""
+        CREATE TABLE usage_rollup (
+            granularity TEXT NOT NULL,
+            agent_id TEXT NOT NULL,
+            bucket_start INTEGER NOT NULL,
+            event_count INTEGER NOT NULL,
+            input_tokens INTEGER NOT NULL,
+            output_tokens INTEGER NOT NULL,
+            cache_read_tokens INTEGER NOT NULL,
+            cache_creation_tokens INTEGER NOT NULL,
+            PRIMARY KEY (granularity, agent_id, bucket_start)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_usage_rollup_bucket ON usage_rollup(granularity, bucket_start)")
+    # Day rows are no longer kept (see _migrate_hourly_usage_rollup)
+    width = USAGE_BUCKETS["hour"]
+    conn.execute(f"""
+        INSERT INTO usage_rollup
+        SELECT 'hour', agent_id, (ts_us / {width}) * {width}, COUNT(*),
+               SUM(input_tokens), SUM(output_tokens), SUM(cache_read_tokens), SUM(cache_creation_tokens)
+        FROM agent_events
+        WHERE usage IS NOT NULL
+        GROUP BY agent_id, ts_us / {width}
+    """)
+
+
+# External-content FTS5 indexes: fts table -> (content table, indexed columns)
+_FTS_TABLES = {
+    "messages_fts": ("messages", ("content",)),
+    "thoughts_fts": ("thoughts", ("content", "tool_input", "tool_response")),
+    "agent_archives_fts": ("agent_archives", ("terminal_output",)),
+}
+
+
+def _migrate_full_text_search(conn: sqlite3.Connection):
+    """FTS5 indexes over messages, thoughts and archived terminal output, kept in sync by triggers."""
+    for fts, (table, columns) in _FTS_TABLES.items():
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{c}" for c in columns)
+        old_values = ", ".join(f"old.{c}" for c in columns)
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE {fts} USING fts5(
+                {column_list}, content='{table}', content_rowid='rowid', prefix='2 3'
+            )
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+                INSERT INTO {fts} (rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END
+        """)
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def _write_archive_chunks(conn: sqlite3.Connection, archive_id: str, text: str) -> int:
+    """Store `text` as the archive's chunk list, compressing only unseen chunks.
+
+    Returns the uncompressed size in bytes.
+    """
+    chunks = list(split_chunks(text))
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    existing: set[str] = set()
+    for start in range(0, len(hashes), 500):
+        batch = hashes[start:start + 500]
+        cursor = conn.execute(
+            f"SELECT hash FROM archive_chunks WHERE hash IN ({', '.join('?' * len(batch))})", batch,
+        )
+        existing.update(row[0] for row in cursor.fetchall())
+
+    new_chunks = {h: chunk for h, chunk in zip(hashes, chunks) if h not in existing}
+    conn.executemany(
+        "INSERT OR IGNORE INTO archive_chunks (hash, data, size) VALUES (?, ?, ?)",
+        [(h, compress(chunk), len(chunk.encode())) for h, chunk in new_chunks.items()],
+    )
+    conn.executemany(
+        "INSERT INTO archive_chunk_refs (archive_id, seq, hash) VALUES (?, ?, ?)",
+        [(archive_id, seq, h) for seq, h in enumerate(hashes)],
+    )
+    return len(text.encode())
+
+
+def _migrate_archive_chunks(conn: sqlite3.Connection):
+    """Move archived terminal output into compressed, content-addressed chunks.
+
+    The archive FTS index now reads through a view that reassembles the
+    chunks, and is maintained explicitly by archive_agent instead of by
+    triggers on the (now NULL) terminal_output column.
+    """
+    conn.create_function("inflate", 1, inflate, deterministic=True)
+    conn.execute("""
+        CREATE TABLE archive_chunks (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE archive_chunk_refs (
+            archive_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (archive_id, seq)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_archive_chunk_refs_hash ON archive_chunk_refs(hash)")
+    add_column(conn, "agent_archives", "output_size", "INTEGER")
+
+    for suffix in ("ai", "ad", "au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS agent_archives_fts_{suffix}")
+    conn.execute("DROP TABLE IF EXISTS agent_archives_fts")
+    conn.execute("""
+        CREATE VIEW agent_archives_text AS
+        SELECT a.rowid AS rowid, COALESCE(a.terminal_output, (
+            SELECT group_concat(inflate(data), '') FROM (
+                SELECT c.data AS data
+                FROM archive_chunk_refs r JOIN archive_chunks c ON c.hash = r.hash
+                WHERE r.archive_id = a.id
+                ORDER BY r.seq
+            )
+        )) AS terminal_output
+        FROM agent_archives a
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE agent_archives_fts USING fts5(
+            terminal_output, content='agent_archives_text', content_rowid='rowid', prefix='2 3'
+        )
+    """)
+
+    rows = conn.execute(
+        "SELECT id, terminal_output FROM agent_archives WHERE terminal_output IS NOT NULL"
+    ).fetchall()
+    for archive_id, terminal_output in rows:
+        size = _write_archive_chunks(conn, archive_id, terminal_output)
+        conn.execute(
+            "UPDATE agent_archives SET terminal_output = NULL, output_size = ? WHERE id = ?",
+            (size, archive_id),
+        )
+    conn.execute("INSERT INTO agent_archives_fts (agent_archives_fts) VALUES ('rebuild')")
+
+
+def _migrate_ws_event_log(conn: sqlite3.Connection):
+    """Log of sequenced WebSocket broadcasts, for replay to reconnecting clients.
+
+    `frame` is the JSON frame exactly as it was sent. Frames too large to
+    keep are left out, and a resume across the gap they leave resyncs.
+    """
+    conn.execute("""
+        CREATE TABLE ws_event_log (
+            seq INTEGER PRIMARY KEY,
+            event TEXT NOT NULL,
+            frame TEXT NOT NULL,
+            ts_us INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_ws_event_log_ts ON ws_event_log(ts_us)")
+
+
+def _migrate_archive_deletes(conn: sqlite3.Connection):
+    """Queue deleted archives for server-side cleanup.
+
+    Removing an archive's FTS entry needs its text, which only the server
+    can reassemble (inflate), so the trigger is plain SQL that any client
+    can run and purge_deleted_archives does the rest. Archives deleted
+    before this point are cleaned up here.
+    """
+    conn.create_function("inflate", 1, inflate, deterministic=True)
+    conn.execute("""
+        CREATE TABLE deleted_archives (
+            archive_rowid INTEGER PRIMARY KEY,
+            archive_id TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER agent_archives_ad AFTER DELETE ON agent_archives BEGIN
+            INSERT OR REPLACE INTO deleted_archives (archive_rowid, archive_id) VALUES (old.rowid, old.id);
+        END
+    """)
+    conn.execute("DELETE FROM archive_chunk_refs WHERE archive_id NOT IN (SELECT id FROM agent_archives)")
+    conn.execute("INSERT INTO agent_archives_fts (agent_archives_fts) VALUES ('rebuild')")
+
+
+def _migrate_hourly_usage_rollup(conn: sqlite3.Connection):
+    """Keep only the hourly usage rollups, without a granularity column.
+
+    Every reader sums hours (day series included, so that a window cutting
+    a day counts only its hours inside it); day rows were never read.
+    """
+    conn.execute("""
+        CREATE TABLE usage_rollup_hourly (
+            agent_id TEXT NOT NULL,
+            bucket_start INTEGER NOT NULL,
+            event_count INTEGER NOT NULL,
+            input_tokens INTEGER NOT NULL,
+            output_tokens INTEGER NOT NULL,
+            cache_read_tokens INTEGER NOT NULL,
+            cache_creation_tokens INTEGER NOT NULL,
+            PRIMARY KEY (agent_id, bucket_start)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        INSERT INTO usage_rollup_hourly
+        SELECT agent_id, bucket_start, event_count,
+               input_tokens, output_tokens, cache_read_tokens, cache_creation_tokens
+        FROM usage_rollup
+        WHERE granularity = 'hour'
+    """)
+    conn.execute("DROP TABLE usage_rollup")
+    conn.execute("ALTER TABLE usage_rollup_hourly RENAME TO usage_rollup")
+    conn.execute("CREATE INDEX idx_usage_rollup_bucket ON usage_rollup(bucket_start)")
+
+
+# Append only: a database's user_version is the number of entries applied
+_MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_epoch_timestamps,
+    _migrate_message_participants,
+    _migrate_usage_rollup,
+    _migrate_full_text_search,
+    _migrate_archive_chunks,
+    _migrate_ws_event_log,
+    _migrate_archive_deletes,
+    _migrate_hourly_usage_rollup,
+]
 
 
 class ArchivedAgent(BaseModel):
@@ -42,172 +591,398 @@ class ConversationStore:
 
     def __init__(self, db_path: Optional[Path] = None):
         self.db_path = db_path or (settings.cmux_dir / "conversations.db")
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool = get_pool(self.db_path)
+        # Write-behind buffer: table -> pending row tuples
+        self._pending: dict[str, list[tuple]] = {table: [] for table in _BUFFERED_INSERTS}
+        self._pending_count = 0
+        self._pending_lock = threading.Lock()
+        # Held for the whole swap+write so readers can wait for in-flight rows
+        self._flush_lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_loop_ref: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_wakeup: Optional[asyncio.Event] = None
+        self._flushes = 0
+        self._rows_flushed = 0
+        self._rows_dropped = 0
+        # Approximate message counts: agent_id (None = all) -> (count, computed_at)
+        self._count_cache: dict[Optional[str], tuple[int, float]] = {}
+        self._count_lock = threading.Lock()
+        # Used by the agent_archives_text view (archive FTS content)
+        self._pool.register_function("inflate", 1, inflate)
         self._ensure_db()
 
     def _ensure_db(self):
-        """Create database and tables if they don't exist."""
-        self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        with self._get_connection() as conn:
-            conn.executescript("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id TEXT PRIMARY KEY,
-                    timestamp TEXT NOT NULL,
-                    from_agent TEXT NOT NULL,
-                    to_agent TEXT NOT NULL,
-                    type TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    metadata TEXT,
-                    task_status TEXT
-                );
-
-                CREATE INDEX IF NOT EXISTS idx_messages_from_agent ON messages(from_agent);
-                CREATE INDEX IF NOT EXISTS idx_messages_to_agent ON messages(to_agent);
-                CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
-
-                CREATE TABLE IF NOT EXISTS agent_archives (
-                    id TEXT PRIMARY KEY,
-                    agent_id TEXT NOT NULL,
-                    agent_name TEXT NOT NULL,
-                    agent_type TEXT NOT NULL,
-                    archived_at TEXT NOT NULL,
-                    terminal_output TEXT
-                );
-
-                CREATE INDEX IF NOT EXISTS idx_archives_agent_id ON agent_archives(agent_id);
-                CREATE INDEX IF NOT EXISTS idx_archives_archived_at ON agent_archives(archived_at);
-
-                CREATE TABLE IF NOT EXISTS agent_events (
-                    id TEXT PRIMARY KEY,
-                    event_type TEXT NOT NULL,
-                    session_id TEXT NOT NULL,
-                    agent_id TEXT NOT NULL,
-                    tool_name TEXT,
-                    tool_input TEXT,
-                    tool_output TEXT,
-                    timestamp TEXT NOT NULL,
-                    message_id TEXT
-                );
-
-                CREATE INDEX IF NOT EXISTS idx_agent_events_session ON agent_events(session_id);
-                CREATE INDEX IF NOT EXISTS idx_agent_events_agent ON agent_events(agent_id);
-                CREATE INDEX IF NOT EXISTS idx_agent_events_message ON agent_events(message_id);
-                CREATE INDEX IF NOT EXISTS idx_agent_events_timestamp ON agent_events(timestamp);
-
-                CREATE TABLE IF NOT EXISTS thoughts (
-                    id TEXT PRIMARY KEY,
-                    agent_name TEXT NOT NULL,
-                    thought_type TEXT NOT NULL,
-                    content TEXT,
-                    tool_name TEXT,
-                    tool_input TEXT,
-                    tool_response TEXT,
-                    timestamp TEXT NOT NULL
-                );
-
-                CREATE INDEX IF NOT EXISTS idx_thoughts_agent_name ON thoughts(agent_name);
-                CREATE INDEX IF NOT EXISTS idx_thoughts_timestamp ON thoughts(timestamp);
-            """)
-            # Migration: add task_status column to existing databases
-            columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)").fetchall()]
-            if "task_status" not in columns:
-                conn.execute("ALTER TABLE messages ADD COLUMN task_status TEXT")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_task_status ON messages(task_status)")
-
-            # Migration: add usage column to agent_events
-            event_columns = [row[1] for row in conn.execute("PRAGMA table_info(agent_events)").fetchall()]
-            if "usage" not in event_columns:
-                conn.execute("ALTER TABLE agent_events ADD COLUMN usage TEXT")
+        """Create the database or bring its schema up to date."""
+        self._pool.migrate(_MIGRATIONS)
 
     @contextmanager
     def _get_connection(self):
-        """Get a database connection with proper cleanup."""
-        conn = sqlite3.connect(str(self.db_path))
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute("PRAGMA busy_timeout=5000")
-        try:
+        """Check out this thread's pooled connection; commits on exit.
+
+        Pending write-behind rows are flushed first so reads and updates
+        always observe earlier store_* calls.
+        """
+        if self._pending_count or self._flush_lock.locked():
+            self.flush()
+        with self._pool.connection() as conn:
             yield conn
-            conn.commit()
-        finally:
-            conn.close()
 
-    def store_message(self, message: Message) -> None:
-        """Store a message in the database."""
-        with self._get_connection() as conn:
-            conn.execute(
-                """
-                INSERT OR REPLACE INTO messages
-                (id, timestamp, from_agent, to_agent, type, content, metadata, task_status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    message.id,
-                    message.timestamp.isoformat(),
-                    message.from_agent,
-                    message.to_agent,
-                    message.type.value,
-                    message.content,
-                    json.dumps(message.metadata) if message.metadata else None,
-                    message.task_status.value if message.task_status else None,
-                )
+    # --- Write-behind buffer ---
+
+    def _enqueue(self, table: str, row: tuple) -> None:
+        """Buffer a row for batched insertion.
+
+        Without a running flush task (tests, CLI use) the buffer is flushed
+        immediately. Once it reaches db_flush_max_rows, the flush task is
+        woken so the caller never pays for the write.
+        """
+        with self._pending_lock:
+            self._pending[table].append(row)
+            self._pending_count += 1
+            pending = self._pending_count
+        if not self.write_behind_active:
+            self.flush()
+        elif pending >= settings.db_flush_max_rows:
+            # May be called from a db_executor thread, not the loop thread
+            self._flush_loop_ref.call_soon_threadsafe(self._flush_wakeup.set)
+
+    def flush(self) -> int:
+        """Write all buffered rows with executemany in a single transaction.
+
+        If the batch fails for a reason other than a transient
+        OperationalError, the rows are retried one per transaction and only
+        those that still fail are logged and dropped.
+
+        Returns the number of rows written.
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                if not self._pending_count:
+                    return 0
+                batches = self._pending
+                self._pending = {table: [] for table in _BUFFERED_INSERTS}
+                self._pending_count = 0
+
+            try:
+                with self._pool.connection() as conn:
+                    self._write_batches(conn, batches)
+            except sqlite3.OperationalError:
+                # Transient (e.g. database locked) - put rows back for the next flush
+                self._requeue(batches)
+                raise
+            except sqlite3.Error as e:
+                # A bad row (e.g. an unbindable value) fails the whole batch
+                logger.warning(f"Write-behind batch failed, writing rows one by one: {e}")
+                batches = self._write_rows_singly(batches)
+
+            written = sum(len(rows) for rows in batches.values())
+            self._flushes += 1
+            self._rows_flushed += written
+            if batches["messages"]:
+                self._bump_message_counts(batches["messages"])
+            return written
+
+    def _write_rows_singly(self, batches: dict[str, list[tuple]]) -> dict[str, list[tuple]]:
+        """Write each row in its own transaction, dropping those that fail.
+
+        Returns the rows written. On an OperationalError the rows not yet
+        written are put back in the buffer and the error is raised.
+        """
+        written: dict[str, list[tuple]] = {table: [] for table in _BUFFERED_INSERTS}
+        remaining = [(table, row) for table, rows in batches.items() for row in rows]
+        for i, (table, row) in enumerate(remaining):
+            single = {name: [] for name in _BUFFERED_INSERTS}
+            single[table].append(row)
+            try:
+                with self._pool.connection() as conn:
+                    self._write_batches(conn, single)
+            except sqlite3.OperationalError:
+                unwritten = {name: [] for name in _BUFFERED_INSERTS}
+                for name, rest in remaining[i:]:
+                    unwritten[name].append(rest)
+                self._requeue(unwritten)
+                raise
+            except sqlite3.Error as e:
+                self._rows_dropped += 1
+                logger.error(f"Dropping buffered {table} row {row[0]!r}: {e}")
+            else:
+                written[table].append(row)
+        return written
+
+    def _write_batches(self, conn: sqlite3.Connection, batches: dict[str, list[tuple]]):
+        for table, rows in batches.items():
+            if rows:
+                conn.executemany(_BUFFERED_INSERTS[table], rows)
+        if batches["messages"]:
+            self._index_participants(conn, batches["messages"])
+        if batches["agent_events"]:
+            self._roll_up_usage(conn, batches["agent_events"])
+
+    def _requeue(self, batches: dict[str, list[tuple]]):
+        """Put unwritten rows back at the front of the buffer."""
+        with self._pending_lock:
+            for table, rows in batches.items():
+                self._pending[table][:0] = rows
+                self._pending_count += len(rows)
+
+    @staticmethod
+    def _index_participants(conn: sqlite3.Connection, message_rows: list[tuple]):
+        """Maintain message_participants for freshly written message rows.
+
+        Rows are replaced wholesale because INSERT OR REPLACE on messages may
+        have changed the timestamp or the participants of an existing id.
+        """
+        conn.executemany(
+            "DELETE FROM message_participants WHERE message_id = ?",
+            [(row[0],) for row in message_rows],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO message_participants (agent_id, ts_us, message_id) VALUES (?, ?, ?)",
+            [
+                (agent, row[8], row[0])
+                for row in message_rows
+                for agent in {row[2], row[3]}
+            ],
+        )
+
+    @staticmethod
+    def _roll_up_usage(conn: sqlite3.Connection, event_rows: list[tuple]):
+        """Add freshly written events' token usage to the hourly usage_rollup buckets."""
+        width = USAGE_BUCKETS["hour"]
+        buckets: dict[tuple[str, int], list[int]] = {}
+        for row in event_rows:
+            if row[9] is None:
+                continue
+            agent_id, ts_us, tokens = row[3], row[10], row[11:15]
+            totals = buckets.setdefault((agent_id, ts_us // width * width), [0] * 5)
+            totals[0] += 1
+            for i, value in enumerate(tokens, start=1):
+                totals[i] += value
+        if buckets:
+            conn.executemany(
+                _UPSERT_USAGE_ROLLUP,
+                [(*key, *totals) for key, totals in buckets.items()],
             )
 
+    @property
+    def write_behind_active(self) -> bool:
+        return self._flush_task is not None and not self._flush_task.done()
+
+    def start_write_behind(self):
+        """Start the background flush task (called from the app lifespan)."""
+        if not self.write_behind_active:
+            self._flush_loop_ref = asyncio.get_running_loop()
+            self._flush_wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+            logger.info("Started conversation store write-behind flusher")
+
+    async def stop_write_behind(self):
+        """Stop the flush task and write out anything still buffered."""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+        flushed = await db_executor.run(self.flush)
+        logger.info(f"Stopped write-behind flusher ({flushed} rows flushed on shutdown)")
+
+    async def _flush_loop(self):
+        interval = settings.db_flush_interval_ms / 1000
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._flush_wakeup.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_wakeup.clear()
+                if self._pending_count:
+                    await db_executor.run(self.flush)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+    def write_behind_stats(self) -> dict:
+        return {
+            "active": self.write_behind_active,
+            "pending_rows": self._pending_count,
+            "flushes": self._flushes,
+            "rows_flushed": self._rows_flushed,
+            "rows_dropped": self._rows_dropped,
+            "avg_batch_size": round(self._rows_flushed / self._flushes, 2) if self._flushes else 0.0,
+        }
+
+    # --- WebSocket event log ---
+
+    def log_ws_event(self, seq: int, event: str, frame: str) -> None:
+        """Record a sequenced broadcast frame (buffered)."""
+        self._enqueue("ws_event_log", (seq, event, frame, to_epoch_us(datetime.now(timezone.utc))))
+
+    def latest_ws_seq(self) -> int:
+        with self._get_connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM ws_event_log").fetchone()[0]
+
+    def trim_ws_events(self, before_seq: int) -> int:
+        """Delete logged frames numbered below before_seq; returns the count."""
+        with self._get_connection() as conn:
+            return conn.execute("DELETE FROM ws_event_log WHERE seq < ?", (before_seq,)).rowcount
+
+    def get_ws_events(self, after_seq: int, before_seq: int, limit: int) -> list[tuple[int, str, str]]:
+        """(seq, event, frame) for after_seq < seq < before_seq, oldest first."""
+        with self._get_connection() as conn:
+            rows = conn.execute(
+                "SELECT seq, event, frame FROM ws_event_log WHERE seq > ? AND seq < ? ORDER BY seq LIMIT ?",
+                (after_seq, before_seq, limit),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    # --- Messages ---
+
+    def store_message(self, message: Message) -> None:
+        """Store a message in the database (buffered)."""
+        self._enqueue("messages", (
+            message.id,
+            message.timestamp.isoformat(),
+            message.from_agent,
+            message.to_agent,
+            message.type.value,
+            message.content,
+            json.dumps(message.metadata) if message.metadata else None,
+            message.task_status.value if message.task_status else None,
+            to_epoch_us(message.timestamp),
+        ))
+
     def count_messages(self, agent_id: Optional[str] = None) -> int:
-        """Count total messages in the database, optionally filtered by agent."""
+        """Count messages, optionally filtered by agent.
+
+        Served from a cache that write-behind flushes keep incrementally up
+        to date and that is recounted every db_count_cache_seconds, so the
+        value is approximate (re-stored messages may be counted twice until
+        the next recount).
+        """
+        key = agent_id or None
+        now = time.monotonic()
+        with self._count_lock:
+            cached = self._count_cache.get(key)
+            if cached and now - cached[1] < settings.db_count_cache_seconds:
+                return cached[0]
+
         with self._get_connection() as conn:
             if agent_id:
                 cursor = conn.execute(
-                    "SELECT COUNT(*) FROM messages WHERE from_agent = ? OR to_agent = ?",
-                    (agent_id, agent_id),
+                    "SELECT COUNT(*) FROM message_participants WHERE agent_id = ?",
+                    (agent_id,),
                 )
             else:
                 cursor = conn.execute("SELECT COUNT(*) FROM messages")
-            return cursor.fetchone()[0]
+            total = cursor.fetchone()[0]
+
+        with self._count_lock:
+            self._count_cache[key] = (total, now)
+        return total
+
+    def invalidate_message_counts(self):
+        """Drop cached totals (after bulk deletes) so the next call recounts."""
+        with self._count_lock:
+            self._count_cache.clear()
+
+    def _bump_message_counts(self, rows: list[tuple]):
+        """Advance cached message counts for freshly flushed message rows."""
+        with self._count_lock:
+            for row in rows:
+                from_agent, to_agent = row[2], row[3]
+                for key in {None, from_agent, to_agent}:
+                    cached = self._count_cache.get(key)
+                    if cached:
+                        self._count_cache[key] = (cached[0] + 1, cached[1])
+
+    @staticmethod
+    def _keyset(
+        before: Optional[Cursor],
+        after: Optional[Cursor],
+        newest_first: bool,
+        ts_col: str = "ts_us",
+        id_col: str = "id",
+    ) -> tuple[list[str], list, str, bool]:
+        """Build keyset pagination over (ts_us, id).
+
+        Returns (conditions, params, order_by, reverse). When paging against
+        the display order the query runs in the opposite direction (so LIMIT
+        picks the rows nearest the cursor) and `reverse` says to flip the
+        fetched rows back into display order.
+        """
+        conditions: list[str] = []
+        params: list = []
+        if before:
+            conditions.append(f"({ts_col}, {id_col}) < (?, ?)")
+            params.extend(before)
+        if after:
+            conditions.append(f"({ts_col}, {id_col}) > (?, ?)")
+            params.extend(after)
+
+        # Walk away from whichever cursor was given; plain pages use display order
+        if after and not before:
+            descending = False
+        elif before and not after:
+            descending = True
+        else:
+            descending = newest_first
+        direction = "DESC" if descending else "ASC"
+        order_by = f"ORDER BY {ts_col} {direction}, {id_col} {direction}"
+        return conditions, params, order_by, descending != newest_first
 
     def get_messages(
         self,
         limit: int = 50,
         offset: int = 0,
-        agent_id: Optional[str] = None
+        agent_id: Optional[str] = None,
+        before: Optional[Cursor] = None,
+        after: Optional[Cursor] = None,
     ) -> List[Message]:
-        """Retrieve messages from the database."""
-        with self._get_connection() as conn:
-            if agent_id:
-                cursor = conn.execute(
-                    """
-                    SELECT * FROM messages
-                    WHERE from_agent = ? OR to_agent = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ? OFFSET ?
-                    """,
-                    (agent_id, agent_id, limit, offset)
-                )
-            else:
-                cursor = conn.execute(
-                    """
-                    SELECT * FROM messages
-                    ORDER BY timestamp DESC
-                    LIMIT ? OFFSET ?
-                    """,
-                    (limit, offset)
-                )
+        """Retrieve messages, newest first.
 
-            messages = []
-            for row in cursor.fetchall():
-                messages.append(Message(
-                    id=row["id"],
-                    timestamp=datetime.fromisoformat(row["timestamp"]),
-                    from_agent=row["from_agent"],
-                    to_agent=row["to_agent"],
-                    type=MessageType(row["type"]),
-                    content=row["content"],
-                    metadata=json.loads(row["metadata"]) if row["metadata"] else None,
-                    task_status=TaskStatus(row["task_status"]) if row["task_status"] else None,
-                ))
-            return messages
+        `before`/`after` are decoded (ts_us, id) cursors; prefer them
+        over `offset`, which degrades into a scan on deep pages.
+        """
+        if agent_id:
+            # Range scan over the participant index, then point lookups
+            conditions, params, order_by, reverse = self._keyset(
+                before, after, newest_first=True, ts_col="p.ts_us", id_col="p.message_id",
+            )
+            conditions.insert(0, "p.agent_id = ?")
+            params.insert(0, agent_id)
+            query = f"""
+                SELECT m.* FROM message_participants p
+                JOIN messages m ON m.id = p.message_id
+                WHERE {' AND '.join(conditions)}
+                {order_by}
+                LIMIT ? OFFSET ?
+            """
+        else:
+            conditions, params, order_by, reverse = self._keyset(before, after, newest_first=True)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            query = f"""
+                SELECT * FROM messages
+                {where}
+                {order_by}
+                LIMIT ? OFFSET ?
+            """
+        params.extend([limit, offset])
+
+        with self._get_connection() as conn:
+            cursor = conn.execute(query, params)
+            messages = [self._row_to_message(row) for row in cursor.fetchall()]
+        if reverse:
+            messages.reverse()
+        return messages
 
     def update_message_status(self, message_id: str, status: TaskStatus) -> bool:
         """Update the task_status of a message. Returns True if a row was updated."""
+        # The message may still be in the write-behind buffer
+        self.flush()
         with self._get_connection() as conn:
             cursor = conn.execute(
                 "UPDATE messages SET task_status = ? WHERE id = ?",
@@ -220,43 +995,27 @@ class ConversationStore:
         status: Optional[TaskStatus] = None,
         limit: int = 50,
         offset: int = 0,
+        before: Optional[Cursor] = None,
     ) -> List[Message]:
         """Get messages that have a task_status, optionally filtered by status."""
-        with self._get_connection() as conn:
-            if status:
-                cursor = conn.execute(
-                    """
-                    SELECT * FROM messages
-                    WHERE task_status IS NOT NULL AND task_status = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ? OFFSET ?
-                    """,
-                    (status.value, limit, offset),
-                )
-            else:
-                cursor = conn.execute(
-                    """
-                    SELECT * FROM messages
-                    WHERE task_status IS NOT NULL
-                    ORDER BY timestamp DESC
-                    LIMIT ? OFFSET ?
-                    """,
-                    (limit, offset),
-                )
+        conditions, params, order_by, _ = self._keyset(before, None, newest_first=True)
+        conditions.insert(0, "task_status IS NOT NULL")
+        if status:
+            conditions.insert(1, "task_status = ?")
+            params.insert(0, status.value)
+        params.extend([limit, offset])
 
-            messages = []
-            for row in cursor.fetchall():
-                messages.append(Message(
-                    id=row["id"],
-                    timestamp=datetime.fromisoformat(row["timestamp"]),
-                    from_agent=row["from_agent"],
-                    to_agent=row["to_agent"],
-                    type=MessageType(row["type"]),
-                    content=row["content"],
-                    metadata=json.loads(row["metadata"]) if row["metadata"] else None,
-                    task_status=TaskStatus(row["task_status"]) if row["task_status"] else None,
-                ))
-            return messages
+        with self._get_connection() as conn:
+            cursor = conn.execute(
+                f"""
+                SELECT * FROM messages
+                WHERE {' AND '.join(conditions)}
+                {order_by}
+                LIMIT ? OFFSET ?
+                """,
+                params,
+            )
+            return [self._row_to_message(row) for row in cursor.fetchall()]
 
     def archive_agent(
         self,
@@ -277,11 +1036,15 @@ class ConversationStore:
             Archive ID
         """
         archive_id = str(uuid.uuid4())
+        archived_at = datetime.now(timezone.utc)
         with self._get_connection() as conn:
-            conn.execute(
+            # A deleted archive's rowid can be reused; clear its index entry first
+            while self._purge_deleted_archives(conn, 100) == 100:
+                pass
+            cursor = conn.execute(
                 """
                 INSERT INTO agent_archives
-                (id, agent_id, agent_name, agent_type, archived_at, terminal_output)
+                (id, agent_id, agent_name, agent_type, archived_at, archived_at_us)
                 VALUES (?, ?, ?, ?, ?, ?)
                 """,
                 (
@@ -289,10 +1052,18 @@ class ConversationStore:
                     agent_id,
                     agent_name,
                     agent_type,
-                    datetime.now(timezone.utc).isoformat(),
-                    terminal_output,
+                    archived_at.isoformat(),
+                    to_epoch_us(archived_at),
                 )
             )
+            if terminal_output is not None:
+                rowid = cursor.lastrowid
+                size = _write_archive_chunks(conn, archive_id, terminal_output)
+                conn.execute("UPDATE agent_archives SET output_size = ? WHERE id = ?", (size, archive_id))
+                conn.execute(
+                    "INSERT INTO agent_archives_fts (rowid, terminal_output) VALUES (?, ?)",
+                    (rowid, terminal_output),
+                )
         return archive_id
 
     def get_archived_agents(self) -> List[ArchivedAgentSummary]:
@@ -302,19 +1073,10 @@ class ConversationStore:
                 """
                 SELECT id, agent_id, agent_name, agent_type, archived_at
                 FROM agent_archives
-                ORDER BY archived_at DESC
+                ORDER BY archived_at_us DESC
                 """
             )
-            return [
-                ArchivedAgentSummary(
-                    id=row["id"],
-                    agent_id=row["agent_id"],
-                    agent_name=row["agent_name"],
-                    agent_type=row["agent_type"],
-                    archived_at=datetime.fromisoformat(row["archived_at"]),
-                )
-                for row in cursor.fetchall()
-            ]
+            return [self._row_to_archive_summary(row) for row in cursor.fetchall()]
 
     def get_archive(self, archive_id: str) -> Optional[ArchivedAgent]:
         """Get a specific archive by ID (with terminal output)."""
@@ -328,14 +1090,7 @@ class ConversationStore:
             row = cursor.fetchone()
             if not row:
                 return None
-            return ArchivedAgent(
-                id=row["id"],
-                agent_id=row["agent_id"],
-                agent_name=row["agent_name"],
-                agent_type=row["agent_type"],
-                archived_at=datetime.fromisoformat(row["archived_at"]),
-                terminal_output=row["terminal_output"],
-            )
+            return self._row_to_archive(conn, row)
 
     def get_archive_by_agent_id(self, agent_id: str) -> Optional[ArchivedAgent]:
         """Get the most recent archive for an agent ID."""
@@ -344,7 +1099,7 @@ class ConversationStore:
                 """
                 SELECT * FROM agent_archives
                 WHERE agent_id = ?
-                ORDER BY archived_at DESC
+                ORDER BY archived_at_us DESC
                 LIMIT 1
                 """,
                 (agent_id,)
@@ -352,14 +1107,152 @@ class ConversationStore:
             row = cursor.fetchone()
             if not row:
                 return None
-            return ArchivedAgent(
-                id=row["id"],
-                agent_id=row["agent_id"],
-                agent_name=row["agent_name"],
-                agent_type=row["agent_type"],
-                archived_at=datetime.fromisoformat(row["archived_at"]),
-                terminal_output=row["terminal_output"],
+            return self._row_to_archive(conn, row)
+
+    def get_archive_manifest(self, archive_id: str) -> Optional[tuple[ArchivedAgentSummary, list[str]]]:
+        """Archive summary plus its ordered chunk hashes, for streaming the output.
+
+        Raises ArchiveIncompleteError if any chunk is missing.
+        """
+        with self._get_connection() as conn:
+            row = conn.execute(
+                "SELECT id, agent_id, agent_name, agent_type, archived_at FROM agent_archives WHERE id = ?",
+                (archive_id,),
+            ).fetchone()
+            if not row:
+                return None
+            cursor = conn.execute(
+                """
+                SELECT r.hash, c.hash IS NOT NULL FROM archive_chunk_refs r
+                LEFT JOIN archive_chunks c ON c.hash = r.hash
+                WHERE r.archive_id = ?
+                ORDER BY r.seq
+                """,
+                (archive_id,),
+            )
+            refs = cursor.fetchall()
+        missing = sum(1 for _, present in refs if not present)
+        if missing:
+            raise ArchiveIncompleteError(f"{missing} of {len(refs)} archive chunks are missing")
+        return self._row_to_archive_summary(row), [h for h, _ in refs]
+
+    def read_archive_chunks(self, hashes: list[str]) -> list[str]:
+        """Decompressed chunk contents, in the order given.
+
+        Raises ArchiveIncompleteError if any of them is missing.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.execute(
+                f"SELECT hash, data FROM archive_chunks WHERE hash IN ({', '.join('?' * len(hashes))})",
+                hashes,
+            )
+            data = {row["hash"]: row["data"] for row in cursor.fetchall()}
+        missing = len(set(hashes) - data.keys())
+        if missing:
+            raise ArchiveIncompleteError(f"{missing} of {len(set(hashes))} archive chunks are missing")
+        return [inflate(data[h]) for h in hashes]
+
+    def purge_deleted_archives(self, limit: int = 100) -> int:
+        """Drop index entries and chunk refs of up to `limit` deleted archives.
+
+        Chunks no longer referenced are left for the maintenance pass.
+        Returns the number of archives purged.
+        """
+        with self._get_connection() as conn:
+            return self._purge_deleted_archives(conn, limit)
+
+    @staticmethod
+    def _purge_deleted_archives(conn: sqlite3.Connection, limit: int) -> int:
+        deleted = conn.execute(
+            "SELECT archive_rowid, archive_id FROM deleted_archives LIMIT ?", (limit,)
+        ).fetchall()
+        rebuild = False
+        for archive_rowid, archive_id in deleted:
+            indexed = conn.execute(
+                "SELECT 1 FROM agent_archives_fts_docsize WHERE id = ?", (archive_rowid,)
+            ).fetchone()
+            if indexed:
+                refs, found, text = conn.execute(
+                    """
+                    SELECT COUNT(*), COUNT(data), group_concat(inflate(data), '') FROM (
+                        SELECT c.data AS data
+                        FROM archive_chunk_refs r LEFT JOIN archive_chunks c ON c.hash = r.hash
+                        WHERE r.archive_id = ?
+                        ORDER BY r.seq
+                    )
+                    """,
+                    (archive_id,),
+                ).fetchone()
+                if refs != found:
+                    # The indexed text can't be reassembled: rebuild instead
+                    rebuild = True
+                else:
+                    conn.execute(
+                        "INSERT INTO agent_archives_fts (agent_archives_fts, rowid, terminal_output) "
+                        "VALUES ('delete', ?, ?)",
+                        (archive_rowid, text or ""),
+                    )
+            conn.execute("DELETE FROM archive_chunk_refs WHERE archive_id = ?", (archive_id,))
+            conn.execute("DELETE FROM deleted_archives WHERE archive_rowid = ?", (archive_rowid,))
+        if rebuild:
+            conn.execute("INSERT INTO agent_archives_fts (agent_archives_fts) VALUES ('rebuild')")
+        return len(deleted)
+
+    def archive_storage_stats(self) -> dict:
+        """Uncompressed vs stored size of archived terminal output."""
+        with self._get_connection() as conn:
+            archives, raw_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(output_size), 0) FROM agent_archives"
+            ).fetchone()
+            chunks, chunk_bytes, stored_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length(data)), 0) FROM archive_chunks"
+            ).fetchone()
+        return {
+            "archives": archives,
+            "chunks": chunks,
+            "raw_bytes": raw_bytes,
+            "unique_bytes": chunk_bytes,
+            "stored_bytes": stored_bytes,
+            "ratio": round(stored_bytes / raw_bytes, 4) if raw_bytes else 0.0,
+        }
+
+    @staticmethod
+    def _row_to_archive_summary(row: sqlite3.Row) -> ArchivedAgentSummary:
+        return ArchivedAgentSummary(
+            id=row["id"],
+            agent_id=row["agent_id"],
+            agent_name=row["agent_name"],
+            agent_type=row["agent_type"],
+            archived_at=datetime.fromisoformat(row["archived_at"]),
+        )
+
+    @staticmethod
+    def _row_to_archive(conn: sqlite3.Connection, row: sqlite3.Row) -> ArchivedAgent:
+        """Convert an agent_archives row, reassembling chunked terminal output."""
+        terminal_output = row["terminal_output"]
+        if terminal_output is None and row["output_size"] is not None:
+            cursor = conn.execute(
+                """
+                SELECT c.data FROM archive_chunk_refs r
+                LEFT JOIN archive_chunks c ON c.hash = r.hash
+                WHERE r.archive_id = ?
+                ORDER BY r.seq
+                """,
+                (row["id"],),
             )
+            chunks = [r[0] for r in cursor.fetchall()]
+            missing = chunks.count(None)
+            if missing:
+                raise ArchiveIncompleteError(f"{missing} of {len(chunks)} archive chunks are missing")
+            terminal_output = "".join(inflate(data) for data in chunks)
+        return ArchivedAgent(
+            id=row["id"],
+            agent_id=row["agent_id"],
+            agent_name=row["agent_name"],
+            agent_type=row["agent_type"],
+            archived_at=datetime.fromisoformat(row["archived_at"]),
+            terminal_output=terminal_output,
+        )
 
     def get_messages_for_agent(self, agent_id: str, limit: int = 200) -> List[Message]:
         """Get all messages involving a specific agent."""
@@ -370,6 +1263,8 @@ class ConversationStore:
         agent_id: str,
         limit: int = 200,
         offset: int = 0,
+        before: Optional[Cursor] = None,
+        after: Optional[Cursor] = None,
     ) -> tuple[Optional[Message], List[Message], int]:
         """Get inbox data for an agent: pinned task, messages, and total count.
 
@@ -377,14 +1272,24 @@ class ConversationStore:
             Tuple of (pinned_task, messages, total_count).
             pinned_task is the first [TASK] message sent TO this agent, or None.
             messages are ordered ASC (oldest first) for inbox view.
+            total_count is approximate (see count_messages).
         """
+        total = self.count_messages(agent_id=agent_id)
+
+        conditions, params, order_by, reverse = self._keyset(
+            before, after, newest_first=False, ts_col="p.ts_us", id_col="p.message_id",
+        )
+        conditions.insert(0, "p.agent_id = ?")
+        params.insert(0, agent_id)
+        params.extend([limit, offset])
+
         with self._get_connection() as conn:
             # 1. Pinned task: first [TASK] message sent TO this agent
             cursor = conn.execute(
                 """
                 SELECT * FROM messages
                 WHERE to_agent = ? AND content LIKE '[TASK]%'
-                ORDER BY timestamp ASC
+                ORDER BY ts_us ASC
                 LIMIT 1
                 """,
                 (agent_id,),
@@ -392,26 +1297,22 @@ class ConversationStore:
             pinned_row = cursor.fetchone()
             pinned_task = self._row_to_message(pinned_row) if pinned_row else None
 
-            # 2. Total count of messages involving this agent
+            # 2. Messages involving this agent, ordered ASC (oldest first)
             cursor = conn.execute(
-                "SELECT COUNT(*) FROM messages WHERE from_agent = ? OR to_agent = ?",
-                (agent_id, agent_id),
-            )
-            total = cursor.fetchone()[0]
-
-            # 3. Messages involving this agent, ordered ASC (oldest first)
-            cursor = conn.execute(
-                """
-                SELECT * FROM messages
-                WHERE from_agent = ? OR to_agent = ?
-                ORDER BY timestamp ASC
+                f"""
+                SELECT m.* FROM message_participants p
+                JOIN messages m ON m.id = p.message_id
+                WHERE {' AND '.join(conditions)}
+                {order_by}
                 LIMIT ? OFFSET ?
                 """,
-                (agent_id, agent_id, limit, offset),
+                params,
             )
             messages = [self._row_to_message(row) for row in cursor.fetchall()]
+        if reverse:
+            messages.reverse()
 
-            return pinned_task, messages, total
+        return pinned_task, messages, total
 
     @staticmethod
     def _row_to_message(row: sqlite3.Row) -> Message:
@@ -430,27 +1331,21 @@ class ConversationStore:
     # --- Agent Events ---
 
     def store_event(self, event_data: dict) -> None:
-        """Store an agent event."""
-        with self._get_connection() as conn:
-            conn.execute(
-                """
-                INSERT OR REPLACE INTO agent_events
-                (id, event_type, session_id, agent_id, tool_name, tool_input, tool_output, timestamp, message_id, usage)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    event_data["id"],
-                    event_data["event_type"],
-                    event_data["session_id"],
-                    event_data["agent_id"],
-                    event_data.get("tool_name"),
-                    json.dumps(event_data.get("tool_input")) if event_data.get("tool_input") is not None else None,
-                    json.dumps(event_data.get("tool_output")) if event_data.get("tool_output") is not None else None,
-                    event_data["timestamp"],
-                    event_data.get("message_id"),
-                    json.dumps(event_data.get("usage")) if event_data.get("usage") is not None else None,
-                ),
-            )
+        """Store an agent event (buffered)."""
+        self._enqueue("agent_events", (
+            event_data["id"],
+            event_data["event_type"],
+            event_data["session_id"],
+            event_data["agent_id"],
+            event_data.get("tool_name"),
+            json.dumps(event_data.get("tool_input")) if event_data.get("tool_input") is not None else None,
+            json.dumps(event_data.get("tool_output")) if event_data.get("tool_output") is not None else None,
+            event_data["timestamp"],
+            event_data.get("message_id"),
+            json.dumps(event_data.get("usage")) if event_data.get("usage") is not None else None,
+            to_epoch_us(event_data["timestamp"]),
+            *_usage_tokens(event_data.get("usage")),
+        ))
 
     def link_events_to_message(self, agent_id: str, message_id: str, since_event_id: Optional[str] = None) -> int:
         """Link unlinked tool call events for an agent to a message.
@@ -470,7 +1365,7 @@ class ConversationStore:
                     WHERE agent_id = ?
                       AND message_id IS NULL
                       AND event_type = 'PostToolUse'
-                      AND timestamp >= (SELECT timestamp FROM agent_events WHERE id = ?)
+                      AND ts_us >= (SELECT ts_us FROM agent_events WHERE id = ?)
                     """,
                     (message_id, agent_id, since_event_id),
                 )
@@ -495,7 +1390,7 @@ class ConversationStore:
                 """
                 SELECT * FROM agent_events
                 WHERE message_id = ?
-                ORDER BY timestamp ASC
+                ORDER BY ts_us ASC
                 """,
                 (message_id,),
             )
@@ -506,32 +1401,36 @@ class ConversationStore:
         session_id: Optional[str] = None,
         agent_id: Optional[str] = None,
         limit: int = 50,
+        before: Optional[Cursor] = None,
+        after: Optional[Cursor] = None,
     ) -> list[dict]:
-        """Get recent agent events with optional filters."""
-        with self._get_connection() as conn:
-            conditions = []
-            params: list = []
+        """Get recent agent events (newest first) with optional filters and cursors."""
+        conditions, params, order_by, reverse = self._keyset(before, after, newest_first=True)
 
-            if session_id:
-                conditions.append("session_id = ?")
-                params.append(session_id)
-            if agent_id:
-                conditions.append("agent_id = ?")
-                params.append(agent_id)
+        if session_id:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if agent_id:
+            conditions.append("agent_id = ?")
+            params.append(agent_id)
 
-            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
-            params.append(limit)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
 
+        with self._get_connection() as conn:
             cursor = conn.execute(
                 f"""
                 SELECT * FROM agent_events
                 {where}
-                ORDER BY timestamp DESC
+                {order_by}
                 LIMIT ?
                 """,
                 params,
             )
-            return [self._row_to_event(row) for row in cursor.fetchall()]
+            events = [self._row_to_event(row) for row in cursor.fetchall()]
+        if reverse:
+            events.reverse()
+        return events
 
     def get_event_sessions(self) -> list[dict]:
         """List all sessions that have sent events."""
@@ -543,10 +1442,10 @@ class ConversationStore:
                        MAX(timestamp) as last_event,
                        (SELECT event_type FROM agent_events e2
                         WHERE e2.session_id = e1.session_id
-                        ORDER BY timestamp DESC LIMIT 1) as last_event_type
+                        ORDER BY ts_us DESC LIMIT 1) as last_event_type
                 FROM agent_events e1
                 GROUP BY session_id
-                ORDER BY last_event DESC
+                ORDER BY MAX(ts_us) DESC
                 """
             )
             return [
@@ -562,53 +1461,50 @@ class ConversationStore:
     # --- Thoughts ---
 
     def store_thought(self, thought_data: dict) -> None:
-        """Store an agent thought."""
-        with self._get_connection() as conn:
-            conn.execute(
-                """
-                INSERT OR REPLACE INTO thoughts
-                (id, agent_name, thought_type, content, tool_name, tool_input, tool_response, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    thought_data["id"],
-                    thought_data["agent_name"],
-                    thought_data["thought_type"],
-                    thought_data.get("content"),
-                    thought_data.get("tool_name"),
-                    thought_data.get("tool_input"),
-                    thought_data.get("tool_response"),
-                    thought_data["timestamp"],
-                ),
-            )
+        """Store an agent thought (buffered)."""
+        self._enqueue("thoughts", (
+            thought_data["id"],
+            thought_data["agent_name"],
+            thought_data["thought_type"],
+            thought_data.get("content"),
+            thought_data.get("tool_name"),
+            thought_data.get("tool_input"),
+            thought_data.get("tool_response"),
+            thought_data["timestamp"],
+            to_epoch_us(thought_data["timestamp"]),
+        ))
 
     def get_thoughts(
         self,
         agent_name: Optional[str] = None,
         limit: int = 50,
+        before: Optional[Cursor] = None,
+        after: Optional[Cursor] = None,
     ) -> list[dict]:
-        """Get recent thoughts with optional agent_name filter."""
-        with self._get_connection() as conn:
-            conditions = []
-            params: list = []
+        """Get recent thoughts (newest first) with optional agent_name filter and cursors."""
+        conditions, params, order_by, reverse = self._keyset(before, after, newest_first=True)
 
-            if agent_name:
-                conditions.append("agent_name = ?")
-                params.append(agent_name)
+        if agent_name:
+            conditions.append("agent_name = ?")
+            params.append(agent_name)
 
-            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
-            params.append(limit)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
 
+        with self._get_connection() as conn:
             cursor = conn.execute(
                 f"""
                 SELECT * FROM thoughts
                 {where}
-                ORDER BY timestamp DESC
+                {order_by}
                 LIMIT ?
                 """,
                 params,
             )
-            return [self._row_to_thought(row) for row in cursor.fetchall()]
+            thoughts = [self._row_to_thought(row) for row in cursor.fetchall()]
+        if reverse:
+            thoughts.reverse()
+        return thoughts
 
     @staticmethod
     def _row_to_thought(row: sqlite3.Row) -> dict:
@@ -645,79 +1541,278 @@ class ConversationStore:
             result["usage"] = None
         return result
 
+    # --- Search ---
+
+    @staticmethod
+    def _search_arm(source: str) -> tuple[str, str, str]:
+        """(select, agent condition, ts column) for one source of search()."""
+        if source == "messages":
+            select = """
+                SELECT 'messages' AS source, m.id AS id, m.from_agent AS agent_id, m.to_agent AS to_agent,
+                       m.type AS kind, m.timestamp AS timestamp, m.ts_us AS ts_us,
+                       snippet(messages_fts, -1, ?, ?, '…', ?) AS snippet, bm25(messages_fts) AS rank
+                FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid
+                WHERE messages_fts MATCH ?
+            """
+            return select, "(m.from_agent = ? OR m.to_agent = ?)", "m.ts_us"
+        if source == "thoughts":
+            select = """
+                SELECT 'thoughts' AS source, t.id AS id, t.agent_name AS agent_id, NULL AS to_agent,
+                       t.thought_type AS kind, t.timestamp AS timestamp, t.ts_us AS ts_us,
+                       snippet(thoughts_fts, -1, ?, ?, '…', ?) AS snippet, bm25(thoughts_fts) AS rank
+                FROM thoughts_fts JOIN thoughts t ON t.rowid = thoughts_fts.rowid
+                WHERE thoughts_fts MATCH ?
+            """
+            return select, "t.agent_name = ?", "t.ts_us"
+        if source == "archives":
+            select = """
+                SELECT 'archives' AS source, a.id AS id, a.agent_id AS agent_id, NULL AS to_agent,
+                       a.agent_type AS kind, a.archived_at AS timestamp, a.archived_at_us AS ts_us,
+                       snippet(agent_archives_fts, -1, ?, ?, '…', ?) AS snippet, bm25(agent_archives_fts) AS rank
+                FROM agent_archives_fts JOIN agent_archives a ON a.rowid = agent_archives_fts.rowid
+                WHERE agent_archives_fts MATCH ?
+            """
+            return select, "a.agent_id = ?", "a.archived_at_us"
+        raise ValueError(f"Unknown search source: {source}")
+
+    def search(
+        self,
+        query: str,
+        sources: Sequence[str] = SEARCH_SOURCES,
+        agent_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        order: str = "rank",
+        limit: int = 20,
+        offset: int = 0,
+    ) -> list[dict]:
+        """Full-text search across messages, thoughts and archived terminal output.
+
+        `query` uses FTS5 syntax (see to_fts_query for free text). Results are
+        ordered by bm25 relevance, or newest first with order="recent".
+        Raises ValueError for unknown sources or a malformed query.
+        """
+        arms: list[str] = []
+        params: list = []
+        for source in sources:
+            select, agent_condition, ts_col = self._search_arm(source)
+            conditions = [select]
+            params.extend([_SNIPPET_OPEN, _SNIPPET_CLOSE, _SNIPPET_TOKENS, query])
+            if agent_id:
+                conditions.append(agent_condition)
+                params.extend([agent_id] * agent_condition.count("?"))
+            if since is not None:
+                conditions.append(f"{ts_col} >= ?")
+                params.append(to_epoch_us(since))
+            if until is not None:
+                conditions.append(f"{ts_col} < ?")
+                params.append(to_epoch_us(until))
+            arms.append(" AND ".join(conditions))
+        if not arms:
+            return []
+
+        order_by = "ts_us DESC, rank" if order == "recent" else "rank, ts_us DESC"
+        params.extend([limit, offset])
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute(
+                    f"""
+                    SELECT * FROM ({' UNION ALL '.join(arms)})
+                    ORDER BY {order_by}
+                    LIMIT ? OFFSET ?
+                    """,
+                    params,
+                )
+                rows = cursor.fetchall()
+        except sqlite3.OperationalError as e:
+            if "fts5" in str(e) or "syntax error" in str(e):
+                raise ValueError(f"Invalid search query: {e}") from e
+            raise
+
+        return [
+            {
+                "source": row["source"],
+                "id": row["id"],
+                "agent_id": row["agent_id"],
+                "to_agent": row["to_agent"],
+                "kind": row["kind"],
+                "timestamp": row["timestamp"],
+                "snippet": row["snippet"],
+                "score": round(-row["rank"], 4),
+            }
+            for row in rows
+        ]
+
     # --- Budget / Token Usage ---
 
-    def get_budget_summary(self) -> list[dict]:
-        """Get per-agent token usage totals from events with usage data."""
+    @staticmethod
+    def _rollup_range(since: Optional[datetime], until: Optional[datetime]) -> tuple[list[str], list]:
+        """Conditions on usage_rollup.bucket_start for a time window.
+
+        Rollups are hourly at the finest, so `since` is rounded down to the
+        start of its hour and a partial hour before `until` counts in full.
+        """
+        conditions: list[str] = []
+        params: list = []
+        if since is not None:
+            width = USAGE_BUCKETS["hour"]
+            conditions.append("bucket_start >= ?")
+            params.append(to_epoch_us(since) // width * width)
+        if until is not None:
+            conditions.append("bucket_start < ?")
+            params.append(to_epoch_us(until))
+        return conditions, params
+
+    @staticmethod
+    def _usage_totals(row: sqlite3.Row) -> dict:
+        return {
+            "input_tokens": row["input_tokens"] or 0,
+            "output_tokens": row["output_tokens"] or 0,
+            "cache_read_tokens": row["cache_read_tokens"] or 0,
+            "cache_creation_tokens": row["cache_creation_tokens"] or 0,
+            "event_count": row["event_count"] or 0,
+        }
+
+    def _usage_series(
+        self,
+        conn: sqlite3.Connection,
+        bucket: str,
+        conditions: list[str],
+        params: list,
+    ) -> list[dict]:
+        """Token usage per bucket (summed over the agents matched by conditions).
+
+        Every width is summed from the hourly rollups, so the series covers
+        exactly the hours the totals do: a day bucket cut by the window only
+        counts its hours inside it.
+        """
+        width = USAGE_BUCKETS[bucket]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = conn.execute(
+            f"""
+            SELECT
+                bucket_start / ? * ? as bucket,
+                SUM(event_count) as event_count,
+                SUM(input_tokens) as input_tokens,
+                SUM(output_tokens) as output_tokens,
+                SUM(cache_read_tokens) as cache_read_tokens,
+                SUM(cache_creation_tokens) as cache_creation_tokens
+            FROM usage_rollup
+            {where}
+            GROUP BY bucket
+            ORDER BY bucket
+            """,
+            [width, width, *params],
+        )
+        return [
+            {"bucket_start": _from_epoch_us(row["bucket"]), **self._usage_totals(row)}
+            for row in cursor.fetchall()
+        ]
+
+    def get_budget_summary(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        bucket: Optional[str] = None,
+    ) -> dict:
+        """Get per-agent token usage totals from the hourly rollups.
+
+        With `bucket` ("hour" or "day") the result also carries a time series
+        summed across agents.
+        """
+        conditions, params = self._rollup_range(since, until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
         with self._get_connection() as conn:
             cursor = conn.execute(
-                """
+                f"""
                 SELECT
                     agent_id,
-                    COUNT(*) as event_count,
-                    SUM(json_extract(usage, '$.input_tokens')) as input_tokens,
-                    SUM(json_extract(usage, '$.output_tokens')) as output_tokens,
-                    SUM(json_extract(usage, '$.cache_read_input_tokens')) as cache_read_tokens,
-                    SUM(json_extract(usage, '$.cache_creation_input_tokens')) as cache_creation_tokens
-                FROM agent_events
-                WHERE usage IS NOT NULL
+                    SUM(event_count) as event_count,
+                    SUM(input_tokens) as input_tokens,
+                    SUM(output_tokens) as output_tokens,
+                    SUM(cache_read_tokens) as cache_read_tokens,
+                    SUM(cache_creation_tokens) as cache_creation_tokens
+                FROM usage_rollup
+                {where}
                 GROUP BY agent_id
                 ORDER BY input_tokens DESC
-                """
+                """,
+                params,
             )
-            return [
-                {
-                    "agent_id": row["agent_id"],
-                    "input_tokens": row["input_tokens"] or 0,
-                    "output_tokens": row["output_tokens"] or 0,
-                    "cache_read_tokens": row["cache_read_tokens"] or 0,
-                    "cache_creation_tokens": row["cache_creation_tokens"] or 0,
-                    "event_count": row["event_count"],
-                }
-                for row in cursor.fetchall()
-            ]
+            result: dict = {
+                "agents": [
+                    {"agent_id": row["agent_id"], **self._usage_totals(row)}
+                    for row in cursor.fetchall()
+                ]
+            }
+            if bucket:
+                result["series"] = self._usage_series(conn, bucket, conditions, params)
+            return result
+
+    def get_agent_budget(
+        self,
+        agent_id: str,
+        limit: int = 50,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        bucket: Optional[str] = None,
+    ) -> dict:
+        """Get token usage detail for a single agent.
+
+        Totals (and the optional `bucket` series) come from the rollups;
+        recent events are read from agent_events within the same window.
+        """
+        conditions, params = self._rollup_range(since, until)
+        conditions.insert(0, "agent_id = ?")
+        params.insert(0, agent_id)
+
+        event_conditions = ["agent_id = ?", "usage IS NOT NULL"]
+        event_params: list = [agent_id]
+        if since is not None:
+            event_conditions.append("ts_us >= ?")
+            event_params.append(to_epoch_us(since))
+        if until is not None:
+            event_conditions.append("ts_us < ?")
+            event_params.append(to_epoch_us(until))
+        event_params.append(limit)
 
-    def get_agent_budget(self, agent_id: str, limit: int = 50) -> dict:
-        """Get token usage detail for a single agent."""
         with self._get_connection() as conn:
             # Totals
             cursor = conn.execute(
-                """
+                f"""
                 SELECT
-                    COUNT(*) as event_count,
-                    SUM(json_extract(usage, '$.input_tokens')) as input_tokens,
-                    SUM(json_extract(usage, '$.output_tokens')) as output_tokens,
-                    SUM(json_extract(usage, '$.cache_read_input_tokens')) as cache_read_tokens,
-                    SUM(json_extract(usage, '$.cache_creation_input_tokens')) as cache_creation_tokens
-                FROM agent_events
-                WHERE agent_id = ? AND usage IS NOT NULL
+                    SUM(event_count) as event_count,
+                    SUM(input_tokens) as input_tokens,
+                    SUM(output_tokens) as output_tokens,
+                    SUM(cache_read_tokens) as cache_read_tokens,
+                    SUM(cache_creation_tokens) as cache_creation_tokens
+                FROM usage_rollup
+                WHERE {' AND '.join(conditions)}
                 """,
-                (agent_id,),
+                params,
             )
-            row = cursor.fetchone()
-            totals = {
-                "agent_id": agent_id,
-                "input_tokens": row["input_tokens"] or 0,
-                "output_tokens": row["output_tokens"] or 0,
-                "cache_read_tokens": row["cache_read_tokens"] or 0,
-                "cache_creation_tokens": row["cache_creation_tokens"] or 0,
-                "event_count": row["event_count"],
-            }
+            totals = {"agent_id": agent_id, **self._usage_totals(cursor.fetchone())}
 
             # Recent events with usage
             cursor = conn.execute(
-                """
+                f"""
                 SELECT * FROM agent_events
-                WHERE agent_id = ? AND usage IS NOT NULL
-                ORDER BY timestamp DESC
+                WHERE {' AND '.join(event_conditions)}
+                ORDER BY ts_us DESC
                 LIMIT ?
                 """,
-                (agent_id, limit),
+                event_params,
             )
             events = [self._row_to_event(r) for r in cursor.fetchall()]
 
-            return {"totals": totals, "recent_events": events}
+            result = {"totals": totals, "recent_events": events}
+            if bucket:
+                result["series"] = self._usage_series(conn, bucket, conditions, params)
+            return result
 
 
 # Singleton instance
 conversation_store = ConversationStore()
+
+# Awaitable facade: every call runs on the db_executor thread pool
+async_conversation_store = AsyncFacade(conversation_store)
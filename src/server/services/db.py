@@ -0,0 +1,365 @@
+"""Shared SQLite connection pooling and the database executor.
+
+Every database file (conversations.db, tasks.db) gets one ConnectionPool.
+Connections are long-lived and owned per thread: SQLite connections are
+cheap to reuse but not safe to share across threads, so each thread that
+touches a database keeps its own connection with pragmas applied once.
+
+Async code never calls sqlite3 directly: it awaits `db_executor.run(...)`,
+which runs the blocking function on a small bounded thread pool (so at
+most db_executor_workers connections per database) and records timings.
+
+Schemas are versioned with `PRAGMA user_version`: each database owns an
+ordered list of migration functions and `ConnectionPool.migrate()` applies
+the ones past the stored version, each in its own transaction.
+"""
+
+import asyncio
+import functools
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Sequence, TypeVar
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+BUSY_TIMEOUT_MS = 5000
+
+# A schema migration: runs inside a transaction and must not commit itself
+# (so no executescript, which issues an implicit COMMIT).
+Migration = Callable[[sqlite3.Connection], None]
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> bool:
+    """Add a column unless it already exists. Returns True if it was added."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+    if column in columns:
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return True
+
+
+def migrate(conn: sqlite3.Connection, migrations: Sequence[Migration]) -> int:
+    """Bring a database up to `len(migrations)` and return the resulting version.
+
+    Version N means migrations[:N] have been applied. Databases created
+    before versioning report 0, so the first migration of each list must be
+    idempotent against an existing schema.
+
+    Each migration is committed as it is applied, so `conn` must not have a
+    transaction open (it would be committed too); RuntimeError if it does.
+    """
+    if conn.in_transaction:
+        raise RuntimeError("migrate() needs a connection without an open transaction")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, migration in enumerate(migrations[version:], start=version + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        logger.info(f"Applied migration {target} ({migration.__name__})")
+    return max(version, len(migrations))
+
+
+class _PooledConnection:
+    """A thread-owned connection plus its transaction nesting depth."""
+
+    __slots__ = ("conn", "depth", "thread_name", "created_at")
+
+    def __init__(self, conn: sqlite3.Connection, thread_name: str):
+        self.conn = conn
+        self.depth = 0
+        self.thread_name = thread_name
+        self.created_at = time.time()
+
+
+class ConnectionPool:
+    """Per-thread pool of long-lived connections to a single SQLite file.
+
+    `connection()` hands out the calling thread's connection, opening it on
+    first use. Nested `connection()` blocks on the same thread share one
+    transaction: only the outermost block commits (or rolls back on error).
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[_PooledConnection] = []
+        self._opened = 0
+        self._checkouts = 0
+        self._commits = 0
+        self._rollbacks = 0
+        self._schema_version: int | None = None
+        # SQL functions installed on every connection: name -> (nargs, fn)
+        self._functions: Dict[str, tuple[int, Callable]] = {}
+
+    def _open(self) -> _PooledConnection:
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        # WAL makes NORMAL durable across application crashes; only an OS
+        # crash can lose the last commits, which is fine for this data.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # INSERT OR REPLACE must fire DELETE triggers so trigger-maintained
+        # tables (e.g. external-content FTS indexes) drop the replaced row
+        conn.execute("PRAGMA recursive_triggers=ON")
+        with self._lock:
+            functions = list(self._functions.items())
+        for name, (nargs, fn) in functions:
+            conn.create_function(name, nargs, fn, deterministic=True)
+        pooled = _PooledConnection(conn, threading.current_thread().name)
+        with self._lock:
+            self._connections.append(pooled)
+            self._opened += 1
+        logger.debug(f"Opened SQLite connection to {self.db_path} for {pooled.thread_name}")
+        return pooled
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Yield this thread's connection, committing when the outermost block exits."""
+        pooled = getattr(self._local, "pooled", None)
+        if pooled is None:
+            pooled = self._open()
+            self._local.pooled = pooled
+
+        self._checkouts += 1
+        pooled.depth += 1
+        try:
+            yield pooled.conn
+        except BaseException:
+            pooled.depth -= 1
+            if pooled.depth == 0:
+                pooled.conn.rollback()
+                self._rollbacks += 1
+            raise
+        else:
+            pooled.depth -= 1
+            if pooled.depth == 0:
+                pooled.conn.commit()
+                self._commits += 1
+
+    def register_function(self, name: str, nargs: int, fn: Callable):
+        """Install a deterministic SQL function on all current and future connections.
+
+        Register before views, triggers or queries that call it are used.
+        """
+        with self._lock:
+            self._functions[name] = (nargs, fn)
+            connections = list(self._connections)
+        for pooled in connections:
+            pooled.conn.create_function(name, nargs, fn, deterministic=True)
+
+    def migrate(self, migrations: Sequence[Migration]) -> int:
+        """Apply pending migrations once per process; later calls are free."""
+        if self._schema_version is None or self._schema_version < len(migrations):
+            with self.connection() as conn:
+                self._schema_version = migrate(conn, migrations)
+        return self._schema_version
+
+    def close_all(self):
+        """Close every connection opened by this pool (server shutdown)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for pooled in connections:
+            try:
+                pooled.conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Error closing SQLite connection to {self.db_path}: {e}")
+        # Threads that come back later get a fresh connection
+        self._local = threading.local()
+
+    def stats(self) -> dict:
+        """Pool counters for observability."""
+        with self._lock:
+            open_connections = len(self._connections)
+            threads = sorted(p.thread_name for p in self._connections)
+        return {
+            "db_path": str(self.db_path),
+            "open_connections": open_connections,
+            "connections_opened": self._opened,
+            "checkouts": self._checkouts,
+            "reuse_ratio": round(1 - self._opened / self._checkouts, 4) if self._checkouts else 0.0,
+            "commits": self._commits,
+            "rollbacks": self._rollbacks,
+            "schema_version": self._schema_version,
+            "threads": threads,
+        }
+
+
+_pools: Dict[Path, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: Path) -> ConnectionPool:
+    """Return the shared pool for a database file, creating it on first use."""
+    key = Path(db_path).resolve()
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(key)
+            _pools[key] = pool
+        return pool
+
+
+def pool_stats() -> list[dict]:
+    """Stats for every pool created in this process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def close_all_pools():
+    """Close all pooled connections (called from the app lifespan on shutdown)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+class _QueryTiming:
+    __slots__ = ("calls", "errors", "total_ms", "max_ms", "last_ms", "slow")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.slow = 0
+
+
+class DBExecutor:
+    """Bounded thread pool for blocking SQLite work, with per-query timing.
+
+    Timings are keyed by the function's module and qualified name, e.g.
+    "conversation_store.ConversationStore.get_messages" or "tasks._list_tasks".
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._timings: Dict[str, _QueryTiming] = {}
+        self._timings_lock = threading.Lock()
+        self._in_flight = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="cmux-db"
+            )
+        return self._executor
+
+    @staticmethod
+    def _query_name(fn: Callable) -> str:
+        module = getattr(fn, "__module__", "") or ""
+        qualname = getattr(fn, "__qualname__", None) or repr(fn)
+        return f"{module.rsplit('.', 1)[-1]}.{qualname}" if module else qualname
+
+    def _record(self, name: str, elapsed_ms: float, failed: bool):
+        with self._timings_lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = _QueryTiming()
+            timing.calls += 1
+            timing.total_ms += elapsed_ms
+            timing.last_ms = elapsed_ms
+            timing.max_ms = max(timing.max_ms, elapsed_ms)
+            if failed:
+                timing.errors += 1
+            if elapsed_ms >= settings.db_slow_query_ms:
+                timing.slow += 1
+        if elapsed_ms >= settings.db_slow_query_ms:
+            logger.warning(f"Slow database call {name}: {elapsed_ms:.1f}ms")
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a blocking database function off the event loop."""
+        name = self._query_name(fn)
+
+        def timed():
+            start = time.perf_counter()
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                self._record(name, (time.perf_counter() - start) * 1000, failed)
+
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        try:
+            return await loop.run_in_executor(self._get_executor(), timed)
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._timings_lock:
+            queries = {
+                name: {
+                    "calls": t.calls,
+                    "errors": t.errors,
+                    "avg_ms": round(t.total_ms / t.calls, 3) if t.calls else 0.0,
+                    "max_ms": round(t.max_ms, 3),
+                    "last_ms": round(t.last_ms, 3),
+                    "slow": t.slow,
+                }
+                for name, t in sorted(self._timings.items())
+            }
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self._in_flight,
+            "slow_query_ms": settings.db_slow_query_ms,
+            "queries": queries,
+        }
+
+    def shutdown(self):
+        """Wait for running calls and stop the worker threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class AsyncFacade:
+    """Awaitable view of an object whose methods do blocking database work.
+
+    `await AsyncFacade(store).get_messages(limit=10)` runs
+    `store.get_messages(limit=10)` on the db_executor.
+    """
+
+    def __init__(self, target: Any):
+        self._target = target
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await db_executor.run(attr, *args, **kwargs)
+
+        # Cache so repeated lookups don't rebuild the wrapper
+        setattr(self, name, call)
+        return call
+
+
+db_executor = DBExecutor(settings.db_executor_workers)
@@ -0,0 +1,298 @@
+"""Per-agent delivery of text typed into agent panes.
+
+Text is only typed into a pane sitting at a prompt (PaneState.PROMPT);
+anything else waits in that agent's queue. Queues are dispatched when:
+
+    - the agent's Claude Code Stop hook reaches /api/agent-events (the
+      turn ended; the prompt is looked for over the next second while
+      the TUI redraws)
+    - a fallback check every settings.delivery_poll_seconds finds the
+      pane at a prompt. Agents whose PostToolUse hook fired recently are
+      known to be mid-turn and only looked at every BUSY_RECHECK_POLLS
+      checks, in case the turn ended without a Stop hook (interrupted).
+
+Messages queued by the shell scripts (tmux_safe_send --queue writes
+base64 lines to .cmux/send-queue/<session>:<window>) are adopted on each
+check, and whatever is still queued when the server stops is written
+back there for router.sh. Hook signals are published on the event bus,
+since the hook may reach a different worker than the one routing.
+"""
+
+import asyncio
+import base64
+import fcntl
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Set, TextIO, Tuple
+
+from ..config import settings
+from .event_bus import event_bus
+from .tmux_service import PaneState, tmux_service
+
+logger = logging.getLogger(__name__)
+
+# Per-window lock shared with lib/filelock.sh's tmux_send_lock
+SEND_LOCK_TEMPLATE = "/tmp/cmux-tmux-send-{window}.lock"
+
+# After a Stop hook, seconds to wait before each further look for the prompt
+READY_RECHECK_DELAYS = (0.1, 0.25, 0.5)
+
+# A PostToolUse hook marks an agent busy for at most this long without a Stop
+BUSY_HINT_SECONDS = 60.0
+
+# Fallback checks between looks at the panes of agents marked busy (a turn
+# interrupted with Ctrl-C ends without a Stop hook)
+BUSY_RECHECK_POLLS = 5
+
+# Called with (session, window, text, waited seconds) for each delivery of
+# text that had to wait (not for text typed straight away by deliver())
+DeliveryListener = Callable[[str, str, str, float], None]
+
+
+@dataclass(eq=False)
+class QueuedText:
+    text: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    waited: bool = False
+
+
+@dataclass
+class AgentQueue:
+    session: str
+    window: str
+    items: Deque[QueuedText] = field(default_factory=deque)
+    sending: bool = False
+    delivered: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+
+class DeliveryQueue:
+    def __init__(self):
+        self._queues: Dict[Tuple[str, str], AgentQueue] = {}
+        # Agent name -> monotonic time of its last PostToolUse / Stop hook
+        self._busy: Dict[str, float] = {}
+        self._idle: Dict[str, float] = {}
+        self._listeners: List[DeliveryListener] = []
+        self._tasks: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._polls = 0
+
+    @property
+    def _queue_dir(self) -> Path:
+        return settings.cmux_dir / "send-queue"
+
+    def add_listener(self, listener: DeliveryListener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: DeliveryListener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def start(self):
+        """Begin the fallback readiness checks (called from the app lifespan)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._tasks) if t and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._tasks.clear()
+        await asyncio.to_thread(self._spill)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.delivery_poll_seconds)
+            try:
+                await self.dispatch_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Delivery check failed: {e}")
+
+    # --- Enqueueing ---
+
+    def _queue(self, session: str, window: str) -> AgentQueue:
+        queue = self._queues.get((session, window))
+        if queue is None:
+            queue = self._queues[(session, window)] = AgentQueue(session, window)
+        return queue
+
+    async def deliver(self, session: str, window: str, text: str) -> bool:
+        """Type text into the pane now if it is at a prompt; otherwise queue it.
+
+        Returns True if the text was typed before returning.
+        """
+        queue = self._queue(session, window)
+        item = QueuedText(text)
+        queue.items.append(item)
+        await self._dispatch(queue)
+        return item not in queue.items
+
+    # --- Readiness ---
+
+    def mark_busy(self, agent: str):
+        """A PostToolUse hook arrived: the agent is mid-turn."""
+        self._set_busy(agent)
+        event_bus.publish("delivery.busy", {"agent": agent})
+
+    def mark_idle(self, agent: str):
+        """A Stop hook arrived: the agent finished its turn; dispatch its queues."""
+        self._set_idle(agent)
+        event_bus.publish("delivery.idle", {"agent": agent})
+
+    def _on_remote_busy(self, payload: dict):
+        self._set_busy(payload["agent"])
+
+    def _on_remote_idle(self, payload: dict):
+        self._set_idle(payload["agent"])
+
+    def _set_busy(self, agent: str):
+        self._busy[agent] = time.monotonic()
+
+    def _set_idle(self, agent: str):
+        self._busy.pop(agent, None)
+        self._idle[agent] = time.monotonic()
+        queues = [q for q in self._queues.values() if q.window == agent and q.items]
+        if queues:
+            task = asyncio.get_running_loop().create_task(self._dispatch_settled(queues))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _known_busy(self, agent: str) -> bool:
+        since = self._busy.get(agent)
+        return since is not None and time.monotonic() - since < BUSY_HINT_SECONDS
+
+    async def _dispatch_settled(self, queues: List[AgentQueue]):
+        for delay in (0.0, *READY_RECHECK_DELAYS):
+            await asyncio.sleep(delay)
+            for queue in queues:
+                await self._dispatch(queue)
+            if not any(q.items for q in queues):
+                return
+
+    # --- Dispatch ---
+
+    async def dispatch_all(self):
+        """Adopt script-queued messages and deliver to every pane back at a prompt."""
+        await asyncio.to_thread(self._adopt)
+        self._polls += 1
+        recheck_busy = self._polls % BUSY_RECHECK_POLLS == 0
+        for queue in list(self._queues.values()):
+            if queue.items and (recheck_busy or not self._known_busy(queue.window)):
+                await self._dispatch(queue)
+
+    async def _dispatch(self, queue: AgentQueue):
+        if queue.sending or not queue.items:
+            return
+        queue.sending = True
+        try:
+            while queue.items:
+                if await tmux_service.pane_state(queue.window, queue.session) != PaneState.PROMPT:
+                    break
+                item = queue.items.popleft()
+                try:
+                    await self._send_locked(queue.session, queue.window, item.text)
+                except Exception as e:
+                    queue.items.appendleft(item)
+                    logger.error(f"Delivery to {queue.session}:{queue.window} failed: {e}")
+                    break
+                waited = time.monotonic() - item.enqueued_at
+                queue.delivered += 1
+                queue.total_wait += waited
+                queue.max_wait = max(queue.max_wait, waited)
+                if item.waited:
+                    for listener in self._listeners:
+                        listener(queue.session, queue.window, item.text, waited)
+        finally:
+            for item in queue.items:
+                item.waited = True
+            queue.sending = False
+
+    async def _send_locked(self, session: str, window: str, text: str):
+        lock = await asyncio.to_thread(self._acquire_send_lock, window)
+        try:
+            await tmux_service.send_input(window, text, session)
+        finally:
+            lock.close()
+
+    @staticmethod
+    def _acquire_send_lock(window: str) -> TextIO:
+        lock = open(SEND_LOCK_TEMPLATE.format(window=window), "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    # --- .cmux/send-queue files ---
+
+    def _adopt(self):
+        if not self._queue_dir.is_dir():
+            return
+        for queue_file in sorted(self._queue_dir.iterdir()):
+            if queue_file.name.startswith(".") or ":" not in queue_file.name:
+                continue
+            session, window = queue_file.name.split(":", 1)
+            texts = self._take_file(queue_file)
+            if texts:
+                self._queue(session, window).items.extend(QueuedText(text, waited=True) for text in texts)
+
+    def _take_file(self, queue_file: Path) -> List[str]:
+        claimed = queue_file.with_name(f".{queue_file.name}.draining")
+        try:
+            os.replace(queue_file, claimed)
+        except FileNotFoundError:
+            return []
+        try:
+            entries = claimed.read_text().split()
+        finally:
+            claimed.unlink(missing_ok=True)
+        texts = []
+        for entry in entries:
+            try:
+                texts.append(base64.b64decode(entry).decode())
+            except ValueError:
+                logger.warning(f"Dropping undecodable queued message for {queue_file.name}")
+        return texts
+
+    def _spill(self):
+        """Write undelivered messages back to .cmux/send-queue for router.sh."""
+        for queue in self._queues.values():
+            if not queue.items:
+                continue
+            self._queue_dir.mkdir(parents=True, exist_ok=True)
+            with open(self._queue_dir / f"{queue.session}:{queue.window}", "a") as f:
+                for item in queue.items:
+                    f.write(base64.b64encode(item.text.encode()).decode() + "\n")
+            queue.items.clear()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "agents": [
+                {
+                    "session": queue.session,
+                    "window": queue.window,
+                    "depth": len(queue.items),
+                    "oldest_wait_seconds": round(now - queue.items[0].enqueued_at, 3) if queue.items else 0.0,
+                    "delivered": queue.delivered,
+                    "avg_wait_seconds": round(queue.total_wait / queue.delivered, 3) if queue.delivered else 0.0,
+                    "max_wait_seconds": round(queue.max_wait, 3),
+                    "busy": self._known_busy(queue.window),
+                    "last_stop_seconds_ago": (
+                        round(now - self._idle[queue.window], 3) if queue.window in self._idle else None
+                    ),
+                }
+                for queue in self._queues.values()
+            ],
+        }
+
+
+delivery_queue = DeliveryQueue()
+event_bus.subscribe("delivery.busy", delivery_queue._on_remote_busy)
+event_bus.subscribe("delivery.idle", delivery_queue._on_remote_idle)
@@ -0,0 +1,392 @@
+"""Pub/sub between server worker processes.
+
+Real-time state (WebSocket clients, the mailbox message cache, the latest
+heartbeat, the thoughts dedup cache) lives in each worker's memory. When
+the server runs as `uvicorn --workers N`, every change a worker makes is
+published on the bus so the other workers can apply it too.
+
+`publish` only reaches *other* workers; the publisher has already applied
+the change locally. Handlers receive the payload dict and may be sync or
+async. Handlers registered with `on_resync` run when messages from another
+worker may have been lost, and should reload their state from its source.
+
+Backends (settings.event_bus):
+    memory  single process; publish is a no-op (the default)
+    unix    each worker binds a datagram socket in .cmux/bus/ and sends
+            every message to all the others; no broker process. Messages
+            too large for a datagram are passed as a file. Each carries a
+            sequence number, so a message dropped by a full peer buffer is
+            noticed by the receiver at the next one and triggers a resync.
+    sqlite  messages go through a table in .cmux/event_bus.db that every
+            worker polls (a local stand-in for a real broker)
+"""
+
+import asyncio
+import errno
+import inspect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from ..config import settings
+from .db import db_executor, get_pool
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Union[None, Awaitable[None]]]
+
+# Largest datagram the unix backend sends (under Linux's default
+# net.core.wmem_max); larger messages are written to a file in the bus
+# directory and only its path is sent
+UNIX_MAX_DATAGRAM = 200 * 1024
+
+# Seconds between rescans of the bus directory for other workers (a
+# starting worker also announces itself to the ones it finds)
+UNIX_PEER_REFRESH_SECONDS = 5.0
+
+# Internal unix backend channel announcing a new worker
+HELLO_CHANNEL = "bus.hello"
+
+# sqlite backend rows older than this are deleted while polling
+SQLITE_RETENTION_SECONDS = 60
+
+
+def _encode(origin: str, channel: str, payload: dict, seq: Optional[int] = None) -> bytes:
+    # Imported here because the websocket package imports this module
+    from ..websocket.encoding import dumps_json
+
+    message = {"origin": origin, "channel": channel, "payload": payload}
+    if seq is not None:
+        message["seq"] = seq
+    return dumps_json(message).encode()
+
+
+class EventBus:
+    """In-process bus: nothing to forward, handlers are only registered."""
+
+    backend = "memory"
+
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._resync_handlers: List[Callable[[], Union[None, Awaitable[None]]]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        self.resyncs = 0
+
+    @property
+    def distributed(self) -> bool:
+        return False
+
+    def subscribe(self, channel: str, handler: Handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def on_resync(self, handler: Callable[[], Union[None, Awaitable[None]]]):
+        """Run `handler` whenever messages from another worker may have been lost."""
+        self._resync_handlers.append(handler)
+
+    def publish(self, channel: str, payload: dict):
+        """Send to the other workers. Never blocks; safe from any thread."""
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        pass
+
+    def _dispatch(self, raw: Union[bytes, str]):
+        """Run the handlers for a message received from another worker."""
+        try:
+            message = json.loads(raw)
+        except (ValueError, TypeError):
+            self.errors += 1
+            return
+        if message.get("origin") == self.origin:
+            return
+        self._deliver(message)
+
+    def _deliver(self, message: dict):
+        self.received += 1
+        for handler in self._handlers.get(message.get("channel"), []):
+            self._call(handler, message.get("channel"), message.get("payload") or {})
+
+    def _call(self, handler: Callable, name: str, *args):
+        try:
+            result = handler(*args)
+            if inspect.isawaitable(result):
+                self._loop.create_task(result)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Event bus handler for {name} failed: {e}")
+
+    def _resync(self):
+        self.resyncs += 1
+        for handler in self._resync_handlers:
+            self._call(handler, "resync")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "origin": self.origin,
+            "channels": sorted(self._handlers),
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+            "resyncs": self.resyncs,
+        }
+
+
+class UnixSocketBus(EventBus):
+    """Brokerless fan-out over one datagram socket per worker."""
+
+    backend = "unix"
+
+    def __init__(self, directory: Path):
+        super().__init__()
+        self.directory = directory
+        self.path = directory / f"{self.origin}.sock"
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._seq = 0
+        # Other workers' sockets, rescanned every UNIX_PEER_REFRESH_SECONDS
+        self._peers: List[Path] = []
+        self._peers_scanned = 0.0
+        # Last sequence number received from each origin
+        self._peer_seq: Dict[str, int] = {}
+        self._resync_pending = False
+        self.dropped = 0
+        self.gaps = 0
+
+    @property
+    def distributed(self) -> bool:
+        return True
+
+    async def start(self):
+        await super().start()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(str(self.path))
+        self._sock.setblocking(False)
+        self._loop.add_reader(self._sock.fileno(), self._on_readable)
+        logger.info(f"Event bus listening on {self.path}")
+        self.publish(HELLO_CHANNEL, {})
+
+    async def stop(self):
+        if self._sock is not None:
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+        self.path.unlink(missing_ok=True)
+        self._remove_files_for(self.path)
+
+    def _remove_files_for(self, peer: Path):
+        for leftover in self.directory.glob(f"{peer.stem}.*.msg"):
+            leftover.unlink(missing_ok=True)
+
+    def _current_peers(self) -> List[Path]:
+        now = time.monotonic()
+        if not self._peers or now - self._peers_scanned > UNIX_PEER_REFRESH_SECONDS:
+            self._peers_scanned = now
+            self._peers = [peer for peer in self.directory.glob("*.sock") if peer != self.path]
+        return self._peers
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(UNIX_MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            self._dispatch(data)
+
+    def _deliver(self, message: dict):
+        if "file" in message:
+            # Too large for a datagram: the message is in a file addressed to us
+            path = Path(message["file"])
+            try:
+                message = json.loads(path.read_bytes())
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                logger.warning(f"Event bus message file {path.name} unreadable: {e}")
+                self._schedule_resync()
+                return
+            finally:
+                path.unlink(missing_ok=True)
+        origin, seq = message.get("origin"), message.get("seq")
+        if seq is not None:
+            last = self._peer_seq.get(origin)
+            self._peer_seq[origin] = seq
+            if last is not None and seq > last + 1:
+                self.gaps += 1
+                logger.warning(f"Event bus lost {seq - last - 1} message(s) from {origin}; resyncing")
+                self._schedule_resync()
+        if message.get("channel") == HELLO_CHANNEL:
+            self._peers_scanned = 0.0
+            return
+        super()._deliver(message)
+
+    def _schedule_resync(self):
+        # Several gaps found in one read are covered by a single resync
+        if not self._resync_pending:
+            self._resync_pending = True
+            self._loop.call_soon(self._run_resync)
+
+    def _run_resync(self):
+        self._resync_pending = False
+        self._resync()
+
+    def publish(self, channel: str, payload: dict):
+        if self._sock is None:
+            return
+        with self._send_lock:
+            self._seq += 1
+            data = _encode(self.origin, channel, payload, self._seq)
+            self.published += 1
+            if channel == HELLO_CHANNEL:
+                self._peers_scanned = 0.0
+            peers = self._current_peers()
+            if len(data) > UNIX_MAX_DATAGRAM:
+                self._send_as_files(peers, data)
+                return
+            for peer in peers:
+                self._send(peer, data)
+
+    def _send(self, peer: Path, data: bytes) -> bool:
+        try:
+            self._sock.sendto(data, str(peer))
+            return True
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Worker exited without cleaning up
+            peer.unlink(missing_ok=True)
+            self._remove_files_for(peer)
+            self._peers_scanned = 0.0
+        except OSError as e:
+            # EAGAIN: the peer's buffer is full. It sees the gap in sequence
+            # numbers at the next message it gets from us and resyncs.
+            self.dropped += 1
+            if e.errno != errno.EAGAIN:
+                self.errors += 1
+                logger.warning(f"Event bus send to {peer.name} failed: {e}")
+        return False
+
+    def _send_as_files(self, peers: List[Path], data: bytes):
+        """Write an oversized message once, hard-linked into a file per peer."""
+        staged = self.directory / f".{self.origin}-{self._seq}.msg"
+        staged.write_bytes(data)
+        try:
+            for peer in peers:
+                path = self.directory / f"{peer.stem}.{self.origin}-{self._seq}.msg"
+                os.link(staged, path)
+                notice = json.dumps({"origin": self.origin, "seq": self._seq, "file": str(path)}).encode()
+                if not self._send(peer, notice):
+                    path.unlink(missing_ok=True)
+        finally:
+            staged.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "peers": len(self._peers), "dropped": self.dropped, "gaps": self.gaps}
+
+
+class SqliteBus(EventBus):
+    """Shared table polled by every worker; published rows are written in batches."""
+
+    backend = "sqlite"
+
+    def __init__(self, db_path: Path):
+        super().__init__()
+        self._pool = get_pool(db_path)
+        self._pending: List[tuple] = []
+        self._pending_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_id = 0
+        self._last_prune = 0.0
+
+    @property
+    def distributed(self) -> bool:
+        return True
+
+    async def start(self):
+        await super().start()
+        self._last_id = await db_executor.run(self._setup)
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await db_executor.run(self._write_pending)
+
+    def _setup(self) -> int:
+        with self._pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bus_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origin TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM bus_events").fetchone()[0]
+
+    def publish(self, channel: str, payload: dict):
+        self.published += 1
+        with self._pending_lock:
+            self._pending.append((self.origin, _encode(self.origin, channel, payload).decode(), time.time()))
+
+    def _write_pending(self):
+        with self._pending_lock:
+            rows, self._pending = self._pending, []
+        if rows:
+            with self._pool.connection() as conn:
+                conn.executemany("INSERT INTO bus_events (origin, message, created_at) VALUES (?, ?, ?)", rows)
+
+    def _read_new(self) -> List[tuple]:
+        self._write_pending()
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, message FROM bus_events WHERE id > ? AND origin != ? ORDER BY id",
+                (self._last_id, self.origin),
+            ).fetchall()
+            now = time.time()
+            if now - self._last_prune > SQLITE_RETENTION_SECONDS:
+                self._last_prune = now
+                conn.execute("DELETE FROM bus_events WHERE created_at < ?", (now - SQLITE_RETENTION_SECONDS,))
+        return [tuple(row) for row in rows]
+
+    async def _poll_loop(self):
+        interval = settings.event_bus_poll_ms / 1000
+        while True:
+            try:
+                rows = await db_executor.run(self._read_new)
+                for row_id, message in rows:
+                    self._last_id = max(self._last_id, row_id)
+                    self._dispatch(message)
+                await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Event bus poll failed: {e}")
+                await asyncio.sleep(interval)
+
+
+def create_event_bus() -> EventBus:
+    if settings.event_bus == "unix":
+        return UnixSocketBus(settings.cmux_dir / "bus")
+    if settings.event_bus == "sqlite":
+        return SqliteBus(settings.cmux_dir / "event_bus.db")
+    return EventBus()
+
+
+event_bus = create_event_bus()
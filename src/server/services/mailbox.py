@@ -1,8 +1,10 @@
 import asyncio
 import aiofiles
 import fcntl
+import os
+import threading
 from datetime import datetime, timezone
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
 from collections import deque
 import json
 import uuid
@@ -10,18 +12,46 @@ import uuid
 from ..config import settings
 from ..models.message import Message, TaskStatus
 from .conversation_store import conversation_store
+from .db import db_executor
+from .event_bus import event_bus
+from .mailbox_segments import MailboxCursor, MailboxSegments
 
 
 MAILBOX_LOCK_PATH = "/tmp/cmux-mailbox.lock"
 
+# Most mailbox lines written by one locked append
+APPEND_BATCH_MAX = 512
+
+
+def _same_file(path, fd: int) -> bool:
+    try:
+        current, opened = os.stat(path), os.fstat(fd)
+    except FileNotFoundError:
+        return False
+    return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+
 
 class MailboxService:
     def __init__(self):
         self.mailbox_path = settings.mailbox_path
-        self._lock = asyncio.Lock()
+        # Group commit: lines waiting for the next locked append, and the task
+        # writing them. Sends arriving while a write is in flight share the next one.
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._writer: Optional[asyncio.Task] = None
+        # Kept open between appends; the mailbox fd is reopened when the
+        # path no longer refers to the same file (sealed or recreated)
+        self._lock_fd: Optional[int] = None
+        self._mailbox_fd: Optional[int] = None
+        self._write_lock = threading.Lock()
+        self.appended = 0
+        self.append_batches = 0
         # In-memory message store for fast access (most recent messages)
         # SQLite provides durability across restarts
         self._messages: deque[Message] = deque(maxlen=200)
+        # Called after each append to the mailbox file (the in-process router
+        # uses this to pick up the server's own writes immediately)
+        self._append_listeners: List[Callable[[], None]] = []
+        self._segments: Optional[MailboxSegments] = None
         # Load recent messages from SQLite on startup
         self._load_persisted_messages()
 
@@ -36,11 +66,90 @@ class MailboxService:
             # Database might not exist yet on first run
             pass
 
-    async def _ensure_mailbox(self):
-        """Ensure mailbox file exists."""
+    @property
+    def segments(self) -> MailboxSegments:
+        """Segment store of the mailbox (see mailbox_segments.py)."""
+        if self._segments is None or self._segments.path != self.mailbox_path:
+            self._segments = MailboxSegments(self.mailbox_path, MAILBOX_LOCK_PATH)
+        return self._segments
+
+    def read_from(self, cursor: MailboxCursor, limit: int = 4 * 1024 * 1024) -> Tuple[List[bytes], MailboxCursor]:
+        """Mailbox records after `cursor` and the cursor past them (blocking)."""
+        return self.segments.read_from(cursor, limit)
+
+    def compact(self, cursor: MailboxCursor) -> int:
+        """Seal the active segment if due and drop sealed segments before `cursor` (blocking)."""
+        with self.segments.locked():
+            self.segments.seal_if_due()
+            return self.segments.compact(cursor)
+
+    async def _append(self, entry: str):
+        """Append one JSONL line to the mailbox; returns once it is written."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((entry, future))
+        if self._writer is None or self._writer.done() or self._writer.get_loop() is not loop:
+            self._writer = loop.create_task(self._write_pending())
+        await future
+
+    async def _write_pending(self):
+        while self._pending:
+            batch = self._pending[:APPEND_BATCH_MAX]
+            del self._pending[:APPEND_BATCH_MAX]
+            try:
+                await asyncio.to_thread(self._write_lines, [entry for entry, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+            self._notify_appended()
+
+    def _write_lines(self, entries: List[str]):
+        """Write lines to the mailbox under the cross-process flock (blocking)."""
+        with self._write_lock:
+            self._acquire_lock()
+            try:
+                fd = self._open_mailbox()
+                data = "".join(entry + "\n" for entry in entries).encode()
+                while data:
+                    data = data[os.write(fd, data):]
+                self.appended += len(entries)
+                self.append_batches += 1
+                if self.segments.seal_if_due():
+                    self._close_mailbox()
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _acquire_lock(self):
+        while True:
+            if self._lock_fd is None:
+                self._lock_fd = os.open(MAILBOX_LOCK_PATH, os.O_WRONLY | os.O_CREAT, 0o666)
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            # A lock file deleted and recreated (e.g. by a /tmp cleaner) no
+            # longer excludes writers that opened the new one
+            if _same_file(MAILBOX_LOCK_PATH, self._lock_fd):
+                return
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _open_mailbox(self) -> int:
+        """The open mailbox fd, reopened if the path now names another file."""
+        if self._mailbox_fd is not None:
+            if _same_file(self.mailbox_path, self._mailbox_fd):
+                return self._mailbox_fd
+            self._close_mailbox()
         self.mailbox_path.parent.mkdir(parents=True, exist_ok=True)
-        if not self.mailbox_path.exists():
-            self.mailbox_path.touch()
+        self._mailbox_fd = os.open(self.mailbox_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._mailbox_fd
+
+    def _close_mailbox(self):
+        if self._mailbox_fd is not None:
+            os.close(self._mailbox_fd)
+            self._mailbox_fd = None
 
     async def send_to_supervisor(
         self,
@@ -51,23 +160,19 @@ class MailboxService:
         """Send a message to the supervisor agent via mailbox.
 
         Uses JSONL format: one JSON object per line.
-        The payload is written to a body file for the full content.
+        Small payloads are inlined as compact JSON; larger ones are written
+        to a body file.
         """
-        await self._ensure_mailbox()
-
         timestamp = datetime.now(timezone.utc).isoformat()
         from_addr = f"webhook:{source}"
         to_addr = "cmux:supervisor"
         subject = f"[WEBHOOK] {source}"
 
-        # Write payload to body file
-        date_str = datetime.now().strftime("%Y-%m-%d")
-        attachments_dir = settings.cmux_dir / "journal" / date_str / "attachments"
-        attachments_dir.mkdir(parents=True, exist_ok=True)
-        body_path = attachments_dir / f"webhook-{message_id[:8]}.json"
-
-        async with aiofiles.open(body_path, "w") as f:
-            await f.write(json.dumps(payload, indent=2, default=str))
+        body = await self._body_value(
+            json.dumps(payload, separators=(",", ":"), default=str),
+            f"webhook-{message_id[:8]}.json",
+            lambda: json.dumps(payload, indent=2, default=str),
+        )
 
         # Write JSONL mailbox entry (with cross-process file lock)
         entry = json.dumps({
@@ -76,19 +181,11 @@ class MailboxService:
             "from": from_addr,
             "to": to_addr,
             "subject": subject,
-            "body": str(body_path),
+            "body": body,
             "status": "submitted",
         }, separators=(",", ":"))
 
-        async with self._lock:
-            lock_file = open(MAILBOX_LOCK_PATH, "w")
-            try:
-                fcntl.flock(lock_file, fcntl.LOCK_EX)
-                async with aiofiles.open(self.mailbox_path, "a") as f:
-                    await f.write(entry + "\n")
-            finally:
-                fcntl.flock(lock_file, fcntl.LOCK_UN)
-                lock_file.close()
+        await self._append(entry)
 
     async def send_mailbox_message(
         self,
@@ -100,10 +197,8 @@ class MailboxService:
         """Send a message between agents via mailbox.
 
         Uses JSONL format: one JSON object per line.
-        If body is provided, it's written to a file.
+        A short body is inlined in the record; a long one is written to a file.
         """
-        await self._ensure_mailbox()
-
         message_id = str(uuid.uuid4())
         timestamp = datetime.now(timezone.utc).isoformat()
 
@@ -131,36 +226,75 @@ class MailboxService:
         }
 
         if body:
-            # Write body to file
-            date_str = datetime.now().strftime("%Y-%m-%d")
-            attachments_dir = settings.cmux_dir / "journal" / date_str / "attachments"
-            attachments_dir.mkdir(parents=True, exist_ok=True)
-            body_path = attachments_dir / f"msg-{message_id[:8]}.md"
-
-            async with aiofiles.open(body_path, "w") as f:
-                await f.write(f"# {subject}\n\n{body}")
-
-            entry_data["body"] = str(body_path)
+            entry_data["body"] = await self._body_value(
+                body, f"msg-{message_id[:8]}.md", lambda: f"# {subject}\n\n{body}"
+            )
 
         entry = json.dumps(entry_data, separators=(",", ":"))
 
-        async with self._lock:
-            lock_file = open(MAILBOX_LOCK_PATH, "w")
-            try:
-                fcntl.flock(lock_file, fcntl.LOCK_EX)
-                async with aiofiles.open(self.mailbox_path, "a") as f:
-                    await f.write(entry + "\n")
-            finally:
-                fcntl.flock(lock_file, fcntl.LOCK_UN)
-                lock_file.close()
+        await self._append(entry)
 
         return message_id
 
+    async def _body_value(self, inline: str, filename: str, file_content: Callable[[], str]) -> str:
+        """The record's "body" field: `inline` itself if short, else the path of an attachment file.
+
+        Readers tell the two apart by the leading "/" of the (absolute) path,
+        so inline text that starts with one is written to a file too.
+        """
+        if len(inline) < settings.mailbox_inline_body_max and not inline.startswith("/"):
+            return inline
+        date_str = datetime.now().strftime("%Y-%m-%d")
+        attachments_dir = settings.cmux_dir / "journal" / date_str / "attachments"
+        attachments_dir.mkdir(parents=True, exist_ok=True)
+        body_path = (attachments_dir / filename).resolve()
+
+        async with aiofiles.open(body_path, "w") as f:
+            await f.write(file_content())
+        return str(body_path)
+
+    def append_stats(self) -> dict:
+        return {
+            "lines": self.appended,
+            "batches": self.append_batches,
+            "pending": len(self._pending),
+        }
+
+    def add_append_listener(self, listener: Callable[[], None]):
+        self._append_listeners.append(listener)
+
+    def remove_append_listener(self, listener: Callable[[], None]):
+        if listener in self._append_listeners:
+            self._append_listeners.remove(listener)
+
+    def _notify_appended(self):
+        for listener in self._append_listeners:
+            listener()
+
     def store_message(self, message: Message):
         """Store a message in memory and persist to SQLite."""
         self._messages.append(message)
         # Write-through to SQLite for persistence
         conversation_store.store_message(message)
+        # Other server workers only update their in-memory copy
+        event_bus.publish("mailbox.message", message.model_dump(mode="json"))
+
+    def _on_remote_message(self, payload: dict):
+        self._messages.append(Message(**payload))
+
+    async def _on_bus_resync(self):
+        """Updates from another worker were lost: reload the cache from SQLite."""
+        messages = await db_executor.run(conversation_store.get_messages, 200)
+        self._messages = deque(reversed(messages), maxlen=200)
+
+    def _on_remote_status(self, payload: dict):
+        self._set_cached_status(payload["id"], TaskStatus(payload["status"]))
+
+    def _set_cached_status(self, message_id: str, status: TaskStatus):
+        for msg in self._messages:
+            if msg.id == message_id:
+                msg.task_status = status
+                break
 
     def update_message_status(self, message_id: str, status: TaskStatus) -> bool:
         """Update a message's task lifecycle status.
@@ -168,11 +302,9 @@ class MailboxService:
         Updates both the in-memory cache and the SQLite store.
         Returns True if the message was found and updated.
         """
-        # Update in-memory
-        for msg in self._messages:
-            if msg.id == message_id:
-                msg.task_status = status
-                break
+        # Update in-memory, here and in the other server workers
+        self._set_cached_status(message_id, status)
+        event_bus.publish("mailbox.status", {"id": message_id, "status": status.value})
         # Update in SQLite (source of truth)
         return conversation_store.update_message_status(message_id, status)
 
@@ -196,3 +328,6 @@ class MailboxService:
 
 
 mailbox_service = MailboxService()
+event_bus.subscribe("mailbox.message", mailbox_service._on_remote_message)
+event_bus.subscribe("mailbox.status", mailbox_service._on_remote_status)
+event_bus.on_resync(mailbox_service._on_bus_resync)
@@ -0,0 +1,379 @@
+"""In-process mailbox router.
+
+Delivers the JSONL records appended to .cmux/mailbox (see router.sh for
+the format) without leaving the server: records are parsed here, stored
+through mailbox_service and typed into the target pane through
+tmux_service, so delivery takes milliseconds and forks nothing per
+message.
+
+New data is noticed through, in order of latency:
+    - mailbox_service appends made by this process
+    - filesystem notifications (watchfiles, when installed)
+    - a size check every settings.mailbox_router_poll_seconds
+
+Only one router may run at a time. Whoever holds an flock on
+.cmux/router.lock routes; the server holds it for its lifetime, while
+router.sh only takes it for the duration of one cycle and otherwise
+stands by, so a running server always wins and router.sh resumes when it
+goes away. Both keep the position in .cmux/.router_offset as a
+MailboxCursor, {"segment": N, "offset": bytes}, so each cycle reads only
+what is new however long the mailbox has grown, and sealed segments the
+router has moved past are deleted (see mailbox_segments.py).
+
+Messages are typed into panes through delivery_queue, which holds them
+for agents that aren't at a prompt until their turn ends.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, List, Optional, TextIO
+
+from ..config import settings
+from ..models.message import Message, MessageType, TaskStatus
+from .db import db_executor
+from .delivery_queue import delivery_queue
+from .mailbox import mailbox_service
+from .mailbox_segments import FIRST_SEGMENT, MailboxCursor
+from .tmux_service import TmuxSnapshot, tmux_service
+
+try:
+    from watchfiles import awatch
+except ImportError:  # pragma: no cover - falls back to polling
+    awatch = None
+
+logger = logging.getLogger(__name__)
+
+# Called with (event, data) for every message stored or status changed
+RouterListener = Callable[[str, Any], Awaitable[None]]
+
+# Seconds between attempts to take the lease while another router holds it
+LEASE_RETRY_SECONDS = 1.0
+
+# Upper bound on bytes read from the mailbox per cycle
+READ_CHUNK = 4 * 1024 * 1024
+
+
+def _address_name(address: str) -> str:
+    """Agent name of a "session:agent" address (router.sh's ${addr##*:})."""
+    return "user" if address == "user" else address.rsplit(":", 1)[-1]
+
+
+class MailboxRouter:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._lease: Optional[TextIO] = None
+        self._listeners: List[RouterListener] = []
+        self.cursor = MailboxCursor(FIRST_SEGMENT, 0)
+        self.routed = 0
+        self.delivered = 0
+        self.queued = 0
+        self.failed = 0
+        self.skipped = 0
+        self.status_updates = 0
+
+    @property
+    def active(self) -> bool:
+        """True while this process holds the router lease."""
+        return self._lease is not None
+
+    @property
+    def _position_file(self) -> Path:
+        return settings.cmux_dir / ".router_offset"
+
+    @property
+    def _line_marker(self) -> Path:
+        # Line count written by router.sh before positions were byte offsets
+        return settings.cmux_dir / ".router_line"
+
+    def add_listener(self, listener: RouterListener):
+        self._listeners.append(listener)
+
+    def start(self):
+        """Begin routing once the lease is available (called from the app lifespan)."""
+        if not settings.mailbox_router or (self._task and not self._task.done()):
+            return
+        self._wake = asyncio.Event()
+        mailbox_service.add_append_listener(self.notify)
+        delivery_queue.add_listener(self._on_delivered)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._watch_task, self._task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._watch_task = None
+        mailbox_service.remove_append_listener(self.notify)
+        delivery_queue.remove_listener(self._on_delivered)
+        if self._lease is not None:
+            self._lease.close()
+            self._lease = None
+
+    def notify(self):
+        """Something was appended to the mailbox; route it now."""
+        if self._wake is not None:
+            self._wake.set()
+
+    # --- Lease and position ---
+
+    def _try_lease(self) -> bool:
+        settings.cmux_dir.mkdir(parents=True, exist_ok=True)
+        lease = open(settings.cmux_dir / "router.lock", "w")
+        try:
+            fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lease.close()
+            return False
+        self._lease = lease
+        return True
+
+    def _load_position(self):
+        """Resume from the saved cursor, converting older position formats."""
+        try:
+            saved = json.loads(self._position_file.read_text())
+        except (OSError, ValueError):
+            saved = None
+        try:
+            if isinstance(saved, dict) and "segment" in saved:
+                self.cursor = MailboxCursor(int(saved["segment"]), int(saved["offset"]))
+                return
+            if isinstance(saved, dict) and "offset" in saved:
+                # Byte offset into the mailbox from before it was segmented
+                active = mailbox_service.segments.active_segment()
+                self.cursor = MailboxCursor(active, int(saved["offset"]))
+                return
+        except (ValueError, TypeError):
+            logger.warning(f"Invalid router position {saved!r}, starting from the beginning")
+        try:
+            marker = int(self._line_marker.read_text().strip())
+        except (OSError, ValueError):
+            self.cursor = MailboxCursor(FIRST_SEGMENT, 0)
+            return
+        offset = 0
+        path = mailbox_service.mailbox_path
+        if path.exists():
+            with open(path, "rb") as f:
+                for _ in range(marker):
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+        self.cursor = MailboxCursor(mailbox_service.segments.active_segment(), offset)
+
+    def _save_position(self):
+        tmp = self._position_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.cursor._asdict()))
+        os.replace(tmp, self._position_file)
+
+    # --- Main loop ---
+
+    async def _run(self):
+        while not await asyncio.to_thread(self._try_lease):
+            await asyncio.sleep(LEASE_RETRY_SECONDS)
+        await asyncio.to_thread(self._load_position)
+        logger.info(f"Mailbox router active at segment {self.cursor.segment} offset {self.cursor.offset}")
+        if awatch is not None:
+            self._watch_task = asyncio.create_task(self._watch())
+        loop = asyncio.get_running_loop()
+        next_compact = 0.0
+        while True:
+            try:
+                await self.process()
+                if loop.time() >= next_compact:
+                    await asyncio.to_thread(mailbox_service.compact, self.cursor)
+                    next_compact = loop.time() + settings.mailbox_compact_seconds
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=settings.mailbox_router_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Mailbox router cycle failed: {e}")
+                await asyncio.sleep(settings.mailbox_router_poll_seconds)
+
+    async def _watch(self):
+        path = mailbox_service.mailbox_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        target = str(path.resolve())
+        try:
+            async for _ in awatch(
+                path.parent,
+                watch_filter=lambda change, changed: changed == target,
+                debounce=50,
+                step=10,
+            ):
+                self.notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Mailbox file watching stopped, polling only: {e}")
+
+    async def process(self) -> int:
+        """Route every complete record past the cursor; returns the count."""
+        routed = 0
+        snapshot: Optional[TmuxSnapshot] = None
+        while True:
+            lines, cursor = await asyncio.to_thread(mailbox_service.read_from, self.cursor, READ_CHUNK)
+            if cursor == self.cursor:
+                break
+            if lines and snapshot is None:
+                snapshot = await tmux_service.snapshot()
+            for raw in lines:
+                try:
+                    await self._route_line(raw, snapshot)
+                except Exception as e:
+                    self._log("FAILED", "router", "self", f"error routing line: {e}")
+            routed += len(lines)
+            self.cursor = cursor
+            await asyncio.to_thread(self._save_position)
+        return routed
+
+    # --- Routing ---
+
+    async def _route_line(self, raw: bytes, snapshot: TmuxSnapshot):
+        line = raw.decode("utf-8", "replace").strip()
+        if not line.startswith("{"):
+            # Blank lines and old-format messages
+            self.skipped += bool(line)
+            return
+        try:
+            record = json.loads(line)
+        except ValueError:
+            self.skipped += 1
+            self._log("PARSE_FAIL", "unknown", "unknown", f"invalid JSON: {line[:60]}")
+            return
+
+        if record.get("type") == "status_update":
+            await self._update_status(record.get("id") or "", record.get("status") or "")
+            return
+
+        sender, recipient, subject = record.get("from"), record.get("to"), record.get("subject")
+        if not sender or not recipient or not subject:
+            self.skipped += 1
+            self._log("PARSE_FAIL", sender or "unknown", recipient or "unknown", "missing required fields")
+            return
+        await self.route(record, snapshot)
+
+    async def route(self, record: dict, snapshot: Optional[TmuxSnapshot] = None) -> bool:
+        """Store one mailbox record and deliver it to its target pane."""
+        msg_id = record.get("id") or ""
+        sender, recipient, subject = record["from"], record["to"], record["subject"]
+        body = record.get("body") or ""
+        self.routed += 1
+
+        content = subject
+        if body:
+            content = f"{subject} (see: {body})" if body.startswith("/") else f"{subject} | {body}"
+        try:
+            task_status = TaskStatus(record["status"]) if record.get("status") else None
+        except ValueError:
+            task_status = None
+        message = Message(
+            # Keep the mailbox id so later status updates find the message
+            id=msg_id or str(uuid.uuid4()),
+            timestamp=datetime.now(timezone.utc),
+            from_agent=_address_name(sender),
+            to_agent=_address_name(recipient),
+            content=content,
+            type=MessageType.MAILBOX,
+            task_status=task_status,
+        )
+        mailbox_service.store_message(message)
+        await self._emit("new_message", message)
+
+        if message.to_agent == "user":
+            self._log("DELIVERED", sender, "user", "in-process")
+            return True
+
+        session, window = recipient.split(":", 1) if ":" in recipient else (settings.main_session, recipient)
+        snapshot = snapshot or await tmux_service.snapshot()
+        if window not in snapshot.window_names(session):
+            # Fall back to any cmux session that has the window
+            session = next((s for s in snapshot.sessions if window in snapshot.window_names(s)), None)
+        if session is None:
+            self.failed += 1
+            self._log("FAILED", sender, recipient, "window not found")
+            return False
+
+        # Same single-line form router.sh sends (a literal "\n", not a newline,
+        # so Claude Code doesn't treat it as a paste)
+        text = f"[{sender}] {subject}"
+        if body:
+            text += f"\\n  -> {body}" if body.startswith("/") else f"\\n  {body}"
+        if await delivery_queue.deliver(session, window, text):
+            self.delivered += 1
+            self._log("DELIVERED", sender, recipient, f"session={session}")
+        else:
+            self.queued += 1
+            self._log("QUEUED", sender, recipient, f"session={session} (pane not at prompt)")
+
+        if msg_id:
+            await self._update_status(msg_id, TaskStatus.WORKING.value)
+        return True
+
+    async def _update_status(self, message_id: str, status: str):
+        try:
+            task_status = TaskStatus(status)
+        except ValueError:
+            self._log("WARN", "router", "api", f"invalid status '{status}' for {message_id}")
+            return
+        if not message_id:
+            return
+        if await db_executor.run(mailbox_service.update_message_status, message_id, task_status):
+            self.status_updates += 1
+            await self._emit("task_status_update", {"message_id": message_id, "status": task_status.value})
+
+    async def _emit(self, event: str, data: Any):
+        for listener in self._listeners:
+            try:
+                await listener(event, data)
+            except Exception as e:
+                logger.error(f"Mailbox router listener failed for {event}: {e}")
+
+    def _on_delivered(self, session: str, window: str, text: str, waited: float):
+        self.delivered += 1
+        self._log("DELIVERED", "queue", f"{session}:{window}", f"drained after {waited:.1f}s")
+
+    # --- Log ---
+
+    def _log(self, status: str, sender: str, recipient: str, details: str = ""):
+        """Append to .cmux/router.log in router.sh's format."""
+        line = f"{datetime.now(timezone.utc).isoformat(timespec='seconds')} | {status} | {sender} -> {recipient} | {details}\n"
+        try:
+            with open(settings.cmux_dir / "router.log", "a") as f:
+                f.write(line)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.mailbox_router,
+            "active": self.active,
+            "watching": self._watch_task is not None and not self._watch_task.done(),
+            "segment": self.cursor.segment,
+            "offset": self.cursor.offset,
+            "segments": mailbox_service.segments.stats(),
+            "appends": mailbox_service.append_stats(),
+            "routed": self.routed,
+            "delivered": self.delivered,
+            "queued": self.queued,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "status_updates": self.status_updates,
+        }
+
+
+mailbox_router = MailboxRouter()
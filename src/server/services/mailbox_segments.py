@@ -0,0 +1,173 @@
+"""Segmented mailbox storage.
+
+.cmux/mailbox is always the active segment: every writer (the server,
+tools/mailbox, the orchestrator scripts) keeps appending to it under the
+mailbox flock. Once it is larger than settings.mailbox_segment_max_bytes
+or older than settings.mailbox_segment_max_age_hours it is sealed: moved,
+under the same lock, to .cmux/mailbox.d/<segment>.jsonl, and a new empty
+active file takes its place.
+
+.cmux/mailbox.d/index.json records the active segment number and the
+sealed segments. Readers address records with a MailboxCursor (segment,
+byte offset), so reading costs O(new bytes) however long the mailbox has
+existed, and compact() deletes sealed segments a cursor has moved past.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+FIRST_SEGMENT = 1
+
+
+class MailboxCursor(NamedTuple):
+    segment: int
+    offset: int  # bytes into the segment
+
+
+class MailboxSegments:
+    def __init__(self, path: Path, lock_path: str):
+        self.path = path
+        self.directory = path.with_name(path.name + ".d")
+        self.index_path = self.directory / "index.json"
+        self.lock_path = lock_path
+
+    def segment_path(self, segment: int) -> Path:
+        return self.directory / f"{segment:08d}.jsonl"
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the mailbox flock shared with every writer (blocking)."""
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    # --- Index ---
+
+    def load_index(self) -> dict:
+        try:
+            index = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            index = {"active": FIRST_SEGMENT, "active_created": None, "segments": []}
+        # A seal interrupted between the move and the index write
+        while self.segment_path(index["active"]).exists():
+            index["segments"].append({"segment": index["active"], "bytes": None, "sealed_at": None})
+            index["active"] += 1
+        return index
+
+    def _write_index(self, index: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(index))
+        os.replace(tmp, self.index_path)
+
+    def active_segment(self) -> int:
+        return self.load_index()["active"]
+
+    # --- Reading ---
+
+    def _open(self, segment: int, active: int) -> Tuple[Optional[BinaryIO], bool]:
+        """Open a segment for reading; returns (file or None, sealed)."""
+        if segment == active:
+            try:
+                f = open(self.path, "rb")
+            except FileNotFoundError:
+                f = None
+            # Checked after opening: if the segment was sealed in between,
+            # read the sealed copy so the offset still refers to it
+            if not self.segment_path(segment).exists():
+                return f, False
+            if f is not None:
+                f.close()
+        try:
+            return open(self.segment_path(segment), "rb"), True
+        except FileNotFoundError:
+            return None, True
+
+    def read_from(self, cursor: MailboxCursor, limit: int) -> Tuple[List[bytes], MailboxCursor]:
+        """Complete records after `cursor` (about `limit` bytes), and the cursor past them.
+
+        A record longer than `limit` is still returned whole.
+
+        Records come from a single segment per call; at the end of a sealed
+        segment the returned cursor moves to the next one with no records.
+        """
+        active = self.active_segment()
+        segment, offset = min(cursor.segment, active), cursor.offset
+        f, sealed = self._open(segment, active)
+        if f is None:
+            return [], MailboxCursor(segment + 1, 0) if sealed else MailboxCursor(segment, 0)
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size < offset:
+                logger.warning(f"Mailbox segment {segment} shrunk ({offset} -> {size} bytes), rereading it")
+                offset = 0
+            f.seek(offset)
+            data = f.read(limit)
+            # A record longer than `limit` is read through to its end
+            while data and b"\n" not in data:
+                more = f.read(limit)
+                if not more:
+                    break
+                data += more
+        # A partially written last line is left for the next read
+        lines = [line + b"\n" for line in data.split(b"\n")[:-1]]
+        if sealed and not lines:
+            if data:
+                logger.warning(f"Mailbox segment {segment} ends in an unterminated record ({len(data)} bytes), skipped")
+            return [], MailboxCursor(segment + 1, 0)
+        return lines, MailboxCursor(segment, offset + sum(len(line) for line in lines))
+
+    # --- Maintenance (callers hold locked()) ---
+
+    def seal_if_due(self, now: Optional[float] = None) -> bool:
+        """Seal the active segment if it is over the size or age limit."""
+        now = time.time() if now is None else now
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return False
+        index = self.load_index()
+        if index["active_created"] is None:
+            index["active_created"] = now
+            self._write_index(index)
+        max_age = settings.mailbox_segment_max_age_hours * 3600
+        due = size >= settings.mailbox_segment_max_bytes or (max_age and now - index["active_created"] >= max_age)
+        if not size or not due:
+            return False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        os.replace(self.path, self.segment_path(index["active"]))
+        self.path.touch()
+        index["segments"].append({"segment": index["active"], "bytes": size, "sealed_at": now})
+        index["active"] += 1
+        index["active_created"] = now
+        self._write_index(index)
+        return True
+
+    def compact(self, cursor: MailboxCursor) -> int:
+        """Delete sealed segments entirely before `cursor`; returns how many."""
+        index = self.load_index()
+        done = [s for s in index["segments"] if s["segment"] < cursor.segment]
+        if not done:
+            return 0
+        for entry in done:
+            self.segment_path(entry["segment"]).unlink(missing_ok=True)
+        index["segments"] = [s for s in index["segments"] if s["segment"] >= cursor.segment]
+        self._write_index(index)
+        return len(done)
+
+    def stats(self) -> dict:
+        index = self.load_index()
+        return {
+            "active": index["active"],
+            "sealed": [s["segment"] for s in index["segments"]],
+        }
@@ -0,0 +1,287 @@
+"""Background retention and compaction for conversations.db.
+
+Every db_maintenance_interval_seconds (starting one interval after
+startup) the maintenance task:
+
+1. prunes agent_events, thoughts, messages and the WebSocket replay log
+   (ws_event_log) past their retention age or row cap (see the retention_*
+   settings, all off by default), a small batch per transaction so regular
+   queries keep interleaving on the db_executor;
+2. thins heartbeat_history to one row per hour past
+   heartbeat_downsample_after_hours and drops heartbeats past retention;
+3. finishes deleting archives removed from agent_archives (search index
+   entries and chunk refs) and drops chunks no archive uses any more;
+4. returns freed pages to the filesystem with incremental vacuum and runs
+   PRAGMA optimize. Incremental vacuum needs a one-time full VACUUM first,
+   done only when settings.db_enable_incremental_vacuum is set or a pass
+   is requested with vacuum=True.
+
+Token usage rollups are deliberately kept, so budget totals outlive the
+raw events they were built from.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import NamedTuple, Optional
+
+from ..config import settings
+from .conversation_store import conversation_store
+from .db import db_executor, get_pool
+
+logger = logging.getLogger(__name__)
+
+_HOUR_US = 3_600_000_000
+_DAY_US = 24 * _HOUR_US
+
+
+class RetentionPolicy(NamedTuple):
+    table: str
+    ts_col: str
+    max_age_days: float
+    max_rows: int
+
+
+def retention_policies() -> list[RetentionPolicy]:
+    return [
+        RetentionPolicy("agent_events", "ts_us", settings.retention_events_days, settings.retention_events_max_rows),
+        RetentionPolicy("thoughts", "ts_us", settings.retention_thoughts_days, settings.retention_thoughts_max_rows),
+        RetentionPolicy("messages", "ts_us", settings.retention_messages_days, settings.retention_messages_max_rows),
+        RetentionPolicy("ws_event_log", "ts_us", settings.retention_ws_events_days, settings.retention_ws_events_max_rows),
+    ]
+
+
+class DatabaseMaintenance:
+    """Periodic pruning, heartbeat downsampling and vacuuming of conversations.db."""
+
+    def __init__(self):
+        self._pool = get_pool(conversation_store.db_path)
+        self._task: Optional[asyncio.Task] = None
+        self._running = asyncio.Lock()
+        self._runs = 0
+        self._total_deleted = 0
+        self._total_reclaimed_bytes = 0
+        self._last_run: Optional[dict] = None
+
+    # --- Task lifecycle ---
+
+    def start(self):
+        """Start the periodic maintenance task (called from the app lifespan)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            logger.info("Started database maintenance task")
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.sleep(settings.db_maintenance_interval_seconds)
+                await self.run_once()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Database maintenance failed: {e}")
+
+    # --- One maintenance pass ---
+
+    async def run_once(self, vacuum: bool = False) -> dict:
+        """Run a full maintenance pass and return its report.
+
+        vacuum: enable incremental auto_vacuum if needed (full VACUUM), as
+        settings.db_enable_incremental_vacuum does for periodic passes.
+        """
+        async with self._running:
+            started = time.monotonic()
+            now_us = int(time.time() * 1_000_000)
+            page_size, pages_before = await db_executor.run(self._page_stats)
+
+            deleted: dict[str, int] = {}
+            for policy in retention_policies():
+                deleted[policy.table] = await self._prune(policy, now_us)
+            if deleted.get("messages"):
+                conversation_store.invalidate_message_counts()
+            deleted["heartbeat_history"] = await self._prune_heartbeats(now_us / 1_000_000)
+            deleted["agent_archives"] = await self._purge_deleted_archives()
+            deleted["archive_chunks"] = await db_executor.run(self._delete_orphan_chunks)
+
+            if vacuum or settings.db_enable_incremental_vacuum:
+                await db_executor.run(self._ensure_incremental_vacuum)
+            await db_executor.run(self._incremental_vacuum)
+            await db_executor.run(self._optimize)
+            _, pages_after = await db_executor.run(self._page_stats)
+
+            reclaimed = max(pages_before - pages_after, 0) * page_size
+            self._runs += 1
+            self._total_deleted += sum(deleted.values())
+            self._total_reclaimed_bytes += reclaimed
+            self._last_run = {
+                "finished_at": time.time(),
+                "duration_ms": round((time.monotonic() - started) * 1000, 1),
+                "deleted": deleted,
+                "reclaimed_bytes": reclaimed,
+                "db_bytes": pages_after * page_size,
+            }
+            if any(deleted.values()) or reclaimed:
+                logger.info(
+                    f"Database maintenance deleted {sum(deleted.values())} rows, "
+                    f"reclaimed {reclaimed} bytes"
+                )
+            return self._last_run
+
+    async def _prune(self, policy: RetentionPolicy, now_us: int) -> int:
+        cutoff = await db_executor.run(self._cutoff, policy, now_us)
+        if cutoff is None:
+            return 0
+        total = 0
+        while True:
+            n = await db_executor.run(self._delete_batch, policy.table, policy.ts_col, cutoff)
+            total += n
+            if n < settings.db_maintenance_batch_rows:
+                return total
+
+    def _cutoff(self, policy: RetentionPolicy, now_us: int) -> Optional[int]:
+        """Rows with ts below the returned value are past the policy (None = keep all)."""
+        cutoff = None
+        if policy.max_age_days > 0:
+            cutoff = now_us - int(policy.max_age_days * _DAY_US)
+        if policy.max_rows > 0:
+            with self._pool.connection() as conn:
+                row = conn.execute(
+                    f"SELECT {policy.ts_col} FROM {policy.table} "
+                    f"ORDER BY {policy.ts_col} DESC LIMIT 1 OFFSET ?",
+                    (policy.max_rows,),
+                ).fetchone()
+            if row is not None:
+                # Ties at the boundary are kept; the cap is approximate by design
+                cutoff = max(cutoff or 0, row[0])
+        return cutoff
+
+    def _delete_batch(self, table: str, ts_col: str, cutoff: int) -> int:
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT rowid FROM {table} WHERE {ts_col} < ? ORDER BY {ts_col} LIMIT ?",
+                (cutoff, settings.db_maintenance_batch_rows),
+            ).fetchall()
+            if not rows:
+                return 0
+            if table == "messages":
+                conn.executemany(
+                    "DELETE FROM message_participants WHERE message_id = (SELECT id FROM messages WHERE rowid = ?)",
+                    [(r[0],) for r in rows],
+                )
+            conn.executemany(f"DELETE FROM {table} WHERE rowid = ?", [(r[0],) for r in rows])
+            return len(rows)
+
+    async def _prune_heartbeats(self, now: float) -> int:
+        total = 0
+        if settings.heartbeat_downsample_after_hours > 0:
+            older_than = now - settings.heartbeat_downsample_after_hours * 3600
+            while True:
+                n = await db_executor.run(self._downsample_heartbeat_batch, older_than)
+                total += n
+                if n < settings.db_maintenance_batch_rows:
+                    break
+        if settings.retention_heartbeats_days > 0:
+            older_than = now - settings.retention_heartbeats_days * 86400
+            while True:
+                n = await db_executor.run(self._delete_heartbeat_batch, older_than)
+                total += n
+                if n < settings.db_maintenance_batch_rows:
+                    break
+        return total
+
+    def _downsample_heartbeat_batch(self, older_than: float) -> int:
+        """Delete heartbeats older than the cutoff except the newest one per hour."""
+        with self._pool.connection() as conn:
+            return conn.execute(
+                """
+                DELETE FROM heartbeat_history WHERE id IN (
+                    SELECT id FROM heartbeat_history
+                    WHERE timestamp < ?
+                      AND id NOT IN (
+                          SELECT MAX(id) FROM heartbeat_history
+                          WHERE timestamp < ?
+                          GROUP BY CAST(timestamp / 3600 AS INTEGER)
+                      )
+                    LIMIT ?
+                )
+                """,
+                (older_than, older_than, settings.db_maintenance_batch_rows),
+            ).rowcount
+
+    def _delete_heartbeat_batch(self, older_than: float) -> int:
+        with self._pool.connection() as conn:
+            return conn.execute(
+                """
+                DELETE FROM heartbeat_history WHERE id IN (
+                    SELECT id FROM heartbeat_history WHERE timestamp < ? LIMIT ?
+                )
+                """,
+                (older_than, settings.db_maintenance_batch_rows),
+            ).rowcount
+
+    async def _purge_deleted_archives(self) -> int:
+        total = 0
+        while True:
+            n = await db_executor.run(conversation_store.purge_deleted_archives, settings.db_maintenance_batch_rows)
+            total += n
+            if n < settings.db_maintenance_batch_rows:
+                return total
+
+    def _delete_orphan_chunks(self) -> int:
+        """Drop archive chunks no archive refers to any more."""
+        with self._pool.connection() as conn:
+            return conn.execute(
+                "DELETE FROM archive_chunks WHERE hash NOT IN (SELECT hash FROM archive_chunk_refs)"
+            ).rowcount
+
+    # --- Space reclamation ---
+
+    def _page_stats(self) -> tuple[int, int]:
+        with self._pool.connection() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        return page_size, page_count
+
+    def _ensure_incremental_vacuum(self):
+        """Switch the database to auto_vacuum=INCREMENTAL (needs one full VACUUM)."""
+        with self._pool.connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return
+            conn.commit()
+            logger.info("Enabling incremental auto_vacuum on conversations.db (one-time VACUUM)")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            try:
+                conn.execute("VACUUM")
+            except sqlite3.OperationalError as e:
+                # e.g. another connection mid-transaction; retried next pass
+                logger.warning(f"VACUUM skipped: {e}")
+
+    def _incremental_vacuum(self):
+        with self._pool.connection() as conn:
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+    def _optimize(self):
+        with self._pool.connection() as conn:
+            conn.execute("PRAGMA optimize")
+
+    def stats(self) -> dict:
+        return {
+            "active": self._task is not None and not self._task.done(),
+            "runs": self._runs,
+            "total_deleted": self._total_deleted,
+            "total_reclaimed_bytes": self._total_reclaimed_bytes,
+            "last_run": self._last_run,
+        }
+
+
+db_maintenance = DatabaseMaintenance()
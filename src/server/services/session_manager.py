@@ -4,7 +4,7 @@ from typing import List, Optional
 
 from ..config import settings
 from ..models.session import Session, SessionStatus
-from .tmux_service import tmux_service
+from .tmux_service import TmuxSnapshot, tmux_service
 
 
 class SessionManager:
@@ -19,41 +19,46 @@ class SessionManager:
     def __init__(self):
         self._sessions: dict[str, Session] = {}
 
-    async def list_sessions(self) -> List[Session]:
-        """List all active CMUX sessions."""
-        tmux_sessions = await tmux_service.list_sessions()
+    async def list_sessions(self, snapshot: Optional[TmuxSnapshot] = None) -> List[Session]:
+        """List all active CMUX sessions.
+
+        Args:
+            snapshot: A tmux snapshot already taken by the caller; one is
+                      taken (a single tmux call) if not given.
+        """
+        snapshot = snapshot or await tmux_service.snapshot()
         sessions = []
 
-        for sess_name in tmux_sessions:
+        for sess_name in snapshot.sessions:
             # Get or create session object
             if sess_name in self._sessions:
                 session = self._sessions[sess_name]
             else:
-                session = await self._build_session_from_tmux(sess_name)
+                session = self._build_session_from_tmux(sess_name, snapshot)
                 if session:
                     self._sessions[sess_name] = session
 
             if session:
                 # Update agent count
-                windows = await tmux_service.list_windows(sess_name)
+                windows = snapshot.window_names(sess_name)
                 session.agent_count = len([w for w in windows if w not in settings.system_windows])
                 sessions.append(session)
 
         return sessions
 
-    async def get_session(self, session_id: str) -> Optional[Session]:
+    async def get_session(self, session_id: str, snapshot: Optional[TmuxSnapshot] = None) -> Optional[Session]:
         """Get a specific session by ID."""
         if session_id not in self._sessions:
-            await self.list_sessions()
+            await self.list_sessions(snapshot)
         return self._sessions.get(session_id)
 
-    async def _build_session_from_tmux(self, session_name: str) -> Optional[Session]:
+    def _build_session_from_tmux(self, session_name: str, snapshot: TmuxSnapshot) -> Optional[Session]:
         """Build a Session object from an existing tmux session."""
-        if not await tmux_service.session_exists(session_name):
+        if not snapshot.has_session(session_name):
             return None
 
         is_main = session_name == settings.main_session
-        windows = await tmux_service.list_windows(session_name)
+        windows = snapshot.window_names(session_name)
 
         # Find the supervisor window
         supervisor = None
@@ -242,9 +247,12 @@ class SessionManager:
         await tmux_service.send_input(session.supervisor_agent, message, session_id)
         return True
 
-    async def list_session_agents(self, session_id: str) -> List[str]:
+    async def list_session_agents(self, session_id: str, snapshot: Optional[TmuxSnapshot] = None) -> List[str]:
         """List all agents (windows) in a session, excluding system windows."""
-        windows = await tmux_service.list_windows(session_id)
+        if snapshot is not None:
+            windows = snapshot.window_names(session_id)
+        else:
+            windows = await tmux_service.list_windows(session_id)
         return [w for w in windows if w not in settings.system_windows]
 
 
@@ -0,0 +1,277 @@
+"""Live terminal output for /api/agents/{id}/terminal/stream.
+
+One PaneStream per tmux pane is shared by every viewer of that pane. It
+is seeded with recent scrollback (capture-pane with ANSI escapes kept)
+and then appended to as the pane produces output, from one of:
+
+    control   %output notifications on the tmux control-mode connection
+              (panes in settings.main_session, while attached)
+    pipe      `pipe-pane -O` into a FIFO under .cmux/terminal/ (any pane)
+
+If the control connection drops, its streams move to a pipe and are
+re-seeded: viewers' screens are cleared and redrawn from the pane, since
+output may have been missed in between.
+
+A stream keeps the last settings.terminal_stream_buffer_bytes of output.
+Each viewer holds an offset into it and is sent whatever lies past that
+offset, so a slow viewer skips ahead rather than queueing, and N viewers
+cost one tmux subscription. The subscription ends with the last viewer.
+"""
+
+import asyncio
+import logging
+import os
+import shlex
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from ..config import settings
+from .tmux_control import unescape_output
+from .tmux_service import tmux_service
+
+logger = logging.getLogger(__name__)
+
+SOURCE_CONTROL = "control"
+SOURCE_PIPE = "pipe"
+
+PIPE_READ_SIZE = 64 * 1024
+
+# Sent before a re-seed: cursor home and clear screen
+RESEED_PREFIX = b"\x1b[H\x1b[2J"
+
+# Notifications after which control-mode streams check their pane still exists
+PANE_CLOSE_NOTIFICATIONS = {"window-close", "unlinked-window-close", "sessions-changed"}
+
+
+class PaneStream:
+    """Rolling output buffer of one pane; offsets count bytes since the stream began."""
+
+    def __init__(self, pane: str, session: str, window: str, limit: int):
+        self.pane = pane
+        self.session = session
+        self.window = window
+        self.source: Optional[str] = None
+        self.viewers: Set["TerminalViewer"] = set()
+        self.opening: Optional[asyncio.Task] = None
+        self.closed = False
+        self.bytes_in = 0
+        self.start = 0
+        self._buffer = bytearray()
+        self._limit = limit
+        self._fd: Optional[int] = None
+        self._fifo: Optional[Path] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self._buffer)
+
+    def feed(self, data: bytes):
+        if not data:
+            return
+        self._buffer += data
+        self.bytes_in += len(data)
+        excess = len(self._buffer) - self._limit
+        if excess > 0:
+            del self._buffer[:excess]
+            self.start += excess
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        for viewer in self.viewers:
+            viewer.ready.set()
+
+    def read_from(self, offset: int) -> tuple[int, bytes]:
+        """Bytes past `offset` (or everything still buffered) and the new offset."""
+        offset = max(offset, self.start)
+        return self.end, bytes(self._buffer[offset - self.start:])
+
+
+class TerminalViewer:
+    """One client's position in a PaneStream."""
+
+    def __init__(self, stream: PaneStream):
+        self.stream = stream
+        self.offset = 0
+        self.ready = asyncio.Event()
+
+    async def read(self) -> bytes:
+        """The next chunk of output; b"" once the stream has ended."""
+        while self.offset >= self.stream.end:
+            if self.stream.closed:
+                return b""
+            self.ready.clear()
+            await self.ready.wait()
+        self.offset, data = self.stream.read_from(self.offset)
+        return data
+
+
+class TerminalStreamer:
+    def __init__(self):
+        self._streams: Dict[str, PaneStream] = {}
+        self._listening = False
+
+    async def attach(self, session: str, window: str) -> Optional[TerminalViewer]:
+        """Start viewing a window's active pane; None if it can't be streamed."""
+        pane = await tmux_service.pane_id(window, session)
+        if pane is None:
+            return None
+        stream = self._streams.get(pane)
+        if stream is None or stream.closed:
+            stream = PaneStream(pane, session, window, settings.terminal_stream_buffer_bytes)
+            self._streams[pane] = stream
+            stream.opening = asyncio.create_task(self._open(stream))
+        viewer = TerminalViewer(stream)
+        stream.viewers.add(viewer)
+        if not await asyncio.shield(stream.opening):
+            await self.detach(viewer)
+            return None
+        # Late joiners start with whatever is still buffered
+        viewer.offset = stream.start
+        return viewer
+
+    async def detach(self, viewer: TerminalViewer):
+        stream = viewer.stream
+        stream.viewers.discard(viewer)
+        if stream.viewers:
+            return
+        if self._streams.get(stream.pane) is stream:
+            del self._streams[stream.pane]
+        await self._close(stream)
+
+    async def stop(self):
+        for stream in list(self._streams.values()):
+            await self._close(stream)
+        self._streams.clear()
+
+    async def _seed(self, stream: PaneStream, prefix: bytes = b""):
+        seed = await tmux_service.capture_pane(
+            stream.window, settings.terminal_stream_seed_lines, stream.session, escapes=True
+        )
+        stream.feed(prefix + seed.rstrip("\n").replace("\n", "\r\n").encode())
+
+    async def _open(self, stream: PaneStream) -> bool:
+        try:
+            await self._seed(stream)
+            if stream.session == settings.main_session and await tmux_service.watch_output():
+                self._listen()
+                stream.source = SOURCE_CONTROL
+                return True
+            return await self._open_pipe(stream)
+        except Exception as e:
+            logger.error(f"Could not stream pane {stream.pane}: {e}")
+            return False
+
+    async def _open_pipe(self, stream: PaneStream) -> bool:
+        directory = settings.cmux_dir / "terminal"
+        directory.mkdir(parents=True, exist_ok=True)
+        fifo = directory / f"{os.getpid()}-{stream.pane.lstrip('%')}.fifo"
+        fifo.unlink(missing_ok=True)
+        os.mkfifo(fifo)
+        stream._fifo = fifo
+        # No EOF is reported until a writer has connected and gone away
+        stream._fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+        stream._loop = asyncio.get_running_loop()
+        stream._loop.add_reader(stream._fd, self._on_pipe_readable, stream)
+        stream.source = SOURCE_PIPE
+        if not await tmux_service.pipe_pane(stream.pane, f"exec cat > {shlex.quote(str(fifo))}"):
+            self._close_pipe(stream)
+            return False
+        return True
+
+    def _on_pipe_readable(self, stream: PaneStream):
+        while True:
+            try:
+                data = os.read(stream._fd, PIPE_READ_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            if not data:
+                # pipe-pane's writer exited: the pane is gone or the pipe was replaced
+                self._close_pipe(stream)
+                stream.close()
+                return
+            stream.feed(data)
+
+    def _close_pipe(self, stream: PaneStream):
+        if stream._fd is not None:
+            stream._loop.remove_reader(stream._fd)
+            os.close(stream._fd)
+            stream._fd = None
+        if stream._fifo is not None:
+            stream._fifo.unlink(missing_ok=True)
+            stream._fifo = None
+
+    async def _close(self, stream: PaneStream):
+        source, stream.source = stream.source, None
+        if source == SOURCE_CONTROL:
+            await tmux_service.unwatch_output()
+        elif source == SOURCE_PIPE:
+            if stream._fd is not None:
+                await tmux_service.pipe_pane(stream.pane)
+            self._close_pipe(stream)
+        stream.close()
+
+    def _listen(self):
+        if not self._listening:
+            tmux_service.add_listener(self._on_notification)
+            self._listening = True
+
+    def _on_notification(self, name: str, args: str):
+        if name == "output":
+            pane, _, data = args.partition(" ")
+            stream = self._streams.get(pane)
+            if stream is not None and stream.source == SOURCE_CONTROL:
+                stream.feed(unescape_output(data))
+        elif name in PANE_CLOSE_NOTIFICATIONS and self._streams:
+            asyncio.get_running_loop().create_task(self._close_dead_streams())
+        elif name == "control-detached":
+            for stream in list(self._streams.values()):
+                if stream.source == SOURCE_CONTROL:
+                    asyncio.get_running_loop().create_task(self._switch_to_pipe(stream))
+
+    async def _switch_to_pipe(self, stream: PaneStream):
+        """The control connection dropped: follow the pane through pipe-pane instead."""
+        stream.source = None
+        await tmux_service.unwatch_output()
+        try:
+            await self._seed(stream, RESEED_PREFIX)
+            opened = await self._open_pipe(stream)
+        except Exception as e:
+            logger.error(f"Could not move pane {stream.pane} to a pipe: {e}")
+            opened = False
+        if not opened or stream.closed:
+            # Failed, or the last viewer left while we were switching
+            if self._streams.get(stream.pane) is stream:
+                del self._streams[stream.pane]
+            await self._close(stream)
+
+    async def _close_dead_streams(self):
+        for stream in list(self._streams.values()):
+            if stream.source != SOURCE_CONTROL:
+                continue
+            if not await tmux_service.pane_exists(stream.pane):
+                self._streams.pop(stream.pane, None)
+                await self._close(stream)
+
+    def stats(self) -> dict:
+        return {
+            "streams": [
+                {
+                    "pane": stream.pane,
+                    "session": stream.session,
+                    "window": stream.window,
+                    "source": stream.source,
+                    "viewers": len(stream.viewers),
+                    "buffered": stream.end - stream.start,
+                    "bytes_in": stream.bytes_in,
+                }
+                for stream in self._streams.values()
+            ],
+        }
+
+
+terminal_streamer = TerminalStreamer()
@@ -0,0 +1,245 @@
+"""Long-lived tmux control-mode (`tmux -C`) connection.
+
+One `tmux -C attach-session` process carries every command for the
+server's lifetime instead of a fork/exec per call. Commands are written
+one per line; tmux answers each with a `%begin ... %end` (or `%error`)
+block, in order, so responses are matched to a FIFO of pending futures.
+
+Lines starting with `%` outside a block are notifications
+(`%window-add @3`, `%window-close @3`, `%sessions-changed`,
+`%output %5 ...`) and are passed to listeners as (name, args).
+
+The client attaches with `ignore-size` so it never resizes agent windows,
+and with `no-output` until `set_output(True)`; tmux then sends %output for
+panes in the attached session only.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Notification callback: (name without '%', remaining line)
+Listener = Callable[[str, str], None]
+
+# Commands not answered within this many seconds fail (the caller falls back)
+COMMAND_TIMEOUT = 10.0
+
+# %output lines carry raw pane output and can be long
+READ_LIMIT = 16 * 1024 * 1024
+
+
+class ControlNotConnected(ConnectionError):
+    """The command was not sent: running it another way is safe."""
+
+
+def quote_arg(arg: str) -> str:
+    """Quote one argument for the tmux command parser.
+
+    Control mode is line based, so newlines and other control characters
+    are written as escape sequences inside double quotes; `$` is escaped
+    to stop environment variable expansion.
+    """
+    out = ['"']
+    for ch in arg:
+        if ch in '\\"$':
+            out.append("\\" + ch)
+        elif ch == "\n":
+            out.append("\\n")
+        elif ch == "\r":
+            out.append("\\r")
+        elif ch == "\t":
+            out.append("\\t")
+        elif ch == "\x1b":
+            out.append("\\e")
+        elif ord(ch) < 0x20 or ord(ch) == 0x7F:
+            out.append(f"\\u{ord(ch):04x}")
+        else:
+            out.append(ch)
+    out.append('"')
+    return "".join(out)
+
+
+def unescape_output(data: str) -> bytes:
+    """Decode the octal escapes tmux uses in %output payloads."""
+    raw = bytearray()
+    i = 0
+    encoded = data.encode("utf-8", "surrogateescape")
+    while i < len(encoded):
+        if encoded[i] == 0x5C and i + 3 < len(encoded) and encoded[i + 1:i + 4].isdigit():
+            raw.append(int(encoded[i + 1:i + 4], 8))
+            i += 4
+        else:
+            raw.append(encoded[i])
+            i += 1
+    return bytes(raw)
+
+
+class TmuxControlClient:
+    """Multiplexes tmux commands over one control-mode connection."""
+
+    def __init__(self, session: str, socket_name: Optional[str] = None):
+        self.session = session
+        self.socket_name = socket_name
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._pending: Deque[asyncio.Future] = deque()
+        self._listeners: List[Listener] = []
+        self.output = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.commands = 0
+        self.notifications = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._proc is not None and self._proc.returncode is None and self._reader is not None
+
+    def _base_cmd(self) -> List[str]:
+        return ["tmux", "-L", self.socket_name] if self.socket_name else ["tmux"]
+
+    async def start(self) -> bool:
+        """Attach to the session; returns False if tmux or the session is unavailable."""
+        try:
+            self._proc = await asyncio.create_subprocess_exec(
+                *self._base_cmd(), "-C", "attach-session", "-t", self.session, "-f", "ignore-size,no-output",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+                limit=READ_LIMIT,
+            )
+        except OSError as e:
+            logger.warning(f"tmux control mode unavailable: {e}")
+            return False
+        self.loop = asyncio.get_running_loop()
+        # Attaching produces an unsolicited %begin block before anything else;
+        # it ends in %end if the attach succeeded and %error if it did not
+        line = await self._proc.stdout.readline()
+        if line.startswith(b"%begin"):
+            while line and not line.startswith((b"%end", b"%error")):
+                line = await self._proc.stdout.readline()
+        if not line.startswith(b"%end"):
+            await self.stop()
+            return False
+        self._reader = asyncio.create_task(self._read_loop())
+        logger.info(f"tmux control mode attached to session {self.session}")
+        return True
+
+    async def stop(self):
+        if self._reader and not self._reader.done():
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+        self._reader = None
+        if self._proc and self._proc.returncode is None:
+            try:
+                self._proc.stdin.close()
+                await asyncio.wait_for(self._proc.wait(), timeout=2)
+            except (asyncio.TimeoutError, BrokenPipeError, ConnectionResetError):
+                self._proc.kill()
+        self._proc = None
+        self._fail_pending()
+
+    def _fail_pending(self):
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError("tmux control connection closed"))
+
+    async def run(self, args: List[str]) -> tuple[str, str, int]:
+        """Run one tmux command (without the leading "tmux"); returns stdout, stderr, rc.
+
+        Raises ControlNotConnected if the command was never sent. Once it
+        has been written, tmux may have run it: a lost connection raises
+        ConnectionError and a missing answer asyncio.TimeoutError.
+        """
+        if not self.connected:
+            raise ControlNotConnected("tmux control connection is not attached")
+        future = self.loop.create_future()
+        # Appending and writing without an await in between keeps the FIFO
+        # in the same order as the commands tmux receives
+        self._pending.append(future)
+        try:
+            self._proc.stdin.write((" ".join(quote_arg(a) for a in args) + "\n").encode())
+        except (BrokenPipeError, ConnectionResetError, RuntimeError) as e:
+            self._pending.remove(future)
+            raise ControlNotConnected(f"tmux control connection closed: {e}") from e
+        self.commands += 1
+        lines, ok = await asyncio.wait_for(asyncio.shield(future), timeout=COMMAND_TIMEOUT)
+        output = "".join(line + "\n" for line in lines)
+        return (output, "", 0) if ok else ("", output, 1)
+
+    def add_listener(self, listener: Listener):
+        self._listeners.append(listener)
+
+    async def set_output(self, enabled: bool):
+        """Turn %output notifications (raw pane output) on or off."""
+        if enabled != self.output and self.connected:
+            await self.run(["refresh-client", "-f", "!no-output" if enabled else "no-output"])
+            self.output = enabled
+
+    async def _read_loop(self):
+        block: Optional[List[str]] = None
+        # "time number flags" of the open %begin; command output is not
+        # escaped, so only a %end/%error repeating them closes the block
+        guard = ""
+        ours = False
+        try:
+            while True:
+                raw = await self._proc.stdout.readline()
+                if not raw:
+                    break
+                line = raw.decode("utf-8", "surrogateescape").rstrip("\n")
+                if block is not None:
+                    kind, _, args = line.partition(" ")
+                    if kind in ("%end", "%error") and args == guard:
+                        if ours:
+                            self._resolve(block, kind == "%end")
+                        block = None
+                    else:
+                        block.append(line)
+                elif line.startswith("%begin "):
+                    block = []
+                    guard = line.partition(" ")[2]
+                    # Third field is 1 for commands sent by this client
+                    ours = guard.split(" ")[2:3] == ["1"]
+                elif line.startswith("%"):
+                    self._notify(line)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"tmux control reader failed: {e}")
+        logger.warning("tmux control connection closed")
+        self._reader = None
+        self._fail_pending()
+        self._notify("%control-detached")
+
+    def _resolve(self, lines: List[str], ok: bool):
+        if not self._pending:
+            return
+        future = self._pending.popleft()
+        if not future.done():
+            future.set_result((lines, ok))
+
+    def _notify(self, line: str):
+        self.notifications += 1
+        name, _, args = line[1:].partition(" ")
+        if name == "exit":
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(name, args)
+            except Exception as e:
+                logger.error(f"tmux notification listener failed for %{name}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "session": self.session,
+            "commands": self.commands,
+            "pending": len(self._pending),
+            "notifications": self.notifications,
+        }
@@ -1,20 +1,251 @@
 import asyncio
+import logging
+import re
 import tempfile
 import os
-from typing import List, Optional
+import time
+from enum import Enum
+from typing import Dict, List, NamedTuple, Optional
 
 from ..config import settings
+from .tmux_control import ControlNotConnected, Listener, TmuxControlClient
+
+logger = logging.getLogger(__name__)
 
 # Threshold for using load-buffer instead of send-keys (4KB)
 LONG_MESSAGE_THRESHOLD = 4096
 
+# Minimum seconds between control-mode (re)attach attempts
+CONTROL_RETRY_SECONDS = 5.0
+
+# One line per window across all sessions; the name is last so it may
+# contain the separator
+SNAPSHOT_FORMAT = "\t".join([
+    "#{session_name}",
+    "#{window_id}",
+    "#{window_index}",
+    "#{pane_pid}",
+    "#{window_activity}",
+    "#{pane_dead}",
+    "#{window_name}",
+])
+
+
+class PaneState(str, Enum):
+    """What an agent pane is showing; only PROMPT is safe for sending input."""
+    PROMPT = "PROMPT"
+    PERMISSION = "PERMISSION"
+    CONFIRMATION = "CONFIRMATION"
+    PLAN_APPROVAL = "PLAN_APPROVAL"
+    SELECTION = "SELECTION"
+    VIM = "VIM"
+    BUSY = "BUSY"
+    UNKNOWN = "UNKNOWN"
+
+
+# Checked in order against the last non-empty lines of the pane, like
+# tmux_pane_state in src/orchestrator/lib/tmux.sh
+PANE_STATE_PATTERNS = [
+    (PaneState.VIM, re.compile(r"-- (INSERT|NORMAL|VISUAL) --")),
+    (PaneState.PERMISSION, re.compile(r"allow once|allow always|allow|deny", re.IGNORECASE)),
+    (PaneState.PLAN_APPROVAL, re.compile(r"(approve|reject).*plan|plan.*(approve|reject)", re.IGNORECASE)),
+    (PaneState.CONFIRMATION, re.compile(r"\(y/n\)|\(Y/N\)|\[y/N\]|\[Y/n\]|\(yes/no\)|\(Yes/No\)")),
+    (PaneState.SELECTION, re.compile(r"^\s*[1-4][).] ", re.MULTILINE)),
+    (PaneState.PROMPT, re.compile(r"❯|bypass permissions|^> ", re.MULTILINE)),
+]
+
+
+def classify_pane(output: str) -> PaneState:
+    lines = [line for line in output.split("\n") if line]
+    if not lines:
+        return PaneState.UNKNOWN
+    tail = "\n".join(lines[-5:])
+    for state, pattern in PANE_STATE_PATTERNS:
+        if pattern.search(tail):
+            return state
+    # Mid-output or in a state we don't recognise
+    return PaneState.BUSY
+
+
+class TmuxWindow(NamedTuple):
+    session: str
+    window_id: str  # e.g. "@3", stable across renames
+    index: int
+    pane_pid: Optional[int]  # of the window's active pane
+    activity: int  # unix time of the last output
+    dead: bool  # the pane's process has exited
+    name: str
+
+
+class TmuxSnapshot:
+    """Every cmux session and its windows, from one `list-windows -a`."""
+
+    def __init__(self, windows: List[TmuxWindow]):
+        self._sessions: Dict[str, List[TmuxWindow]] = {}
+        for window in windows:
+            self._sessions.setdefault(window.session, []).append(window)
+
+    @classmethod
+    def parse(cls, output: str) -> "TmuxSnapshot":
+        windows = []
+        for line in output.splitlines():
+            fields = line.split("\t", 6)
+            if len(fields) != 7:
+                continue
+            session, window_id, index, pid, activity, dead, name = fields
+            if session != settings.main_session and not session.startswith(settings.session_prefix):
+                continue
+            windows.append(TmuxWindow(
+                session=session,
+                window_id=window_id,
+                index=int(index) if index.isdigit() else 0,
+                pane_pid=int(pid) if pid.isdigit() else None,
+                activity=int(activity) if activity.isdigit() else 0,
+                dead=dead == "1",
+                name=name,
+            ))
+        return cls(windows)
+
+    @property
+    def sessions(self) -> List[str]:
+        return list(self._sessions)
+
+    def has_session(self, session: str) -> bool:
+        return session in self._sessions
+
+    def windows(self, session: str) -> List[TmuxWindow]:
+        return self._sessions.get(session, [])
+
+    def window_names(self, session: str) -> List[str]:
+        return [w.name for w in self.windows(session)]
+
 
 class TmuxService:
     def __init__(self):
         self.default_session = settings.tmux_session
+        # Persistent control-mode connection (see tmux_control.py); commands
+        # fall back to a subprocess per call whenever it is not attached
+        self._control: Optional[TmuxControlClient] = None
+        self._control_enabled = False
+        self._control_attempt = 0.0
+        self._control_connecting: Optional[asyncio.Task] = None
+        self._listeners: List[Listener] = []
+        self._output_watchers = 0
+        self._fallback_commands = 0
+        self._failed_commands = 0
+
+    # --- Control mode ---
+
+    async def start_control(self) -> bool:
+        """Attach the control-mode connection (called from the app lifespan)."""
+        self._control_enabled = settings.tmux_control_mode
+        if not self._control_enabled:
+            return False
+        return await self._attach_control()
+
+    async def stop_control(self):
+        self._control_enabled = False
+        if self._control:
+            await self._control.stop()
+            self._control = None
+
+    async def _attach_control(self) -> bool:
+        self._control_attempt = time.monotonic()
+        client = TmuxControlClient(settings.main_session)
+        if not await client.start():
+            return False
+        for listener in self._listeners:
+            client.add_listener(listener)
+        if self._output_watchers:
+            await client.set_output(True)
+        self._control = client
+        # Notifications may have been missed while detached
+        for listener in self._listeners:
+            listener("control-attached", "")
+        return True
+
+    def _control_usable(self) -> bool:
+        control = self._control
+        if control and control.connected:
+            try:
+                return asyncio.get_running_loop() is control.loop
+            except RuntimeError:
+                return False
+        if (
+            self._control_enabled
+            and time.monotonic() - self._control_attempt > CONTROL_RETRY_SECONDS
+            and (self._control_connecting is None or self._control_connecting.done())
+        ):
+            self._control_attempt = time.monotonic()
+            self._control_connecting = asyncio.create_task(self._attach_control())
+        return False
+
+    @property
+    def control_attached(self) -> bool:
+        """True while notifications are flowing from a control-mode connection."""
+        return self._control is not None and self._control.connected
+
+    def add_listener(self, listener: Listener):
+        """Receive tmux notifications (name, args) while control mode is attached.
+
+        A synthetic ("control-attached", "") is sent on every (re)attach and
+        ("control-detached", "") when the connection drops.
+        """
+        self._listeners.append(listener)
+        if self._control:
+            self._control.add_listener(listener)
+
+    async def watch_output(self) -> bool:
+        """Ask for %output notifications; False if control mode can't deliver them.
+
+        Output arrives at the add_listener listeners as ("output", "%<pane> <data>")
+        for panes in settings.main_session. Balance with unwatch_output().
+        """
+        if not self._control_usable():
+            return False
+        self._output_watchers += 1
+        try:
+            await self._control.set_output(True)
+        except (ConnectionError, asyncio.TimeoutError):
+            self._output_watchers -= 1
+            return False
+        return True
+
+    async def unwatch_output(self):
+        self._output_watchers = max(self._output_watchers - 1, 0)
+        if not self._output_watchers and self._control_usable():
+            try:
+                await self._control.set_output(False)
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+
+    def control_stats(self) -> dict:
+        return {
+            "enabled": self._control_enabled,
+            "control": self._control.stats() if self._control else None,
+            "subprocess_commands": self._fallback_commands,
+            "unanswered_commands": self._failed_commands,
+            "output_watchers": self._output_watchers,
+        }
 
     async def _run_command(self, cmd: List[str]) -> tuple[str, str, int]:
-        """Run tmux command and return stdout, stderr, return code."""
+        """Run tmux command and return stdout, stderr, return code.
+
+        Goes over the control-mode connection when it is attached, otherwise
+        (or if the command could not be sent) forks a tmux process. A
+        command that was sent but got no answer is not retried, since tmux
+        may have run it (send-keys would type twice); it fails with rc 1.
+        """
+        if cmd and cmd[0] == "tmux" and self._control_usable():
+            try:
+                return await self._control.run(cmd[1:])
+            except ControlNotConnected as e:
+                logger.warning(f"tmux control command not sent, falling back to subprocess: {e}")
+            except (ConnectionError, asyncio.TimeoutError) as e:
+                self._failed_commands += 1
+                logger.warning(f"tmux control command {cmd[1:2]} got no answer: {e!r}")
+                return "", f"tmux control command got no answer: {e!r}", 1
+        self._fallback_commands += 1
         proc = await asyncio.create_subprocess_exec(
             *cmd,
             stdout=asyncio.subprocess.PIPE,
@@ -32,6 +263,18 @@ class TmuxService:
         # Filter to only cmux sessions
         return [s for s in sessions if s == settings.main_session or s.startswith(settings.session_prefix)]
 
+    async def snapshot(self) -> TmuxSnapshot:
+        """All cmux sessions and windows in a single tmux call.
+
+        Prefer this over list_sessions + list_windows per session when
+        enumerating; a session only exists while it has windows, so
+        sessions are fully covered.
+        """
+        stdout, _, _ = await self._run_command([
+            "tmux", "list-windows", "-a", "-F", SNAPSHOT_FORMAT
+        ])
+        return TmuxSnapshot.parse(stdout)
+
     async def session_exists(self, session: str) -> bool:
         """Check if a tmux session exists."""
         _, _, rc = await self._run_command([
@@ -134,15 +377,49 @@ class TmuxService:
             "tmux", "send-keys", "-t", f"{session}:{window}", "C-c"
         ])
 
-    async def capture_pane(self, window: str, lines: int = 100, session: Optional[str] = None) -> str:
-        """Capture recent output from a tmux pane."""
+    async def capture_pane(
+        self, window: str, lines: int = 100, session: Optional[str] = None, escapes: bool = False
+    ) -> str:
+        """Capture recent output from a tmux pane.
+
+        With escapes=True, colours and attributes are kept as ANSI sequences.
+        """
         session = session or self.default_session
-        stdout, _, _ = await self._run_command([
-            "tmux", "capture-pane", "-t", f"{session}:{window}",
-            "-p", "-S", f"-{lines}"
-        ])
+        cmd = ["tmux", "capture-pane", "-t", f"{session}:{window}", "-p", "-S", f"-{lines}"]
+        if escapes:
+            cmd.append("-e")
+        stdout, _, _ = await self._run_command(cmd)
         return stdout
 
+    async def pane_state(self, window: str, session: Optional[str] = None) -> PaneState:
+        """Classify what the pane is showing (see PaneState)."""
+        session = session or self.default_session
+        stdout, _, rc = await self._run_command([
+            "tmux", "capture-pane", "-t", f"{session}:{window}", "-p", "-S", "-10"
+        ])
+        return classify_pane(stdout) if rc == 0 else PaneState.UNKNOWN
+
+    async def pane_id(self, window: str, session: Optional[str] = None) -> Optional[str]:
+        """The id (e.g. "%5") of a window's active pane, or None if it doesn't exist."""
+        session = session or self.default_session
+        stdout, _, rc = await self._run_command([
+            "tmux", "display-message", "-p", "-t", f"{session}:{window}", "#{pane_id}"
+        ])
+        pane = stdout.strip()
+        return pane if rc == 0 and pane.startswith("%") else None
+
+    async def pane_exists(self, pane: str) -> bool:
+        _, _, rc = await self._run_command(["tmux", "display-message", "-p", "-t", pane, "#{pane_id}"])
+        return rc == 0
+
+    async def pipe_pane(self, pane: str, command: Optional[str] = None) -> bool:
+        """Pipe a pane's output to a shell command; None stops the current pipe."""
+        cmd = ["tmux", "pipe-pane", "-t", pane]
+        if command:
+            cmd += ["-O", command]
+        _, stderr, rc = await self._run_command(cmd)
+        return rc == 0 and not stderr
+
     async def is_vim_mode_enabled(self, window: str, session: Optional[str] = None) -> bool:
         """Check if Claude Code's vim mode is enabled by looking for mode indicators."""
         import re
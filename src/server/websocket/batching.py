@@ -0,0 +1,87 @@
+"""Batching and rate limiting for high-frequency WebSocket events.
+
+During tool-call storms every hook post becomes an `agent_event` or
+`agent_thought`. Clients that opt in (`{"event": "subscribe", "data":
+{"batch": true}}` or `?batch=1`) receive these grouped per topic as
+
+    {"event": "event_batch", "seq": 42,
+     "data": {"event": "agent_event", "count": 3, "events": [...], "suppressed": {}}}
+
+once per window (settings.ws_batch_window_ms). A batch's `seq` is that of
+its newest event. Within a window, state snapshots such as
+`heartbeat_update` collapse to the newest one.
+
+Batching clients are also protected by a per-agent token bucket
+(settings.ws_agent_rate_limit / ws_agent_rate_burst). Events over the
+limit are left out of their batches only; they are still stored and
+still sent to clients that don't batch, which have no way to learn what
+was left out. The number left out per agent is reported in the next
+batch's `suppressed` map so the dashboard knows to refetch.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .encoding import EncodedEvent
+from .subscriptions import EventScope
+
+BATCH_EVENT = "event_batch"
+
+# Per-hook events that are grouped into event_batch frames
+BATCHED_EVENTS = {"agent_event", "agent_thought"}
+
+# State snapshots of which only the newest per window is delivered
+STATE_EVENTS = {"heartbeat_update"}
+
+
+class AgentRateLimiter:
+    """Token bucket per agent; a rate of 0 disables limiting."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        # agent -> (tokens, last refill)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._suppressed: Dict[str, int] = {}
+        self.total_suppressed = 0
+
+    def allow(self, agent: str, now: Optional[float] = None) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        tokens, last = self._buckets.get(agent, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self._buckets[agent] = (tokens, now)
+            self._suppressed[agent] = self._suppressed.get(agent, 0) + 1
+            self.total_suppressed += 1
+            return False
+        self._buckets[agent] = (tokens - 1, now)
+        return True
+
+    def take_suppressed(self) -> Dict[str, int]:
+        """Per-agent drop counts since the last call."""
+        suppressed, self._suppressed = self._suppressed, {}
+        return suppressed
+
+
+class PendingBatches:
+    """Events held back for batching clients until the window closes."""
+
+    def __init__(self):
+        # topic -> [(message, scope)]
+        self.topics: Dict[str, List[Tuple[EncodedEvent, EventScope]]] = {}
+        # state event -> newest (message, scope)
+        self.state: Dict[str, Tuple[EncodedEvent, EventScope]] = {}
+        self.coalesced = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.topics or self.state)
+
+    def add(self, message: EncodedEvent, scope: EventScope):
+        if message.event in STATE_EVENTS:
+            if message.event in self.state:
+                self.coalesced += 1
+            self.state[message.event] = (message, scope)
+        else:
+            self.topics.setdefault(message.event, []).append((message, scope))
@@ -0,0 +1,126 @@
+"""Wire encoding for WebSocket frames.
+
+A broadcast is wrapped in an `EncodedEvent` once and shared by every
+client queue. Its JSON frame is rendered when it is broadcast, so an
+unserializable payload fails only that broadcast, and later changes to
+the payload object don't reach clients. Other formats are rendered at
+most once per event, on first use by a client writer, and the bytes are
+reused for everyone else on that format.
+
+Formats:
+    json     text frames; orjson is used when installed, stdlib json otherwise
+    msgpack  binary frames; only offered when the msgpack package is installed
+
+Clients pick a format with `?format=msgpack` on /api/agents/ws and fall
+back to json when it is unavailable. permessage-deflate is negotiated by
+the ASGI server (see settings.ws_per_message_deflate).
+
+Payloads may be dicts or pydantic models; models are serialized here,
+so callers don't need to `model_dump()` on the hot path.
+"""
+
+import json
+from datetime import date, datetime, timezone
+from enum import Enum
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+
+Frame = Union[str, bytes]
+
+
+def available_formats() -> List[str]:
+    formats = [FORMAT_JSON]
+    if msgpack is not None:
+        formats.append(FORMAT_MSGPACK)
+    return formats
+
+
+def negotiate_format(requested: str | None) -> str:
+    """The format to use for a client that asked for `requested`."""
+    if requested in available_formats():
+        return requested
+    return FORMAT_JSON
+
+
+def _default(obj: Any) -> Any:
+    """Fallback serializer for values neither encoder handles natively."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def dumps_json(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode()
+    return json.dumps(obj, default=_default)
+
+
+def dumps_msgpack(obj: Any) -> bytes:
+    return msgpack.packb(obj, default=_default, datetime=False)
+
+
+_UNDECODED = object()
+
+
+class EncodedEvent:
+    """One broadcast event with lazily rendered, cached frames per format."""
+
+    __slots__ = ("event", "_data", "_decoded", "timestamp", "seq", "_frames")
+
+    def __init__(self, event: str, data: Any, seq: Optional[int] = None, timestamp: Optional[str] = None):
+        self.event = event
+        self._data = data
+        self._decoded = _UNDECODED
+        self.timestamp = timestamp or datetime.now(timezone.utc).isoformat()
+        self.seq = seq
+        self._frames: Dict[str, Frame] = {}
+
+    @property
+    def data(self) -> Any:
+        """The payload; once the JSON frame exists, as decoded from it.
+
+        Frames rendered later (other formats, batches) then carry what JSON
+        clients were sent, even if the broadcast object has since changed.
+        """
+        frame = self._frames.get(FORMAT_JSON)
+        if frame is None:
+            return self._data
+        if self._decoded is _UNDECODED:
+            self._decoded = json.loads(frame)["data"]
+        return self._decoded
+
+    def envelope(self) -> dict:
+        envelope = {"event": self.event, "data": self.data, "timestamp": self.timestamp}
+        if self.seq is not None:
+            envelope["seq"] = self.seq
+        return envelope
+
+    def frame(self, fmt: str = FORMAT_JSON) -> Frame:
+        cached = self._frames.get(fmt)
+        if cached is None:
+            if fmt == FORMAT_MSGPACK:
+                cached = dumps_msgpack(self.envelope())
+            else:
+                cached = dumps_json(self.envelope())
+            self._frames[fmt] = cached
+        return cached
@@ -1,83 +1,529 @@
 from fastapi import WebSocket
-from typing import Dict, Optional
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Protocol, Tuple, Union
 import asyncio
 import json
 import logging
+import time
 from datetime import datetime, timezone
 
+from ..config import settings
+from ..services.db import db_executor
+from ..services.event_bus import event_bus
+from .batching import BATCH_EVENT, BATCHED_EVENTS, STATE_EVENTS, AgentRateLimiter, PendingBatches
+from .encoding import FORMAT_JSON, EncodedEvent, available_formats
+from .subscriptions import EventScope, ProjectResolver, Subscription
+
 logger = logging.getLogger(__name__)
 
 # Ping interval in seconds
 PING_INTERVAL = 30
 
+# Overflow policies for a client's outbound queue (settings.ws_overflow_policy)
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_DISCONNECT = "disconnect"
+
+# State snapshots where only the newest frame matters; the coalesce policy
+# collapses queued duplicates of these before dropping anything else
+COALESCABLE_EVENTS = {"heartbeat_update", "ping"}
+
+# Close code sent to clients dropped by the disconnect policy ("Try Again Later")
+WS_CLOSE_TOO_SLOW = 1013
+
+# Broadcasts that carry no sequence number, are never replayed and stay
+# local to the worker that sent them
+UNSEQUENCED_EVENTS = {"ping"}
+
+# Event bus channel carrying broadcasts between server workers
+BUS_CHANNEL = "ws.broadcast"
+
+# Rows read from the event log per resume before giving up and asking
+# the client to resync. Rows further back than this (plus the in-memory
+# tail) can never be replayed and are trimmed every TRIM_EVERY events.
+REPLAY_MAX_LOGGED = 5000
+TRIM_EVERY = 1000
+
+# (event, frame) queued for a resuming client
+ReplayFrame = Tuple[str, Union[str, EncodedEvent]]
+
+
+class EventLog(Protocol):
+    """Durable log of sequenced frames (ConversationStore implements it)."""
+
+    def log_ws_event(self, seq: int, event: str, frame: str) -> None: ...
+
+    def latest_ws_seq(self) -> int: ...
+
+    def get_ws_events(self, after_seq: int, before_seq: int, limit: int) -> List[Tuple[int, str, str]]: ...
+
+    def trim_ws_events(self, before_seq: int) -> int: ...
+
+
+class ClientConnection:
+    """One WebSocket with its own bounded outbound queue and writer task.
+
+    `enqueue` never awaits, so a slow client only ever delays itself. Queued
+    frames are shared `EncodedEvent`s rendered in this client's `encoding`
+    by the writer; plain strings are sent as-is.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        websocket: WebSocket,
+        max_queue: int,
+        overflow_policy: str,
+        on_failure: Callable[[str], Awaitable[None]],
+        encoding: str = FORMAT_JSON,
+    ):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self._on_failure = on_failure
+        self.encoding = encoding
+        # (event, frame, enqueued_at)
+        self._queue: Deque[Tuple[str, Union[str, EncodedEvent], float]] = deque()
+        self._ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._writer: Optional[asyncio.Task] = None
+        self.subscription = Subscription()
+        self.connected_at = time.time()
+        self.sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.unserializable = 0
+        self.max_queued = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self._total_lag_ms = 0.0
+
+    def start(self):
+        self._writer = self._loop.create_task(self._write_loop())
+
+    async def stop(self):
+        """Stop the writer task (unless we are it) and drop anything still queued."""
+        writer = self._writer
+        self._writer = None
+        self._queue.clear()
+        if writer and not writer.done() and writer is not asyncio.current_task():
+            writer.cancel()
+            try:
+                await writer
+            except asyncio.CancelledError:
+                pass
+
+    def enqueue(self, event: str, message: Union[str, EncodedEvent]) -> bool:
+        """Queue a frame without blocking. Returns False if the client must be dropped."""
+        if len(self._queue) >= self.max_queue and not self._make_room(event):
+            return False
+        self._queue.append((event, message, time.monotonic()))
+        self.max_queued = max(self.max_queued, len(self._queue))
+        self._wake()
+        return True
+
+    def _make_room(self, event: str) -> bool:
+        if self.overflow_policy == OVERFLOW_DISCONNECT:
+            return False
+        if self.overflow_policy == OVERFLOW_COALESCE and self._coalesce(event):
+            return True
+        self._queue.popleft()
+        self.dropped += 1
+        return True
+
+    def _coalesce(self, event: str) -> bool:
+        """Remove a queued frame superseded by newer state; True if room was made."""
+        candidates = [event] if event in COALESCABLE_EVENTS else []
+        candidates += [e for e in COALESCABLE_EVENTS if e != event]
+        for candidate in candidates:
+            for i, queued in enumerate(self._queue):
+                if queued[0] == candidate:
+                    del self._queue[i]
+                    self.coalesced += 1
+                    return True
+        return False
+
+    def _wake(self):
+        try:
+            same_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            same_loop = False
+        if same_loop:
+            self._ready.set()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                event, message, enqueued_at = self._queue.popleft()
+                try:
+                    frame = message.frame(self.encoding) if isinstance(message, EncodedEvent) else message
+                except (TypeError, ValueError) as e:
+                    # One bad payload must not cost the client its connection
+                    self.unserializable += 1
+                    logger.error(f"Skipping unserializable {event} frame for {self.client_id}: {e}")
+                    continue
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+                self.bytes_sent += len(frame)
+                lag_ms = (time.monotonic() - enqueued_at) * 1000
+                self.sent += 1
+                self.last_lag_ms = lag_ms
+                self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+                self._total_lag_ms += lag_ms
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to send to {self.client_id}, disconnecting: {e}")
+            await self._on_failure(self.client_id)
+
+    def stats(self) -> dict:
+        return {
+            "connected_at": datetime.fromtimestamp(self.connected_at, tz=timezone.utc).isoformat(),
+            "encoding": self.encoding,
+            "queued": len(self._queue),
+            "max_queued": self.max_queued,
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "unserializable": self.unserializable,
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "avg_lag_ms": round(self._total_lag_ms / self.sent, 2) if self.sent else 0.0,
+            "subscription": self.subscription.to_dict(),
+        }
+
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+        self.clients: Dict[str, ClientConnection] = {}
         self._lock = asyncio.Lock()
         self._ping_task: Optional[asyncio.Task] = None
+        self._slow_disconnects = 0
+        self._filtered = 0
+        # Maps an agent id/name to its project for project subscriptions
+        self.project_resolver: Optional[ProjectResolver] = None
+        self._rate_limiter = AgentRateLimiter(settings.ws_agent_rate_limit, settings.ws_agent_rate_burst)
+        self._pending = PendingBatches()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._batches_sent = 0
+        # Sequencing and replay: newest frames in memory, older in event_log
+        self._seq = 0
+        self._recent: Deque[Tuple[EncodedEvent, EventScope]] = deque(maxlen=settings.ws_replay_buffer_size)
+        self.event_log: Optional[EventLog] = None
+        self._trim_task: Optional[asyncio.Task] = None
+        self._log_skipped = 0
+        self._unserializable = 0
+        self._resumes = 0
+        self._resyncs = 0
+        self._replayed = 0
+
+    @property
+    def active_connections(self) -> Dict[str, WebSocket]:
+        return {client_id: client.websocket for client_id, client in self.clients.items()}
 
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def attach_event_log(self, event_log: EventLog):
+        """Persist sequenced frames and continue numbering from the log."""
+        self.event_log = event_log
+        self._seq = max(self._seq, await db_executor.run(event_log.latest_ws_seq))
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        subscribe: Optional[dict] = None,
+        encoding: str = FORMAT_JSON,
+        resume_from: Optional[int] = None,
+        stream: Optional[str] = None,
+    ):
+        """Register a client, first replaying what it missed after `resume_from`.
+
+        The client gets either a "resumed" frame after the replayed delta or
+        "resync_required" if the gap can't be filled (evicted from the log,
+        larger than its queue, or from before a sequence reset), in which
+        case it should reload via REST.
+
+        With several server workers each numbers its own frames; both
+        replies carry this worker's `stream`, and a resume that names
+        another worker's stream always resyncs.
+        """
         await websocket.accept()
+        client = ClientConnection(
+            client_id,
+            websocket,
+            max_queue=settings.ws_queue_size,
+            overflow_policy=settings.ws_overflow_policy,
+            on_failure=self.disconnect,
+            encoding=encoding,
+        )
+        if subscribe:
+            client.subscription.subscribe(subscribe)
+        client.start()
+        replay: Optional[List[ReplayFrame]] = None
+        logged = None
+        if resume_from is not None:
+            self._resumes += 1
+            if not (event_bus.distributed and stream and stream != event_bus.origin):
+                logged = await self._read_event_log(client, resume_from)
         async with self._lock:
-            self.active_connections[client_id] = websocket
+            # No awaits between reading the in-memory tail and registering,
+            # so replayed and live frames join without a gap
+            if logged is not None:
+                replay = self._with_recent(client, *logged)
+                for event, frame in replay or ():
+                    client.enqueue(event, frame)
+            self.clients[client_id] = client
         logger.info(f"WebSocket client connected: {client_id}")
+        if resume_from is None:
+            return
+        if replay is None:
+            self._resyncs += 1
+            await self.send_to(client_id, "resync_required", {
+                "resume_from": resume_from, "latest_seq": self._seq, "stream": event_bus.origin,
+            })
+        else:
+            self._replayed += len(replay)
+            await self.send_to(client_id, "resumed", {
+                "resume_from": resume_from, "replayed": len(replay), "latest_seq": self._seq, "stream": event_bus.origin,
+            })
+
+    async def _read_event_log(
+        self, client: ClientConnection, resume_from: int
+    ) -> Optional[Tuple[int, List[ReplayFrame]]]:
+        """Frames after resume_from that have already left the in-memory buffer.
+
+        Returns (last seq covered, frames matching the client's subscription),
+        or None if the log can't fill the gap.
+        """
+        if resume_from > self._seq:
+            return None
+        oldest_recent = self._recent[0][0].seq if self._recent else self._seq + 1
+        if resume_from + 1 >= oldest_recent:
+            return resume_from, []
+        if self.event_log is None or oldest_recent - resume_from > REPLAY_MAX_LOGGED:
+            return None
+        rows = await db_executor.run(self.event_log.get_ws_events, resume_from, oldest_recent, REPLAY_MAX_LOGGED)
+        # Frames too large to log leave holes; those can't be replayed
+        if not rows or rows[0][0] != resume_from + 1 or rows[-1][0] - rows[0][0] + 1 != len(rows):
+            return None
+        frames: List[ReplayFrame] = []
+        for seq, event, frame in rows:
+            envelope = json.loads(frame)
+            scope = EventScope(envelope["data"], self.project_resolver)
+            if not (client.subscription.is_default or client.subscription.matches(event, scope)):
+                continue
+            if client.encoding == FORMAT_JSON:
+                frames.append((event, frame))
+            else:
+                frames.append((event, EncodedEvent(event, envelope["data"], seq=seq, timestamp=envelope["timestamp"])))
+        return rows[-1][0], frames
+
+    def _with_recent(
+        self, client: ClientConnection, covered: int, frames: List[ReplayFrame]
+    ) -> Optional[List[ReplayFrame]]:
+        """Append the in-memory tail after `covered`; None if there is a gap or too much to send."""
+        recent = [(message, scope) for message, scope in self._recent if message.seq > covered]
+        first = recent[0][0].seq if recent else self._seq + 1
+        if first != covered + 1:
+            return None
+        replay = frames + [
+            (message.event, message)
+            for message, scope in recent
+            if client.subscription.is_default or client.subscription.matches(message.event, scope)
+        ]
+        if len(replay) > client.max_queue:
+            return None
+        return replay
 
     async def disconnect(self, client_id: str):
         async with self._lock:
-            if client_id in self.active_connections:
-                del self.active_connections[client_id]
-        logger.info(f"WebSocket client disconnected: {client_id}")
+            client = self.clients.pop(client_id, None)
+        if client:
+            await client.stop()
+            logger.info(f"WebSocket client disconnected: {client_id}")
 
     async def disconnect_all(self):
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._pending = PendingBatches()
         async with self._lock:
-            for client_id, ws in self.active_connections.items():
-                try:
-                    await ws.close()
-                except Exception as e:
-                    logger.warning(f"Error closing WebSocket for {client_id}: {e}")
-            self.active_connections.clear()
+            clients, self.clients = self.clients, {}
+        for client_id, client in clients.items():
+            await client.stop()
+            try:
+                await client.websocket.close()
+            except Exception as e:
+                logger.warning(f"Error closing WebSocket for {client_id}: {e}")
         logger.info("All WebSocket connections closed")
 
-    async def broadcast(self, event: str, data: dict):
-        message = json.dumps(
-            {
-                "event": event,
-                "data": data,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-            }
+    async def broadcast(self, event: str, data: Any):
+        """Queue an event for every subscribed client; never waits on a client's socket.
+
+        `data` may be a dict or a pydantic model. It is serialized at most
+        once per wire format, however many clients receive it; if it can't
+        be serialized the event is dropped and logged. Other server
+        workers receive it over the event bus and deliver it to theirs.
+        """
+        message = await self._deliver(event, data)
+        if message is not None and event not in UNSEQUENCED_EVENTS and event_bus.distributed:
+            event_bus.publish(BUS_CHANNEL, {"event": event, "data": message.data})
+
+    async def _on_bus_broadcast(self, payload: dict):
+        await self._deliver(payload["event"], payload.get("data"))
+
+    async def _deliver(self, event: str, data: Any) -> Optional[EncodedEvent]:
+        scope = EventScope(data, self.project_resolver)
+        batchable = event in BATCHED_EVENTS or event in STATE_EVENTS
+        message = self._sequence(event, data, scope)
+        if message is None:
+            return None
+        clients = list(self.clients.values())
+        # Rate limiting applies to batching clients only, since only their
+        # batches can report what was suppressed
+        limited = (
+            event in BATCHED_EVENTS
+            and scope.agents
+            and any(client.subscription.batch for client in clients)
+            and not self._rate_limiter.allow(min(scope.agents))
         )
-        async with self._lock:
-            disconnected = []
-            for client_id, connection in self.active_connections.items():
-                try:
-                    await connection.send_text(message)
-                except Exception as e:
-                    logger.warning(
-                        f"Failed to send to {client_id}, marking for disconnect: {e}"
-                    )
-                    disconnected.append(client_id)
-            for client_id in disconnected:
-                del self.active_connections[client_id]
-                logger.info(f"Removed stale connection: {client_id}")
+        held = False
+        too_slow = []
+        for client in clients:
+            if batchable and client.subscription.batch:
+                held = held or not limited
+                continue
+            if not client.subscription.is_default and not client.subscription.matches(event, scope):
+                self._filtered += 1
+                continue
+            if not client.enqueue(event, message):
+                too_slow.append(client)
+        if held:
+            self._pending.add(message, scope)
+            self._schedule_flush()
+        for client in too_slow:
+            await self._drop_slow_client(client)
+        return message
+
+    def _sequence(self, event: str, data: Any, scope: EventScope) -> Optional[EncodedEvent]:
+        """Encode and number a broadcast and remember it for replay; None if it can't be encoded."""
+        seq = None if event in UNSEQUENCED_EVENTS else self._seq + 1
+        message = EncodedEvent(event, data, seq=seq)
+        try:
+            message.frame(FORMAT_JSON)
+        except (TypeError, ValueError) as e:
+            self._unserializable += 1
+            logger.error(f"Dropping unserializable {event} broadcast: {e}")
+            return None
+        if seq is None:
+            return message
+        self._seq = seq
+        self._recent.append((message, scope))
+        if self.event_log is not None:
+            self._log(message)
+        return message
+
+    def _log(self, message: EncodedEvent):
+        # Rendered by _sequence; JSON clients are sent the same string
+        try:
+            frame = message.frame(FORMAT_JSON)
+            if len(frame) > settings.ws_event_log_max_frame_size:
+                self._log_skipped += 1
+            else:
+                self.event_log.log_ws_event(message.seq, message.event, frame)
+        except Exception as e:
+            logger.warning(f"Failed to log WebSocket event {message.seq}: {e}")
+        if message.seq % TRIM_EVERY == 0 and (self._trim_task is None or self._trim_task.done()):
+            keep_from = message.seq - REPLAY_MAX_LOGGED - settings.ws_replay_buffer_size
+            if keep_from > 0:
+                self._trim_task = asyncio.get_running_loop().create_task(self._trim_log(keep_from))
+
+    async def _trim_log(self, keep_from: int):
+        try:
+            await db_executor.run(self.event_log.trim_ws_events, keep_from)
+        except Exception as e:
+            logger.warning(f"Failed to trim WebSocket event log: {e}")
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_after_window())
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(settings.ws_batch_window_ms / 1000)
+        await self.flush_batches()
+
+    async def flush_batches(self):
+        """Deliver held events to batching clients as event_batch frames."""
+        pending, self._pending = self._pending, PendingBatches()
+        if not pending:
+            return
+        suppressed = self._rate_limiter.take_suppressed()
+        # Clients whose filters select the same events share one encoded frame
+        frames: Dict[Tuple[str, Tuple[int, ...]], EncodedEvent] = {}
+        too_slow = []
+        for client in list(self.clients.values()):
+            sub = client.subscription
+            if not sub.batch:
+                continue
+            ok = True
+            for event, (message, scope) in pending.state.items():
+                if sub.matches(event, scope):
+                    ok = ok and client.enqueue(event, message)
+            for topic, items in pending.topics.items():
+                selected = tuple(i for i, (_, scope) in enumerate(items) if sub.matches(topic, scope))
+                if not selected:
+                    continue
+                key = (topic, selected)
+                if key not in frames:
+                    frames[key] = EncodedEvent(BATCH_EVENT, {
+                        "event": topic,
+                        "count": len(selected),
+                        "events": [items[i][0].data for i in selected],
+                        "suppressed": suppressed,
+                    }, seq=items[selected[-1]][0].seq)
+                    self._batches_sent += 1
+                ok = ok and client.enqueue(BATCH_EVENT, frames[key])
+            if not ok:
+                too_slow.append(client)
+        for client in too_slow:
+            await self._drop_slow_client(client)
+
+    async def update_subscription(self, client_id: str, action: str, data: dict):
+        """Apply a subscribe/unsubscribe request and echo the resulting filter."""
+        client = self.clients.get(client_id)
+        if not client:
+            return
+        if action == "subscribe":
+            client.subscription.subscribe(data)
+        else:
+            client.subscription.unsubscribe(data)
+        await self.send_to(client_id, "subscribed", client.subscription.to_dict())
 
     async def send_to(self, client_id: str, event: str, data: dict):
-        if client_id in self.active_connections:
-            message = json.dumps(
-                {
-                    "event": event,
-                    "data": data,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                }
-            )
-            try:
-                await self.active_connections[client_id].send_text(message)
-            except Exception as e:
-                logger.warning(f"Failed to send to {client_id}: {e}")
-                async with self._lock:
-                    if client_id in self.active_connections:
-                        del self.active_connections[client_id]
-                        logger.info(f"Removed stale connection: {client_id}")
+        client = self.clients.get(client_id)
+        if client and not client.enqueue(event, EncodedEvent(event, data)):
+            await self._drop_slow_client(client)
+
+    async def _drop_slow_client(self, client: ClientConnection):
+        """Apply the disconnect overflow policy to a client whose queue is full."""
+        self._slow_disconnects += 1
+        logger.warning(
+            f"WebSocket client {client.client_id} fell {client.max_queue} frames behind, disconnecting"
+        )
+        await self.disconnect(client.client_id)
+        try:
+            await client.websocket.close(code=WS_CLOSE_TOO_SLOW)
+        except Exception:
+            pass
 
     async def _ping_loop(self):
         """Send periodic ping messages to all connected clients."""
@@ -93,28 +539,10 @@ class ConnectionManager:
                 logger.error(f"Error in ping loop: {e}")
 
     async def _send_ping(self):
-        """Send ping to all connections and clean up dead ones."""
-        message = json.dumps(
-            {
-                "event": "ping",
-                "data": {},
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-            }
-        )
-        async with self._lock:
-            disconnected = []
-            connection_count = len(self.active_connections)
-            if connection_count > 0:
-                logger.debug(f"Sending ping to {connection_count} clients")
-            for client_id, connection in self.active_connections.items():
-                try:
-                    await connection.send_text(message)
-                except Exception as e:
-                    logger.warning(f"Ping failed for {client_id}: {e}")
-                    disconnected.append(client_id)
-            for client_id in disconnected:
-                del self.active_connections[client_id]
-                logger.info(f"Removed dead connection after ping failure: {client_id}")
+        """Queue a ping for every client; writers drop connections whose send fails."""
+        if self.clients:
+            logger.debug(f"Sending ping to {len(self.clients)} clients")
+        await self.broadcast("ping", {})
 
     def start_ping_task(self):
         """Start the background ping task."""
@@ -132,5 +560,29 @@ class ConnectionManager:
                 pass
             logger.info("Stopped WebSocket ping task")
 
+    def stats(self) -> dict:
+        """Per-client queue depth, drops and send lag."""
+        return {
+            "connections": len(self.clients),
+            "queue_size": settings.ws_queue_size,
+            "overflow_policy": settings.ws_overflow_policy,
+            "formats": available_formats(),
+            "slow_disconnects": self._slow_disconnects,
+            "filtered": self._filtered,
+            "batch_window_ms": settings.ws_batch_window_ms,
+            "batches_sent": self._batches_sent,
+            "rate_limited": self._rate_limiter.total_suppressed,
+            "seq": self._seq,
+            "replay_buffered": len(self._recent),
+            "resumes": self._resumes,
+            "resyncs": self._resyncs,
+            "replayed": self._replayed,
+            "log_skipped": self._log_skipped,
+            "unserializable": self._unserializable,
+            "event_bus": event_bus.stats(),
+            "clients": {client_id: client.stats() for client_id, client in list(self.clients.items())},
+        }
+
 
 ws_manager = ConnectionManager()
+event_bus.subscribe(BUS_CHANNEL, ws_manager._on_bus_broadcast)
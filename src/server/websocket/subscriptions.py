@@ -0,0 +1,152 @@
+"""Per-client topic subscriptions for the WebSocket feed.
+
+Clients narrow what they receive by sending, over the existing socket:
+
+    {"event": "subscribe",   "data": {"events": ["agent_event"], "agents": ["worker-1"]}}
+    {"event": "unsubscribe", "data": {"agents": ["worker-1"]}}
+
+Dimensions are `events` (event type), `agents`, `sessions` and `projects`.
+A dimension that was never subscribed to matches everything, so a client
+that sends nothing keeps receiving the full feed. `"*"` instead of a list
+resets a dimension to everything (subscribe) or nothing (unsubscribe).
+`{"batch": true}` additionally opts into event_batch frames (see
+batching.py).
+
+An event only has to match the dimensions it is scoped to: a heartbeat
+carries no agent, so an agent filter never hides it.
+"""
+
+from typing import Any, Callable, Iterable, Optional, Set
+
+DIMENSIONS = ("events", "agents", "sessions", "projects")
+
+# Frames every client gets regardless of its subscription
+CONTROL_EVENTS = {"ping", "subscribed", "event_batch"}
+
+# Payload keys naming the agents / sessions an event is about
+_AGENT_KEYS = ("agent_id", "agent_name", "from_agent", "to_agent")
+_SESSION_KEYS = ("session_id",)
+
+ProjectResolver = Callable[[str], Optional[str]]
+
+
+class EventScope:
+    """The agents, sessions and projects a broadcast payload (dict or model) refers to."""
+
+    __slots__ = ("agents", "sessions", "projects", "_resolver", "_resolved")
+
+    def __init__(self, data: Any, project_resolver: Optional[ProjectResolver] = None):
+        self.agents: Set[str] = set()
+        self.sessions: Set[str] = set()
+        self.projects: Set[str] = set()
+        if data is not None:
+            self._collect(data)
+            nested = _field(data, "session")
+            if nested is not None and isinstance(_field(nested, "id"), str):
+                self.sessions.add(_field(nested, "id"))
+        self._resolver = project_resolver
+        self._resolved = False
+
+    def _collect(self, data: Any):
+        for key in _AGENT_KEYS:
+            value = _field(data, key)
+            if isinstance(value, str):
+                self.agents.add(value)
+        for key in _SESSION_KEYS:
+            value = _field(data, key)
+            if isinstance(value, str):
+                self.sessions.add(value)
+        project = _field(data, "project_id")
+        if isinstance(project, str):
+            self.projects.add(project)
+
+    def project_ids(self) -> Set[str]:
+        """Explicit project ids plus the projects of the event's agents (resolved lazily)."""
+        if not self._resolved:
+            self._resolved = True
+            if self._resolver:
+                for agent in self.agents:
+                    project = self._resolver(agent)
+                    if project:
+                        self.projects.add(project)
+        return self.projects
+
+
+class Subscription:
+    """What one client wants to receive; None on a dimension means everything."""
+
+    def __init__(self):
+        self.events: Optional[Set[str]] = None
+        self.agents: Optional[Set[str]] = None
+        self.sessions: Optional[Set[str]] = None
+        self.projects: Optional[Set[str]] = None
+        self.batch = False
+
+    @property
+    def is_default(self) -> bool:
+        return all(getattr(self, dim) is None for dim in DIMENSIONS)
+
+    def subscribe(self, data: dict):
+        if "batch" in data:
+            self.batch = bool(data["batch"])
+        for dim, values in _dimensions(data):
+            if values is None:
+                setattr(self, dim, None)
+            else:
+                current = getattr(self, dim)
+                setattr(self, dim, values if current is None else current | values)
+
+    def unsubscribe(self, data: dict):
+        if data.get("batch"):
+            self.batch = False
+        for dim, values in _dimensions(data):
+            current = getattr(self, dim)
+            if values is None:
+                setattr(self, dim, set())
+            elif current is not None:
+                setattr(self, dim, current - values)
+
+    def matches(self, event: str, scope: EventScope) -> bool:
+        if event in CONTROL_EVENTS:
+            return True
+        if self.events is not None and event not in self.events:
+            return False
+        if self.agents is not None and scope.agents and not (scope.agents & self.agents):
+            return False
+        if self.sessions is not None and scope.sessions and not (scope.sessions & self.sessions):
+            return False
+        if self.projects is not None:
+            projects = scope.project_ids()
+            if projects and not (projects & self.projects):
+                return False
+        return True
+
+    def to_dict(self) -> dict:
+        result = {
+            dim: sorted(values) if values is not None else "*"
+            for dim in DIMENSIONS
+            for values in [getattr(self, dim)]
+        }
+        result["batch"] = self.batch
+        return result
+
+
+def _field(data: Any, key: str) -> Any:
+    """Read `key` from a dict payload or an attribute of a model payload."""
+    if isinstance(data, dict):
+        return data.get(key)
+    return getattr(data, key, None)
+
+
+def _dimensions(data: dict) -> Iterable[tuple[str, Optional[Set[str]]]]:
+    """(dimension, values) pairs from a subscribe payload; None stands for "*"."""
+    for dim in DIMENSIONS:
+        if dim not in data:
+            continue
+        raw = data[dim]
+        if raw == "*":
+            yield dim, None
+        elif isinstance(raw, str):
+            yield dim, {raw}
+        elif isinstance(raw, list):
+            yield dim, {str(v) for v in raw}
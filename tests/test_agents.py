@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 
 
@@ -11,3 +13,113 @@ def test_list_agents(client):
 def test_get_nonexistent_agent(client):
     response = client.get("/api/agents/nonexistent")
     assert response.status_code == 404
+
+
+@pytest.fixture
+def fake_tmux(monkeypatch):
+    """Fake tmux windows for a fresh AgentManager; counts full sweeps."""
+    from src.server.config import settings
+    from src.server.services.agent_manager import AgentManager, agent_registry, tmux_service
+    from src.server.services.tmux_service import TmuxSnapshot
+
+    windows = {settings.main_session: ["supervisor", "worker-topo"]}
+    sweeps = []
+
+    async def snapshot():
+        sweeps.append(1)
+        return TmuxSnapshot.parse("".join(
+            f"{sess}\t@{i}\t{i}\t100\t0\t0\t{name}\n"
+            for sess, names in windows.items() for i, name in enumerate(names)
+        ))
+
+    monkeypatch.setattr(tmux_service, "snapshot", snapshot)
+    monkeypatch.setattr(agent_registry, "cleanup_stale", lambda existing: None)
+    monkeypatch.setattr(settings, "topology_miss_refresh_seconds", 60.0)
+    return AgentManager(), windows, sweeps
+
+
+async def test_agent_lookups_served_from_topology(fake_tmux):
+    manager, windows, sweeps = fake_tmux
+
+    assert (await manager.get_agent("worker-topo")).tmux_window == "worker-topo"
+    for _ in range(5):
+        await manager.get_agent("worker-topo")
+        await manager.list_agents()
+    assert len(sweeps) == 1
+
+    # Misses re-sweep at most once per topology_miss_refresh_seconds
+    assert await manager.get_agent("missing") is None
+    assert await manager.get_agent("missing") is None
+    assert len(sweeps) == 1
+
+
+async def test_tmux_notification_refreshes_topology(fake_tmux):
+    from src.server.config import settings
+
+    manager, windows, sweeps = fake_tmux
+    changes = []
+
+    async def listener(change):
+        changes.append(change)
+
+    manager.add_topology_listener(listener)
+    await manager.list_agents()
+
+    windows[settings.main_session].append("worker-new")
+    manager._on_tmux_notification("window-add", "@9")
+    manager._on_tmux_notification("window-renamed", "@9 worker-new")
+    await asyncio.sleep(0.3)
+
+    assert len(sweeps) == 2
+    assert changes == [{"added": ["worker-new"], "removed": [], "total": 3}]
+    assert (await manager.get_agent("worker-new")).id == "worker-new"
+
+
+async def test_window_in_another_session_refreshes_topology(monkeypatch, tmp_path):
+    import shutil
+    import subprocess
+
+    import pytest
+
+    from src.server.config import settings
+    from src.server.services.agent_manager import AgentManager, agent_registry, tmux_service
+
+    if shutil.which("tmux") is None:
+        pytest.skip("tmux not installed")
+    monkeypatch.delenv("TMUX", raising=False)
+    monkeypatch.setenv("TMUX_TMPDIR", str(tmp_path))
+    monkeypatch.setattr(settings, "main_session", "cmux")
+    monkeypatch.setattr(settings, "tmux_control_mode", True)
+    monkeypatch.setattr(settings, "topology_miss_refresh_seconds", 60.0)
+    monkeypatch.setattr(tmux_service, "_listeners", [])
+    monkeypatch.setattr(agent_registry, "cleanup_stale", lambda existing: None)
+    subprocess.run(["tmux", "new-session", "-d", "-s", "cmux", "-n", "supervisor"], check=True)
+    subprocess.run(["tmux", "new-session", "-d", "-s", "cmux-proj", "-n", "main"], check=True)
+    manager = AgentManager()
+    try:
+        assert await tmux_service.start_control()
+        manager.start()
+        await manager.list_agents()
+        await asyncio.sleep(0.3)
+        assert manager.topology_stats()["authoritative"]
+
+        # Attached to "cmux", so tmux reports this as %unlinked-window-add
+        subprocess.run(["tmux", "new-window", "-d", "-t", "cmux-proj", "-n", "worker-proj"], check=True)
+        for _ in range(50):
+            if await manager.get_agent("cmux-proj:worker-proj"):
+                break
+            await asyncio.sleep(0.05)
+        assert (await manager.get_agent("cmux-proj:worker-proj")).session == "cmux-proj"
+    finally:
+        await manager.stop()
+        await tmux_service.stop_control()
+        subprocess.run(["tmux", "kill-server"], capture_output=True)
+
+
+def test_terminal_stream_unknown_agent(client):
+    from starlette.websockets import WebSocketDisconnect
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/api/agents/nonexistent/terminal/stream") as ws:
+            ws.receive_text()
+    assert exc.value.code == 4404
@@ -1,3 +1,6 @@
+import uuid
+
+
 def test_get_budget_summary_empty(client):
     """Test budget summary returns empty list when no usage data exists."""
     response = client.get("/api/budget")
@@ -102,3 +105,51 @@ def test_event_without_usage_not_counted(client):
     data = response.json()
     assert data["totals"]["event_count"] == 0
     assert data["recent_events"] == []
+
+
+def test_budget_time_range_and_buckets(client):
+    """Test budget rollups honour since/until and return a bucketed series."""
+    agent_id = f"worker-budget-{uuid.uuid4().hex[:8]}"
+    for timestamp, tokens in (
+        ("2025-03-01T10:15:00+00:00", 100),
+        ("2025-03-01T10:45:00+00:00", 200),
+        ("2025-03-01T12:05:00+00:00", 400),
+    ):
+        client.post("/api/agent-events", json={
+            "event_type": "Stop",
+            "session_id": "sess-budget-4",
+            "agent_id": agent_id,
+            "timestamp": timestamp,
+            "usage": {"input_tokens": tokens, "output_tokens": 1},
+        })
+
+    response = client.get(
+        f"/api/budget/{agent_id}",
+        params={"since": "2025-03-01T10:00:00Z", "until": "2025-03-01T11:00:00Z", "bucket": "hour"},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["totals"]["input_tokens"] == 300
+    assert data["totals"]["event_count"] == 2
+    assert len(data["recent_events"]) == 2
+    assert [b["input_tokens"] for b in data["series"]] == [300]
+
+    daily = client.get(
+        "/api/budget", params={"since": "2025-03-01T00:00:00Z", "until": "2025-03-02T00:00:00Z", "bucket": "day"},
+    ).json()
+    agent = [a for a in daily["agents"] if a["agent_id"] == agent_id][0]
+    assert agent["input_tokens"] == 700
+    assert [b["bucket_start"][:19] for b in daily["series"]] == ["2025-03-01T00:00:00"]
+
+    # A window starting mid-day keeps that day's bucket, cut to the window
+    partial = client.get(
+        f"/api/budget/{agent_id}",
+        params={"since": "2025-03-01T10:30:00Z", "until": "2025-03-01T12:00:00Z", "bucket": "day"},
+    ).json()
+    assert partial["totals"]["input_tokens"] == 300
+    assert [(b["bucket_start"][:19], b["input_tokens"]) for b in partial["series"]] == [("2025-03-01T00:00:00", 300)]
+
+
+def test_budget_rejects_unknown_bucket(client):
+    response = client.get("/api/budget?bucket=week")
+    assert response.status_code == 422
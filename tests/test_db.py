@@ -0,0 +1,342 @@
+"""Tests for shared SQLite connection pooling."""
+
+from src.server.services.db import ConnectionPool, migrate
+
+
+def test_pool_reuses_connection_per_thread(tmp_path):
+    pool = ConnectionPool(tmp_path / "pool.db")
+    with pool.connection() as first:
+        first.execute("CREATE TABLE t (x INTEGER)")
+    with pool.connection() as second:
+        second.execute("INSERT INTO t VALUES (1)")
+    assert first is second
+
+    stats = pool.stats()
+    assert stats["connections_opened"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["commits"] == 2
+    pool.close_all()
+
+
+def test_pool_nested_blocks_share_transaction(tmp_path):
+    pool = ConnectionPool(tmp_path / "pool.db")
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+
+    try:
+        with pool.connection() as outer:
+            outer.execute("INSERT INTO t VALUES (1)")
+            with pool.connection() as inner:
+                inner.execute("INSERT INTO t VALUES (2)")
+            raise RuntimeError("abort outer")
+    except RuntimeError:
+        pass
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close_all()
+
+
+def test_migrate_applies_pending_versions_once(tmp_path):
+    pool = ConnectionPool(tmp_path / "pool.db")
+    applied = []
+
+    def create(conn):
+        applied.append("create")
+        conn.execute("CREATE TABLE t (x INTEGER)")
+
+    def add_column(conn):
+        applied.append("add_column")
+        conn.execute("ALTER TABLE t ADD COLUMN y INTEGER")
+
+    with pool.connection() as conn:
+        assert migrate(conn, [create]) == 1
+        assert migrate(conn, [create, add_column]) == 2
+        assert migrate(conn, [create, add_column]) == 2
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 2
+    assert applied == ["create", "add_column"]
+    pool.close_all()
+
+
+def test_migrate_refuses_to_commit_an_open_transaction(tmp_path):
+    import pytest
+
+    pool = ConnectionPool(tmp_path / "pool.db")
+
+    def create(conn):
+        conn.execute("CREATE TABLE t (x INTEGER)")
+
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE pending (x INTEGER)")
+        conn.execute("INSERT INTO pending VALUES (1)")
+        with pytest.raises(RuntimeError):
+            migrate(conn, [create])
+        with pytest.raises(RuntimeError):
+            pool.migrate([create])
+        conn.rollback()
+        assert conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0] == 0
+    assert pool.migrate([create]) == 1
+    pool.close_all()
+
+
+def test_migrate_rolls_back_failed_migration(tmp_path):
+    pool = ConnectionPool(tmp_path / "pool.db")
+
+    def broken(conn):
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        raise RuntimeError("boom")
+
+    with pool.connection() as conn:
+        try:
+            migrate(conn, [broken])
+        except RuntimeError:
+            pass
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 't'").fetchone() is None
+    pool.close_all()
+
+
+def test_legacy_conversations_db_gets_epoch_columns(tmp_path):
+    import sqlite3
+    from src.server.services.conversation_store import ConversationStore
+
+    db_path = tmp_path / "conversations.db"
+    legacy = sqlite3.connect(db_path)
+    legacy.executescript("""
+        CREATE TABLE messages (
+            id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, from_agent TEXT NOT NULL,
+            to_agent TEXT NOT NULL, type TEXT NOT NULL, content TEXT NOT NULL, metadata TEXT
+        );
+        INSERT INTO messages VALUES ('m1', '1970-01-01T00:00:01.000002', 'a', 'b', 'mailbox', 'hi', NULL);
+    """)
+    legacy.close()
+
+    store = ConversationStore(db_path=db_path)
+    with store._get_connection() as conn:
+        assert conn.execute("SELECT ts_us FROM messages").fetchone()[0] == 1_000_002
+    assert [m.id for m in store.get_messages(agent_id="b")] == ["m1"]
+
+
+def test_db_stats_endpoint(client):
+    client.get("/api/messages")
+    response = client.get("/api/db/stats")
+    assert response.status_code == 200
+    pools = response.json()["pools"]
+    assert any(p["db_path"].endswith("conversations.db") for p in pools)
+
+
+async def test_write_behind_buffers_until_read(tmp_path):
+    from src.server.services.conversation_store import ConversationStore
+
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    store.start_write_behind()
+    try:
+        for i in range(3):
+            store.store_event({
+                "id": f"evt-{i}",
+                "event_type": "PostToolUse",
+                "session_id": "sess-wb",
+                "agent_id": "worker-wb",
+                "timestamp": f"2026-01-01T00:00:0{i}+00:00",
+            })
+        assert store.write_behind_stats()["pending_rows"] == 3
+
+        # Reads flush first, so the linking logic sees buffered events
+        linked = store.link_events_to_message("worker-wb", "msg-wb")
+        assert linked == 3
+        assert store.write_behind_stats()["pending_rows"] == 0
+        assert store.write_behind_stats()["flushes"] == 1
+    finally:
+        await store.stop_write_behind()
+
+
+async def test_failed_batch_keeps_the_good_rows(tmp_path):
+    from src.server.services.conversation_store import ConversationStore
+
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    store.start_write_behind()
+    try:
+        for i, tool_input in enumerate(["ls", {"unbindable": True}, "pwd"]):
+            store.store_thought({
+                "id": f"thought-{i}",
+                "agent_name": "worker-wb",
+                "thought_type": "tool",
+                "tool_input": tool_input,
+                "timestamp": f"2026-01-01T00:00:0{i}+00:00",
+            })
+        assert store.flush() == 2
+        stats = store.write_behind_stats()
+        assert stats["pending_rows"] == 0 and stats["rows_dropped"] == 1
+        with store._get_connection() as conn:
+            ids = [row[0] for row in conn.execute("SELECT id FROM thoughts ORDER BY id")]
+        assert ids == ["thought-0", "thought-2"]
+    finally:
+        await store.stop_write_behind()
+
+
+def test_usage_is_rolled_up_by_hour_only(tmp_path):
+    from src.server.services import conversation_store as cs
+    from src.server.services.db import get_pool
+
+    db_path = tmp_path / "conversations.db"
+    pool = get_pool(db_path)
+    pool.register_function("inflate", 1, cs.inflate)
+    pool.migrate(cs._MIGRATIONS[:-1])
+    with pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO usage_rollup VALUES (?, 'worker-u', 0, 1, 5, 1, 0, 0)", [("hour",), ("day",)],
+        )
+
+    store = cs.ConversationStore(db_path=db_path)
+    store.store_event({
+        "id": "evt-u",
+        "event_type": "Stop",
+        "session_id": "sess-u",
+        "agent_id": "worker-u",
+        "timestamp": "1970-01-01T00:30:00+00:00",
+        "usage": {"input_tokens": 7, "output_tokens": 1},
+    })
+    with store._get_connection() as conn:
+        rows = conn.execute("SELECT * FROM usage_rollup").fetchall()
+    assert [tuple(row) for row in rows] == [("worker-u", 0, 2, 12, 2, 0, 0)]
+    assert store.get_budget_summary(bucket="day")["series"][0]["input_tokens"] == 12
+
+
+def test_db_stats_reports_query_timings(client):
+    client.get("/api/messages")
+    response = client.get("/api/db/stats")
+    queries = response.json()["executor"]["queries"]
+    assert "conversation_store.ConversationStore.get_messages" in queries
+    assert queries["conversation_store.ConversationStore.get_messages"]["calls"] >= 1
+
+
+def test_archives_are_chunked_and_deduplicated(tmp_path):
+    from src.server.services.conversation_store import ConversationStore
+
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    scrollback = "".join(f"line {i}: compiling module_{i % 7}.py\n" for i in range(1500))
+    first = store.archive_agent("worker-arc", "worker-arc", "worker", scrollback)
+    second = store.archive_agent("worker-arc", "worker-arc", "worker", scrollback + "one more line\n")
+
+    assert store.get_archive(first).terminal_output == scrollback
+    assert store.get_archive(second).terminal_output.endswith("one more line\n")
+
+    stats = store.archive_storage_stats()
+    assert stats["raw_bytes"] > 2 * len(scrollback) - 1
+    assert stats["unique_bytes"] < 1.2 * len(scrollback)
+    assert stats["stored_bytes"] < stats["unique_bytes"]
+
+    results = store.search('"module_3"', sources=["archives"])
+    assert {r["id"] for r in results} == {first, second}
+    assert "<mark>module_3</mark>" in results[0]["snippet"]
+
+
+def test_download_archived_terminal_streams_output(client):
+    from src.server.services.conversation_store import conversation_store
+
+    scrollback = "".join(f"output {i}\n" for i in range(300))
+    archive_id = conversation_store.archive_agent("worker-dl", "worker-dl", "worker", scrollback)
+
+    response = client.get(f"/api/agents/archived/{archive_id}/terminal")
+    assert response.status_code == 200
+    assert response.text == scrollback
+    assert "attachment" in response.headers["content-disposition"]
+
+    assert client.get("/api/agents/archived/missing/terminal").status_code == 404
+
+
+def test_deleted_archives_are_purged_by_plain_sqlite_clients(tmp_path):
+    import sqlite3
+
+    from src.server.services.conversation_store import ArchiveIncompleteError, ConversationStore
+
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    kept = store.archive_agent("worker-k", "worker-k", "worker", "shared line\nkept only\n")
+    gone = store.archive_agent("worker-g", "worker-g", "worker", "shared line\ngone only\n")
+
+    # Another client (no inflate function) deletes one archive
+    other = sqlite3.connect(store.db_path)
+    other.execute("DELETE FROM agent_archives WHERE id = ?", (gone,))
+    other.commit()
+    other.close()
+
+    assert store.purge_deleted_archives() == 1
+    assert store.search('"gone"', sources=["archives"]) == []
+    assert {r["id"] for r in store.search('"shared"', sources=["archives"])} == {kept}
+    with store._get_connection() as conn:
+        conn.execute("INSERT INTO agent_archives_fts (agent_archives_fts) VALUES ('integrity-check')")
+        conn.execute("DELETE FROM archive_chunks WHERE hash NOT IN (SELECT hash FROM archive_chunk_refs)")
+        assert conn.execute("SELECT COUNT(*) FROM archive_chunks").fetchone()[0] == 1
+        conn.execute("DELETE FROM archive_chunks")
+
+    try:
+        store.get_archive(kept)
+    except ArchiveIncompleteError as e:
+        assert "1 of 1" in str(e)
+    else:
+        raise AssertionError("missing chunks went unnoticed")
+
+
+def test_incomplete_archive_is_a_conflict(client):
+    from src.server.services.conversation_store import conversation_store
+
+    archive_id = conversation_store.archive_agent("worker-inc", "worker-inc", "worker", "lost output\n")
+    with conversation_store._get_connection() as conn:
+        conn.execute(
+            "DELETE FROM archive_chunks WHERE hash IN (SELECT hash FROM archive_chunk_refs WHERE archive_id = ?)",
+            (archive_id,),
+        )
+
+    for path in (f"/api/agents/archived/{archive_id}", f"/api/agents/archived/{archive_id}/terminal"):
+        response = client.get(path)
+        assert response.status_code == 409
+        assert "incomplete" in response.json()["detail"]
+
+
+def test_maintenance_prunes_and_downsamples(tmp_path, monkeypatch):
+    import asyncio
+    import time
+
+    from src.server.config import settings
+    from src.server.services import maintenance
+    from src.server.services.conversation_store import ConversationStore
+    from src.server.services.db import get_pool
+
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    with get_pool(store.db_path).connection() as conn:
+        conn.execute(
+            "CREATE TABLE heartbeat_history (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL NOT NULL, "
+            "sections TEXT NOT NULL, highest_priority TEXT, all_clear BOOLEAN NOT NULL DEFAULT 0, received_at TEXT NOT NULL)"
+        )
+        two_days_ago = time.time() - 2 * 86400
+        conn.executemany(
+            "INSERT INTO heartbeat_history (timestamp, sections, received_at) VALUES (?, '{}', '')",
+            [(two_days_ago + i * 60,) for i in range(120)],
+        )
+    for i, age_days in enumerate((1, 40, 41)):
+        store.store_event({
+            "id": f"evt-old-{i}",
+            "event_type": "PostToolUse",
+            "session_id": "sess-retention",
+            "agent_id": "worker-retention",
+            "timestamp": f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(time.time() - age_days * 86400))}+00:00",
+        })
+
+    monkeypatch.setattr(maintenance, "conversation_store", store)
+    monkeypatch.setattr(settings, "db_maintenance_batch_rows", 10)
+    # Retention is opt-in: a pass with the defaults keeps everything
+    report = asyncio.run(maintenance.DatabaseMaintenance().run_once())
+    assert not any(report["deleted"].values())
+    with get_pool(store.db_path).connection() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+
+    monkeypatch.setattr(settings, "retention_events_days", 30)
+    monkeypatch.setattr(settings, "heartbeat_downsample_after_hours", 24)
+    report = asyncio.run(maintenance.DatabaseMaintenance().run_once(vacuum=True))
+
+    assert report["deleted"]["agent_events"] == 2
+    assert [e["id"] for e in store.get_events(session_id="sess-retention")] == ["evt-old-0"]
+    # Two hours of per-minute heartbeats thin to (at most) one per clock hour
+    assert 2 <= 120 - report["deleted"]["heartbeat_history"] <= 3
+    with get_pool(store.db_path).connection() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
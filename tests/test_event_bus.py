@@ -0,0 +1,104 @@
+import asyncio
+
+from src.server.services.event_bus import SqliteBus, UnixSocketBus
+
+
+async def _exchange(first, second):
+    received = []
+    second.subscribe("test.channel", received.append)
+    first.subscribe("test.channel", received.append)
+    await first.start()
+    await second.start()
+    try:
+        first.publish("test.channel", {"n": 1})
+        for _ in range(50):
+            if received:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await first.stop()
+        await second.stop()
+    return received
+
+
+async def test_unix_socket_bus_reaches_other_workers(tmp_path):
+    first, second = UnixSocketBus(tmp_path / "bus"), UnixSocketBus(tmp_path / "bus")
+    received = await _exchange(first, second)
+    # Delivered once, to the other worker only
+    assert received == [{"n": 1}]
+    assert second.stats()["received"] == 1
+    assert first.stats()["received"] == 0
+
+
+async def test_sqlite_bus_reaches_other_workers(tmp_path):
+    first, second = SqliteBus(tmp_path / "bus.db"), SqliteBus(tmp_path / "bus.db")
+    received = await _exchange(first, second)
+    assert received == [{"n": 1}]
+
+
+async def test_remote_broadcast_reaches_local_clients():
+    import json
+    from src.server.websocket.manager import ClientConnection, ConnectionManager
+
+    class _Socket:
+        def __init__(self):
+            self.sent = []
+
+        async def send_text(self, message):
+            self.sent.append(message)
+
+    async def noop(client_id):
+        pass
+
+    manager = ConnectionManager()
+    socket = _Socket()
+    client = ClientConnection("c1", socket, max_queue=8, overflow_policy="coalesce", on_failure=noop)
+    manager.clients["c1"] = client
+    client.start()
+    await manager._on_bus_broadcast({"event": "new_message", "data": {"from_agent": "worker-1"}})
+    await asyncio.sleep(0.01)
+    assert json.loads(socket.sent[0])["data"]["from_agent"] == "worker-1"
+    await client.stop()
+
+
+async def test_unix_socket_bus_passes_large_messages_as_files(tmp_path):
+    first, second = UnixSocketBus(tmp_path / "bus"), UnixSocketBus(tmp_path / "bus")
+    received = []
+    second.subscribe("test.channel", received.append)
+    await second.start()
+    await first.start()
+    try:
+        first.publish("test.channel", {"blob": "x" * 300_000})
+        for _ in range(50):
+            if received:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await first.stop()
+        await second.stop()
+    assert len(received[0]["blob"]) == 300_000
+    assert not list((tmp_path / "bus").glob("*.msg"))
+
+
+async def test_unix_socket_bus_resyncs_after_lost_messages(tmp_path):
+    first, second = UnixSocketBus(tmp_path / "bus"), UnixSocketBus(tmp_path / "bus")
+    received, resyncs = [], []
+    second.subscribe("test.channel", received.append)
+    second.on_resync(lambda: resyncs.append(True))
+    await second.start()
+    await first.start()
+    try:
+        first.publish("test.channel", {"n": 1})
+        # Lost on the way, as when the peer's buffer is full
+        first._seq += 1
+        first.publish("test.channel", {"n": 3})
+        for _ in range(50):
+            if len(received) == 2 and resyncs:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await first.stop()
+        await second.stop()
+    assert received == [{"n": 1}, {"n": 3}]
+    assert resyncs == [True]
+    assert second.stats()["gaps"] == 1
@@ -0,0 +1,192 @@
+import asyncio
+import json
+
+import pytest
+
+from src.server.config import settings
+from src.server.services.delivery_queue import BUSY_RECHECK_POLLS, delivery_queue
+from src.server.services.mailbox import mailbox_service
+from src.server.services.mailbox_router import MailboxRouter
+from src.server.services.tmux_service import PaneState, TmuxSnapshot, classify_pane, tmux_service
+
+
+@pytest.fixture
+def panes(monkeypatch):
+    """Fake tmux with a supervisor and one worker; records what gets typed."""
+    state = {"supervisor": PaneState.PROMPT, "worker-r": PaneState.PROMPT}
+    sent = []
+
+    async def snapshot():
+        return TmuxSnapshot.parse("".join(
+            f"cmux\t@{i}\t{i}\t100\t0\t0\t{name}\n" for i, name in enumerate(state)
+        ))
+
+    async def pane_state(window, session=None):
+        return state.get(window, PaneState.UNKNOWN)
+
+    async def send_input(window, text, session=None):
+        sent.append((session, window, text))
+
+    monkeypatch.setattr(tmux_service, "snapshot", snapshot)
+    monkeypatch.setattr(tmux_service, "pane_state", pane_state)
+    monkeypatch.setattr(tmux_service, "send_input", send_input)
+    return state, sent
+
+
+@pytest.fixture(autouse=True)
+async def fresh_delivery_queue():
+    yield
+    # Leftovers are written to this test's send-queue directory
+    await delivery_queue.stop()
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    messages, statuses = [], []
+    monkeypatch.setattr(mailbox_service, "store_message", messages.append)
+    monkeypatch.setattr(
+        mailbox_service, "update_message_status",
+        lambda message_id, status: statuses.append((message_id, status)) or True,
+    )
+    return messages, statuses
+
+
+def _append(*lines: str):
+    settings.mailbox_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(settings.mailbox_path, "a") as f:
+        f.write("".join(lines))
+
+
+async def test_routes_new_records_and_persists_offset(panes, stored):
+    state, sent = panes
+    messages, statuses = stored
+    router = MailboxRouter()
+
+    msg_id = await mailbox_service.send_mailbox_message("worker-r", "supervisor", "[DONE] parser")
+    _append(
+        "not json\n",
+        json.dumps({"type": "status_update", "id": msg_id, "status": "completed"}) + "\n",
+        '{"from": "cmux:worker-r", "to": "cmux:sup',  # still being written
+    )
+    assert await router.process() == 3
+
+    assert sent == [("cmux", "supervisor", "[cmux:worker-r] [DONE] parser")]
+    assert [(m.id, m.from_agent, m.to_agent) for m in messages] == [(msg_id, "worker-r", "supervisor")]
+    assert [(i, s.value) for i, s in statuses] == [(msg_id, "working"), (msg_id, "completed")]
+
+    # The partial line is not consumed, and the position survives a restart
+    complete = settings.mailbox_path.read_bytes().rfind(b"\n") + 1
+    assert router.cursor == (1, complete)
+    resumed = MailboxRouter()
+    resumed._load_position()
+    assert resumed.cursor == (1, complete)
+
+
+async def test_resume_converts_router_sh_line_marker(panes, stored):
+    router = MailboxRouter()
+    for n in range(3):
+        await mailbox_service.send_mailbox_message("worker-r", "supervisor", f"note {n}")
+    # An older router.sh routed the first two and counted lines
+    (settings.cmux_dir / ".router_line").write_text("2\n")
+
+    router._load_position()
+    assert router.cursor.offset == len(b"".join(settings.mailbox_path.read_bytes().splitlines(True)[:2]))
+    await router.process()
+    assert [text for _, _, text in panes[1]] == ["[cmux:worker-r] note 2"]
+
+
+async def test_busy_pane_is_queued_then_polled(panes, stored):
+    state, sent = panes
+    state["supervisor"] = PaneState.BUSY
+    router = MailboxRouter()
+
+    await mailbox_service.send_mailbox_message("worker-r", "supervisor", "first")
+    await mailbox_service.send_mailbox_message("worker-r", "supervisor", "second")
+    await router.process()
+    assert sent == [] and router.queued == 2
+
+    await delivery_queue.dispatch_all()
+    assert sent == []
+    [queue] = [q for q in delivery_queue.stats()["agents"] if q["window"] == "supervisor"]
+    assert queue["depth"] == 2
+
+    state["supervisor"] = PaneState.PROMPT
+    await delivery_queue.dispatch_all()
+    assert [text for _, _, text in sent] == ["[cmux:worker-r] first", "[cmux:worker-r] second"]
+
+
+async def test_stop_hook_dispatches_queue(panes, stored, async_client):
+    state, sent = panes
+    state["worker-r"] = PaneState.BUSY
+    assert not await delivery_queue.deliver("cmux", "worker-r", "review the diff")
+    # Script-queued messages are picked up too
+    queue_dir = settings.cmux_dir / "send-queue"
+    queue_dir.mkdir()
+    (queue_dir / "cmux:worker-r").write_text("aGVsbG8=\n")
+    await delivery_queue.dispatch_all()
+
+    state["worker-r"] = PaneState.PROMPT
+    response = await async_client.post(
+        "/api/agent-events", json={"event_type": "Stop", "session_id": "s1", "agent_id": "worker-r"}
+    )
+    assert response.status_code == 200
+    for _ in range(50):
+        if len(sent) == 2:
+            break
+        await asyncio.sleep(0.02)
+    assert [text for _, _, text in sent] == ["review the diff", "hello"]
+
+    response = await async_client.get("/api/messages/delivery")
+    [queue] = [q for q in response.json()["agents"] if q["window"] == "worker-r"]
+    assert queue["depth"] == 0 and queue["delivered"] >= 2
+
+
+async def test_lease_is_exclusive():
+    first, second = MailboxRouter(), MailboxRouter()
+    assert first._try_lease()
+    try:
+        assert not second._try_lease()
+    finally:
+        first._lease.close()
+    assert second._try_lease()
+    second._lease.close()
+
+
+async def test_running_router_delivers_own_appends(panes, stored, monkeypatch):
+    monkeypatch.setattr(settings, "mailbox_router_poll_seconds", 30.0)
+    sent = panes[1]
+    router = MailboxRouter()
+    router.start()
+    try:
+        for _ in range(50):
+            if router.active:
+                break
+            await asyncio.sleep(0.02)
+        await mailbox_service.send_mailbox_message("worker-r", "supervisor", "ping")
+        for _ in range(50):
+            if sent:
+                break
+            await asyncio.sleep(0.02)
+        assert [text for _, _, text in sent] == ["[cmux:worker-r] ping"]
+    finally:
+        await router.stop()
+
+
+def test_classify_pane():
+    assert classify_pane("output\n\n❯ \n") == PaneState.PROMPT
+    assert classify_pane("Overwrite file? (y/n)") == PaneState.CONFIRMATION
+    assert classify_pane("Running tests...") == PaneState.BUSY
+    assert classify_pane("") == PaneState.UNKNOWN
+
+
+async def test_busy_agent_without_stop_hook_is_rechecked(panes, stored):
+    state, sent = panes
+    state["worker-r"] = PaneState.BUSY
+    delivery_queue.mark_busy("worker-r")
+    assert not await delivery_queue.deliver("cmux", "worker-r", "after the interrupt")
+
+    # The turn was interrupted: back at the prompt, but no Stop hook came
+    state["worker-r"] = PaneState.PROMPT
+    for _ in range(BUSY_RECHECK_POLLS):
+        await delivery_queue.dispatch_all()
+    assert [text for _, _, text in sent] == ["after the interrupt"]
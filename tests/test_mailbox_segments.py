@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+
+from src.server.config import settings
+from src.server.services.mailbox import mailbox_service
+from src.server.services.mailbox_segments import MailboxCursor
+
+
+async def test_concurrent_sends_share_locked_appends():
+    batches = mailbox_service.append_batches
+    ids = await asyncio.gather(*(
+        mailbox_service.send_mailbox_message("worker-r", "supervisor", f"burst {n}") for n in range(50)
+    ))
+
+    records = [json.loads(line) for line in settings.mailbox_path.read_text().splitlines()]
+    assert sorted(r["id"] for r in records) == sorted(ids)
+    assert mailbox_service.append_batches - batches < 50
+
+
+async def test_active_segment_is_sealed_past_the_size_limit(monkeypatch):
+    monkeypatch.setattr(settings, "mailbox_segment_max_bytes", 400)
+    for n in range(6):
+        await mailbox_service.send_mailbox_message("worker-r", "supervisor", f"note {n}")
+
+    segments = mailbox_service.segments
+    index = segments.load_index()
+    assert index["active"] > 1
+    assert all(segments.segment_path(s["segment"]).stat().st_size >= 400 for s in index["segments"])
+    # Writers keep appending to .cmux/mailbox, now the newest segment
+    assert settings.mailbox_path.stat().st_size < 400
+
+
+async def test_reader_crosses_segments_and_compacts(monkeypatch):
+    monkeypatch.setattr(settings, "mailbox_segment_max_bytes", 400)
+    cursor = MailboxCursor(1, 0)
+    subjects = []
+    for n in range(6):
+        await mailbox_service.send_mailbox_message("worker-r", "supervisor", f"note {n}")
+        if n == 1:
+            # Read part-way, then let the segment be sealed under the cursor
+            lines, cursor = mailbox_service.read_from(cursor)
+            subjects += lines
+    while True:
+        lines, moved = mailbox_service.read_from(cursor)
+        subjects += lines
+        if moved == cursor:
+            break
+        cursor = moved
+
+    assert [b"note %d" % n in line for n, line in enumerate(subjects)] == [True] * 6
+    assert cursor.segment == mailbox_service.segments.active_segment()
+
+    assert mailbox_service.compact(cursor) >= 1
+    assert mailbox_service.segments.stats()["sealed"] == []
+    assert not [p for p in mailbox_service.segments.directory.iterdir() if p.suffix == ".jsonl"]
+
+
+def test_interrupted_seal_is_recovered():
+    segments = mailbox_service.segments
+    settings.mailbox_path.write_text('{"id": "a"}\n')
+    # Moved into place but the index was never written
+    segments.directory.mkdir(parents=True)
+    os.replace(settings.mailbox_path, segments.segment_path(1))
+    settings.mailbox_path.write_text('{"id": "b"}\n')
+
+    assert segments.active_segment() == 2
+    lines, cursor = segments.read_from(MailboxCursor(1, 0), 1024)
+    assert lines == [b'{"id": "a"}\n'] and cursor == (1, 12)
+    lines, cursor = segments.read_from(cursor, 1024)
+    assert lines == [] and cursor == (2, 0)
+    lines, cursor = segments.read_from(cursor, 1024)
+    assert lines == [b'{"id": "b"}\n']
+
+
+def test_records_longer_than_the_read_limit_are_read_whole():
+    segments = mailbox_service.segments
+    big = b'{"id": "big", "body": "' + b"x" * 3000 + b'"}\n'
+    settings.mailbox_path.write_bytes(big + b'{"id": "next"}\n')
+
+    lines, cursor = segments.read_from(MailboxCursor(1, 0), 1024)
+    assert lines == [big, b'{"id": "next"}\n']
+    assert cursor == (1, len(big) + 15)
+
+    # A truncated record at the end of a sealed segment is skipped
+    settings.mailbox_path.write_bytes(b'{"id": "cut')
+    segments.directory.mkdir(parents=True)
+    os.replace(settings.mailbox_path, segments.segment_path(1))
+    settings.mailbox_path.write_text("")
+    assert segments.read_from(MailboxCursor(1, 0), 1024) == ([], (2, 0))
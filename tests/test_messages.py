@@ -1,5 +1,10 @@
+import json
+import uuid
 import pytest
 
+from src.server.config import settings
+from src.server.services.mailbox import mailbox_service
+
 
 def test_get_messages(client):
     response = client.get("/api/messages")
@@ -253,3 +258,96 @@ def test_get_inbox_pagination(client):
     response = client.get("/api/messages/inbox/worker-page?limit=2&offset=2")
     data = response.json()
     assert len(data["messages"]) == 2
+
+
+def test_get_messages_cursor_pagination(client):
+    """Test keyset pagination walks older pages with next_cursor and back with prev_cursor."""
+    for i in range(5):
+        client.post("/api/messages/internal", json={
+            "from_agent": "supervisor",
+            "to_agent": "worker-cursor",
+            "content": f"Cursor message {i}",
+        })
+
+    first = client.get("/api/messages?agent_id=worker-cursor&limit=2").json()
+    assert [m["content"] for m in first["messages"]] == ["Cursor message 4", "Cursor message 3"]
+    assert first["has_more"] is True
+
+    second = client.get(
+        f"/api/messages?agent_id=worker-cursor&limit=2&before={first['next_cursor']}"
+    ).json()
+    assert [m["content"] for m in second["messages"]] == ["Cursor message 2", "Cursor message 1"]
+
+    newer = client.get(
+        f"/api/messages?agent_id=worker-cursor&limit=2&after={second['prev_cursor']}"
+    ).json()
+    assert [m["content"] for m in newer["messages"]] == ["Cursor message 4", "Cursor message 3"]
+    assert newer["has_more"] is False
+
+
+def test_get_messages_invalid_cursor(client):
+    response = client.get("/api/messages?before=not-a-cursor")
+    assert response.status_code == 400
+
+
+def test_get_inbox_cursor_pagination(client):
+    """Test inbox cursors page forward in ASC order."""
+    agent = f"worker-inbox-cursor-{uuid.uuid4().hex[:8]}"
+    for i in range(4):
+        client.post("/api/messages/internal", json={
+            "from_agent": "supervisor",
+            "to_agent": agent,
+            "content": f"Inbox {i}",
+        })
+
+    first = client.get(f"/api/messages/inbox/{agent}?limit=3").json()
+    assert [m["content"] for m in first["messages"]] == ["Inbox 0", "Inbox 1", "Inbox 2"]
+    assert first["has_more"] is True
+
+    rest = client.get(
+        f"/api/messages/inbox/{agent}?limit=3&after={first['next_cursor']}"
+    ).json()
+    assert [m["content"] for m in rest["messages"]] == ["Inbox 3"]
+    assert rest["has_more"] is False
+
+
+def test_agent_history_uses_participant_index(client):
+    """Sent and received messages both show up in an agent's history and count."""
+    agent = f"worker-participant-{uuid.uuid4().hex[:8]}"
+    client.post("/api/messages/internal", json={
+        "from_agent": agent,
+        "to_agent": "supervisor",
+        "content": "Outgoing",
+    })
+    client.post("/api/messages/internal", json={
+        "from_agent": "supervisor",
+        "to_agent": agent,
+        "content": "Incoming",
+    })
+    client.post("/api/messages/internal", json={
+        "from_agent": agent,
+        "to_agent": agent,
+        "content": "Note to self",
+    })
+
+    data = client.get(f"/api/messages?agent_id={agent}").json()
+    assert [m["content"] for m in data["messages"]] == ["Note to self", "Incoming", "Outgoing"]
+    assert data["total"] == 3
+
+
+async def test_mailbox_bodies_inline_or_attached(async_client, monkeypatch):
+    monkeypatch.setattr(settings, "mailbox_inline_body_max", 40)
+    await mailbox_service.send_mailbox_message("worker-r", "supervisor", "short", "all done")
+    await mailbox_service.send_mailbox_message("worker-r", "supervisor", "long", "x" * 60)
+    short, long = [json.loads(line) for line in settings.mailbox_path.read_text().splitlines()]
+
+    assert short["body"] == "all done"
+    assert long["body"].startswith("/") and long["body"].endswith(".md")
+
+    for record, expected in ((short, "all done"), (long, "# long\n\n" + "x" * 60)):
+        response = await async_client.get("/api/filesystem/body", params={"ref": record["body"]})
+        assert response.status_code == 200
+        assert response.json()["content"] == expected
+
+    response = await async_client.get("/api/filesystem/body", params={"ref": "/etc/passwd"})
+    assert response.status_code == 400
@@ -0,0 +1,56 @@
+import uuid
+
+
+def test_search_messages_and_thoughts(client):
+    """Test search finds messages and thoughts with snippets and agent filters."""
+    agent = f"worker-search-{uuid.uuid4().hex[:8]}"
+    client.post("/api/messages/internal", json={
+        "from_agent": agent,
+        "to_agent": "supervisor",
+        "content": "Refactored the token refresh in auth.py",
+    })
+    client.post("/api/thoughts", json={
+        "agent_name": agent,
+        "thought_type": "tool_result",
+        "tool_name": "Edit",
+        "tool_input": "src/server/auth.py",
+        "tool_response": "ok",
+    })
+
+    response = client.get("/api/search", params={"q": "auth.py", "agent_id": agent})
+    assert response.status_code == 200
+    data = response.json()
+    assert {r["source"] for r in data["results"]} == {"messages", "thoughts"}
+    message = [r for r in data["results"] if r["source"] == "messages"][0]
+    assert "<mark>auth.py</mark>" in message["snippet"]
+
+    only_thoughts = client.get(
+        "/api/search", params={"q": "auth.py", "agent_id": agent, "source": "thoughts"}
+    ).json()
+    assert [r["source"] for r in only_thoughts["results"]] == ["thoughts"]
+
+
+def test_search_pagination(client):
+    """Test search pages with offset/next_offset."""
+    word = f"zq{uuid.uuid4().hex[:8]}"
+    for i in range(3):
+        client.post("/api/messages/internal", json={
+            "from_agent": "supervisor",
+            "to_agent": "worker-search-page",
+            "content": f"{word} number {i}",
+        })
+
+    first = client.get("/api/search", params={"q": word, "limit": 2, "order": "recent"}).json()
+    assert len(first["results"]) == 2
+    assert first["has_more"] is True
+
+    rest = client.get(
+        "/api/search", params={"q": word, "limit": 2, "order": "recent", "offset": first["next_offset"]}
+    ).json()
+    assert len(rest["results"]) == 1
+    assert rest["has_more"] is False
+
+
+def test_search_invalid_raw_query(client):
+    response = client.get("/api/search", params={"q": "auth AND", "raw": "true"})
+    assert response.status_code == 400
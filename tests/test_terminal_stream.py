@@ -0,0 +1,90 @@
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+
+from src.server.config import settings
+from src.server.services.terminal_stream import PaneStream, TerminalViewer, terminal_streamer
+
+
+@pytest.fixture
+def private_tmux(monkeypatch, tmp_path):
+    """Point every tmux call (including TmuxService's) at a throwaway server."""
+    if shutil.which("tmux") is None:
+        pytest.skip("tmux not installed")
+    monkeypatch.delenv("TMUX", raising=False)
+    monkeypatch.setenv("TMUX_TMPDIR", str(tmp_path))
+    subprocess.run(["tmux", "new-session", "-d", "-s", "cmux-stream", "-n", "main", "sh"], check=True)
+    yield "cmux-stream"
+    subprocess.run(["tmux", "kill-server"], capture_output=True)
+
+
+async def _read_until(viewer: TerminalViewer, needle: bytes) -> bytes:
+    seen = b""
+    while needle not in seen:
+        chunk = await asyncio.wait_for(viewer.read(), timeout=5)
+        assert chunk, "stream ended early"
+        seen += chunk
+    return seen
+
+
+async def test_rolling_buffer_lets_slow_viewers_skip_ahead():
+    stream = PaneStream("%1", "cmux", "worker-1", limit=8)
+    fast, slow = TerminalViewer(stream), TerminalViewer(stream)
+    stream.viewers.update({fast, slow})
+
+    stream.feed(b"abcd")
+    assert await fast.read() == b"abcd"
+    stream.feed(b"efghijkl")
+    # The slow viewer never saw "abcd" and only the last 8 bytes are kept
+    assert await slow.read() == b"efghijkl"
+    assert await fast.read() == b"efghijkl"
+
+    stream.close()
+    assert await fast.read() == b""
+
+
+async def test_viewers_of_a_pane_share_one_pipe(private_tmux):
+    first = await terminal_streamer.attach(private_tmux, "main")
+    second = await terminal_streamer.attach(private_tmux, "main")
+    try:
+        assert first.stream is second.stream
+        assert first.stream.source == "pipe"
+        subprocess.run(["tmux", "send-keys", "-t", f"{private_tmux}:main", "echo streamed-$((6*7))", "Enter"])
+
+        assert b"streamed-42" in await _read_until(first, b"streamed-42")
+        assert b"streamed-42" in await _read_until(second, b"streamed-42")
+        assert [s["viewers"] for s in terminal_streamer.stats()["streams"]] == [2]
+    finally:
+        await terminal_streamer.detach(first)
+        await terminal_streamer.detach(second)
+    assert terminal_streamer.stats()["streams"] == []
+    # The FIFO is removed with the pipe
+    assert not list((settings.cmux_dir / "terminal").iterdir())
+
+
+async def test_control_streams_move_to_a_pipe_when_control_drops(private_tmux, monkeypatch):
+    from src.server.services.tmux_service import tmux_service
+
+    monkeypatch.setattr(settings, "main_session", private_tmux)
+    monkeypatch.setattr(settings, "tmux_control_mode", True)
+    monkeypatch.setattr(tmux_service, "_listeners", [])
+    monkeypatch.setattr(terminal_streamer, "_listening", False)
+    assert await tmux_service.start_control()
+    viewer = await terminal_streamer.attach(private_tmux, "main")
+    try:
+        assert viewer.stream.source == "control"
+        tmux_service._control._proc.kill()
+        for _ in range(50):
+            if viewer.stream.source == "pipe":
+                break
+            await asyncio.sleep(0.05)
+        assert viewer.stream.source == "pipe"
+
+        subprocess.run(["tmux", "send-keys", "-t", f"{private_tmux}:main", "echo piped-$((6*7))", "Enter"])
+        seen = await _read_until(viewer, b"piped-42\r\n")
+        assert b"\x1b[2J" in seen
+    finally:
+        await terminal_streamer.detach(viewer)
+        await tmux_service.stop_control()
@@ -0,0 +1,161 @@
+import shutil
+import subprocess
+import uuid
+
+import pytest
+
+from src.server.services.tmux_control import TmuxControlClient, unescape_output
+from src.server.services.tmux_service import SNAPSHOT_FORMAT, TmuxService, TmuxSnapshot
+
+pytestmark = pytest.mark.skipif(shutil.which("tmux") is None, reason="tmux not installed")
+
+
+@pytest.fixture
+def tmux_socket():
+    name = f"cmux-test-{uuid.uuid4().hex[:8]}"
+    subprocess.run(["tmux", "-L", name, "new-session", "-d", "-s", "cmux", "-n", "main"], check=True)
+    yield name
+    subprocess.run(["tmux", "-L", name, "kill-server"], capture_output=True)
+
+
+async def test_control_client_correlates_responses(tmux_socket, tmp_path):
+    client = TmuxControlClient("cmux", socket_name=tmux_socket)
+    assert await client.start()
+    try:
+        out, err, rc = await client.run(["list-windows", "-F", "#{window_name}"])
+        assert (out, rc) == ("main\n", 0)
+
+        out, err, rc = await client.run(["has-session", "-t", "missing"])
+        assert rc == 1 and "missing" in err
+
+        # Quoting survives characters the tmux parser treats specially
+        text = 'say "hi" $HOME; {x} \\ done'
+        await client.run(["set-buffer", "-b", "probe", text])
+        await client.run(["save-buffer", "-b", "probe", str(tmp_path / "probe.txt")])
+        assert (tmp_path / "probe.txt").read_text() == text
+    finally:
+        await client.stop()
+
+
+async def test_control_client_reports_window_notifications(tmux_socket):
+    import asyncio
+
+    client = TmuxControlClient("cmux", socket_name=tmux_socket)
+    assert await client.start()
+    seen = []
+    client.add_listener(lambda name, args: seen.append(name))
+    try:
+        await client.run(["new-window", "-d", "-n", "worker"])
+        await asyncio.sleep(0.1)
+        assert "window-add" in seen
+    finally:
+        await client.stop()
+
+
+async def test_control_client_streams_pane_output(tmux_socket):
+    import asyncio
+
+    client = TmuxControlClient("cmux", socket_name=tmux_socket)
+    assert await client.start()
+    output = []
+    client.add_listener(lambda name, args: output.append(args) if name == "output" else None)
+    try:
+        await client.set_output(True)
+        await client.run(["send-keys", "-t", "cmux:main", "echo out-$((6*7))", "Enter"])
+        for _ in range(50):
+            received = b"".join(unescape_output(args.partition(" ")[2]) for args in output)
+            if b"out-42\r\n" in received:
+                break
+            await asyncio.sleep(0.1)
+        assert b"out-42\r\n" in received
+    finally:
+        await client.stop()
+
+
+async def test_fake_block_markers_in_output_do_not_end_a_response(tmux_socket):
+    import asyncio
+
+    # Pane output is not escaped inside a %begin block, so these lines
+    # reach the reader in the middle of the capture-pane response
+    subprocess.run(
+        ["tmux", "-L", tmux_socket, "send-keys", "-t", "cmux:main",
+         "clear; printf '%%end 1 2 1\\n%%begin 1 2 1\\n'", "Enter"],
+        check=True,
+    )
+    for _ in range(50):
+        shown = subprocess.run(
+            ["tmux", "-L", tmux_socket, "capture-pane", "-p", "-t", "cmux:main"], capture_output=True, text=True,
+        ).stdout
+        if "\n%begin 1 2 1" in shown:
+            break
+        await asyncio.sleep(0.1)
+
+    client = TmuxControlClient("cmux", socket_name=tmux_socket)
+    assert await client.start()
+    try:
+        captured, session, third = await asyncio.gather(
+            client.run(["capture-pane", "-p", "-t", "cmux:main"]),
+            client.run(["display-message", "-p", "#{session_name}"]),
+            client.run(["display-message", "-p", "third"]),
+        )
+        assert "%end 1 2 1\n%begin 1 2 1\n" in captured[0]
+        assert session == ("cmux\n", "", 0)
+        assert third == ("third\n", "", 0)
+    finally:
+        await client.stop()
+
+
+async def test_control_client_fails_without_session():
+    client = TmuxControlClient("missing", socket_name=f"cmux-test-{uuid.uuid4().hex[:8]}")
+    assert not await client.start()
+
+
+async def test_unanswered_control_command_is_not_rerun(tmux_socket, monkeypatch):
+    import asyncio
+
+    service = TmuxService()
+    service._control = TmuxControlClient("cmux", socket_name=tmux_socket)
+    assert await service._control.start()
+    forked = []
+
+    async def fork(*args, **kwargs):
+        forked.append(args)
+        raise AssertionError("re-ran a command tmux may already have run")
+
+    async def unanswered(args):
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", fork)
+    try:
+        monkeypatch.setattr(service._control, "run", unanswered)
+        out, err, rc = await service._run_command(["tmux", "send-keys", "-t", "cmux:main", "x"])
+        assert rc == 1 and forked == []
+        assert service.control_stats()["unanswered_commands"] == 1
+    finally:
+        await service._control.stop()
+
+    # Never sent: safe to fork instead
+    monkeypatch.undo()
+    out, err, rc = await service._run_command(["tmux", "-L", tmux_socket, "list-windows", "-F", "#{window_name}"])
+    assert (out, rc) == ("main\n", 0)
+    assert service.control_stats()["subprocess_commands"] == 1
+
+
+def test_snapshot_parses_all_sessions(tmux_socket):
+    subprocess.run(["tmux", "-L", tmux_socket, "new-window", "-d", "-t", "cmux", "-n", "worker\tx"], check=True)
+    subprocess.run(["tmux", "-L", tmux_socket, "new-session", "-d", "-s", "other", "-n", "main"], check=True)
+    output = subprocess.run(
+        ["tmux", "-L", tmux_socket, "list-windows", "-a", "-F", SNAPSHOT_FORMAT],
+        check=True, capture_output=True, text=True,
+    ).stdout
+
+    snapshot = TmuxSnapshot.parse(output)
+    # Non-cmux sessions are left out
+    assert snapshot.sessions == ["cmux"]
+    assert snapshot.window_names("cmux") == ["main", "worker\tx"]
+    window = snapshot.windows("cmux")[0]
+    assert window.window_id.startswith("@") and window.pane_pid > 0 and not window.dead
+
+
+def test_unescape_output():
+    assert unescape_output("ok\\015\\012") == b"ok\r\n"
@@ -18,3 +18,353 @@ def test_websocket_receives_message():
         websocket.send_text("test")
         # Connection should remain open
         pass
+
+
+class _SlowSocket:
+    """Fake WebSocket whose sends block until released."""
+
+    def __init__(self):
+        self.sent = []
+        self.release = None
+
+    async def send_text(self, message):
+        await self.release.wait()
+        self.sent.append(message)
+
+
+async def _noop_failure(client_id):
+    pass
+
+
+async def test_client_queue_drops_oldest_when_full():
+    import asyncio
+    from src.server.websocket.manager import ClientConnection
+
+    socket = _SlowSocket()
+    socket.release = asyncio.Event()
+    client = ClientConnection("c1", socket, max_queue=2, overflow_policy="drop_oldest", on_failure=_noop_failure)
+    client.start()
+    await asyncio.sleep(0)
+
+    for i in range(4):
+        assert client.enqueue("agent_event", f"m{i}")
+    assert client.stats()["dropped"] == 2
+
+    socket.release.set()
+    await asyncio.sleep(0.01)
+    assert socket.sent == ["m2", "m3"]
+    assert client.stats()["sent"] == 2
+    await client.stop()
+
+
+async def test_client_queue_coalesces_state_events():
+    import asyncio
+    from src.server.websocket.manager import ClientConnection
+
+    socket = _SlowSocket()
+    socket.release = asyncio.Event()
+    client = ClientConnection("c2", socket, max_queue=2, overflow_policy="coalesce", on_failure=_noop_failure)
+
+    client.enqueue("heartbeat_update", "hb1")
+    client.enqueue("agent_event", "e1")
+    client.enqueue("heartbeat_update", "hb2")
+    assert client.stats()["coalesced"] == 1
+    assert client.stats()["dropped"] == 0
+
+    client.start()
+    socket.release.set()
+    await asyncio.sleep(0.01)
+    assert socket.sent == ["e1", "hb2"]
+    await client.stop()
+
+
+async def test_client_queue_disconnect_policy():
+    import asyncio
+    from src.server.websocket.manager import ClientConnection
+
+    socket = _SlowSocket()
+    socket.release = asyncio.Event()
+    client = ClientConnection("c3", socket, max_queue=1, overflow_policy="disconnect", on_failure=_noop_failure)
+    assert client.enqueue("agent_event", "e1")
+    assert not client.enqueue("agent_event", "e2")
+
+
+def test_websocket_stats_endpoint(client):
+    response = client.get("/api/agents/ws/stats")
+    assert response.status_code == 200
+    assert "clients" in response.json()
+
+
+def test_subscription_filters_by_event_and_agent():
+    from src.server.websocket.subscriptions import EventScope, Subscription
+
+    sub = Subscription()
+    assert sub.is_default
+    sub.subscribe({"events": ["agent_event"], "agents": ["worker-1"]})
+
+    assert sub.matches("agent_event", EventScope({"agent_id": "worker-1"}))
+    assert not sub.matches("agent_event", EventScope({"agent_id": "worker-2"}))
+    assert not sub.matches("new_message", EventScope({"from_agent": "worker-1"}))
+    # Control frames always pass; unscoped events only face the event filter
+    assert sub.matches("ping", EventScope({}))
+    assert sub.matches("agent_event", EventScope({"tool_name": "Bash"}))
+
+    sub.unsubscribe({"agents": ["worker-1"]})
+    assert not sub.matches("agent_event", EventScope({"agent_id": "worker-1"}))
+    sub.subscribe({"agents": "*"})
+    assert sub.to_dict()["agents"] == "*"
+
+
+def test_subscription_resolves_agent_projects():
+    from src.server.websocket.subscriptions import EventScope, Subscription
+
+    sub = Subscription()
+    sub.subscribe({"projects": ["proj-a"]})
+    resolver = {"worker-1": "proj-a", "worker-2": "proj-b"}.get
+    assert sub.matches("agent_event", EventScope({"agent_id": "worker-1"}, resolver))
+    assert not sub.matches("agent_event", EventScope({"agent_id": "worker-2"}, resolver))
+    assert sub.matches("agent_event", EventScope({"project_id": "proj-a"}, resolver))
+
+
+async def test_broadcast_routes_by_subscription():
+    import asyncio
+    from src.server.websocket.manager import ClientConnection, ConnectionManager
+
+    manager = ConnectionManager()
+    sockets = {}
+    for client_id in ("all", "narrow"):
+        sockets[client_id] = _SlowSocket()
+        sockets[client_id].release = asyncio.Event()
+        sockets[client_id].release.set()
+        client = ClientConnection(client_id, sockets[client_id], max_queue=8, overflow_policy="coalesce", on_failure=_noop_failure)
+        manager.clients[client_id] = client
+        client.start()
+    manager.clients["narrow"].subscription.subscribe({"agents": ["worker-1"]})
+
+    await manager.broadcast("agent_event", {"agent_id": "worker-1"})
+    await manager.broadcast("agent_event", {"agent_id": "worker-2"})
+    await asyncio.sleep(0.01)
+
+    assert len(sockets["all"].sent) == 2
+    assert len(sockets["narrow"].sent) == 1
+    assert '"worker-1"' in sockets["narrow"].sent[0]
+    assert manager.stats()["filtered"] == 1
+    for client in manager.clients.values():
+        await client.stop()
+
+
+def test_encoded_event_serializes_once_per_format():
+    import json
+    from datetime import datetime, timezone
+    from src.server.models.message import Message, MessageType
+    from src.server.websocket.encoding import EncodedEvent, negotiate_format
+
+    msg = Message(
+        id="m-1",
+        timestamp=datetime(2025, 1, 1, tzinfo=timezone.utc),
+        from_agent="worker-1",
+        to_agent="user",
+        type=MessageType.RESPONSE,
+        content="done",
+    )
+    encoded = EncodedEvent("new_message", msg)
+    frame = encoded.frame("json")
+    assert encoded.frame("json") is frame
+    decoded = json.loads(frame)
+    assert decoded["event"] == "new_message"
+    assert decoded["data"]["from_agent"] == "worker-1"
+    assert decoded["data"]["timestamp"].startswith("2025-01-01T00:00:00")
+    assert negotiate_format("carrier-pigeon") == "json"
+
+
+async def test_unserializable_broadcast_is_dropped_alone():
+    import asyncio
+    import json
+    from src.server.websocket.manager import ConnectionManager
+
+    manager = ConnectionManager()
+    socket = _accepting_socket()
+    await manager.connect(socket, "u1")
+    payload = {"agent_id": "worker-1", "n": 1}
+    await manager.broadcast("agent_event", payload)
+    # Changing the payload afterwards doesn't change what is sent
+    payload["n"] = 2
+    await manager.broadcast("agent_event", {"agent_id": "worker-1", "bad": object()})
+    await manager.broadcast("agent_event", {"agent_id": "worker-1", "n": 3})
+    await asyncio.sleep(0.01)
+
+    assert [json.loads(f)["data"]["n"] for f in socket.sent] == [1, 3]
+    assert "u1" in manager.clients
+    assert manager.stats()["unserializable"] == 1
+    await manager.disconnect_all()
+
+
+def test_websocket_format_query_param(client):
+    with client.websocket_connect("/api/agents/ws?format=json") as ws:
+        stats = client.get("/api/agents/ws/stats").json()
+        assert stats["formats"][0] == "json"
+        assert all(c["encoding"] == "json" for c in stats["clients"].values())
+        ws.close()
+
+
+def test_agent_rate_limiter_token_bucket():
+    from src.server.websocket.batching import AgentRateLimiter
+
+    limiter = AgentRateLimiter(rate=10, burst=2)
+    assert limiter.allow("worker-1", now=0.0)
+    assert limiter.allow("worker-1", now=0.0)
+    assert not limiter.allow("worker-1", now=0.0)
+    assert limiter.allow("worker-2", now=0.0)
+    assert limiter.allow("worker-1", now=0.1)
+    assert limiter.take_suppressed() == {"worker-1": 1}
+    assert limiter.take_suppressed() == {}
+
+
+async def test_broadcast_batches_for_opted_in_clients():
+    import asyncio
+    import json
+    from src.server.websocket.manager import ClientConnection, ConnectionManager
+
+    manager = ConnectionManager()
+    sockets = {}
+    for client_id in ("plain", "batched"):
+        sockets[client_id] = _SlowSocket()
+        sockets[client_id].release = asyncio.Event()
+        sockets[client_id].release.set()
+        client = ClientConnection(client_id, sockets[client_id], max_queue=16, overflow_policy="coalesce", on_failure=_noop_failure)
+        manager.clients[client_id] = client
+        client.start()
+    manager.clients["batched"].subscription.subscribe({"batch": True})
+
+    for i in range(3):
+        await manager.broadcast("agent_event", {"agent_id": "worker-1", "id": i})
+    await manager.broadcast("heartbeat_update", {"all_clear": False})
+    await manager.broadcast("heartbeat_update", {"all_clear": True})
+    await manager.flush_batches()
+    await asyncio.sleep(0.01)
+
+    assert len(sockets["plain"].sent) == 5
+    frames = [json.loads(f) for f in sockets["batched"].sent]
+    assert [f["event"] for f in frames] == ["heartbeat_update", "event_batch"]
+    assert frames[0]["data"]["all_clear"] is True
+    assert frames[1]["data"]["event"] == "agent_event"
+    assert [e["id"] for e in frames[1]["data"]["events"]] == [0, 1, 2]
+    for client in manager.clients.values():
+        await client.stop()
+
+
+async def test_rate_limit_applies_to_batching_clients_only():
+    import asyncio
+    import json
+    from src.server.websocket.batching import AgentRateLimiter
+    from src.server.websocket.manager import ConnectionManager
+
+    manager = ConnectionManager()
+    manager._rate_limiter = AgentRateLimiter(rate=0.001, burst=1)
+    sockets = {client_id: _accepting_socket() for client_id in ("plain", "batched")}
+    for client_id, socket in sockets.items():
+        await manager.connect(socket, client_id)
+    manager.clients["batched"].subscription.subscribe({"batch": True})
+
+    for i in range(3):
+        await manager.broadcast("agent_event", {"agent_id": "worker-1", "id": i})
+    await manager.flush_batches()
+    await asyncio.sleep(0.01)
+
+    assert [json.loads(f)["data"]["id"] for f in sockets["plain"].sent] == [0, 1, 2]
+    (batch,) = [json.loads(f)["data"] for f in sockets["batched"].sent]
+    assert [e["id"] for e in batch["events"]] == [0]
+    assert batch["suppressed"] == {"worker-1": 2}
+    await manager.disconnect_all()
+
+
+def _accepting_socket():
+    import asyncio
+
+    socket = _SlowSocket()
+    socket.release = asyncio.Event()
+    socket.release.set()
+
+    async def noop(*args, **kwargs):
+        pass
+
+    socket.accept = socket.close = noop
+    return socket
+
+
+async def test_resume_replays_missed_frames_from_buffer():
+    import asyncio
+    import json
+    from src.server.websocket.manager import ConnectionManager
+
+    manager = ConnectionManager()
+    for i in range(5):
+        await manager.broadcast("agent_event", {"agent_id": "worker-1", "id": i})
+    await manager.broadcast("ping", {})
+
+    socket = _accepting_socket()
+    await manager.connect(socket, "r1", resume_from=2)
+    await asyncio.sleep(0.01)
+    frames = [json.loads(f) for f in socket.sent]
+    assert [f["seq"] for f in frames[:-1]] == [3, 4, 5]
+    assert frames[-1]["event"] == "resumed"
+    assert frames[-1]["data"]["latest_seq"] == 5
+
+    stale = _accepting_socket()
+    await manager.connect(stale, "r2", resume_from=99)
+    await asyncio.sleep(0.01)
+    assert json.loads(stale.sent[-1])["event"] == "resync_required"
+    await manager.disconnect_all()
+
+
+async def test_resume_reads_older_gaps_from_event_log():
+    import asyncio
+    import json
+    from src.server.services.conversation_store import ConversationStore
+    from src.server.websocket.manager import ConnectionManager
+
+    store = ConversationStore()
+    manager = ConnectionManager()
+    await manager.attach_event_log(store)
+    base = manager.stats()["seq"]
+    manager._recent = type(manager._recent)(maxlen=2)
+    for i in range(5):
+        await manager.broadcast("agent_thought", {"agent_name": "worker-1", "id": i})
+
+    socket = _accepting_socket()
+    await manager.connect(socket, "r3", resume_from=base + 1)
+    await asyncio.sleep(0.01)
+    frames = [json.loads(f) for f in socket.sent]
+    assert [f["data"]["id"] for f in frames[:-1]] == [1, 2, 3, 4]
+    assert frames[-1]["event"] == "resumed"
+    await manager.disconnect_all()
+
+
+async def test_oversized_frames_are_not_logged(monkeypatch):
+    import asyncio
+    import json
+    from src.server.config import settings
+    from src.server.services.conversation_store import ConversationStore
+    from src.server.websocket.manager import ConnectionManager
+
+    monkeypatch.setattr(settings, "ws_event_log_max_frame_size", 200)
+    store = ConversationStore()
+    manager = ConnectionManager()
+    await manager.attach_event_log(store)
+    base = manager.stats()["seq"]
+    manager._recent = type(manager._recent)(maxlen=2)
+    for i in range(5):
+        output = "x" * 500 if i == 2 else ""
+        await manager.broadcast("agent_thought", {"agent_name": "worker-1", "id": i, "tool_response": output})
+    assert manager.stats()["log_skipped"] == 1
+
+    # The skipped frame leaves a hole the log can't replay across
+    socket = _accepting_socket()
+    await manager.connect(socket, "r4", resume_from=base + 1)
+    await asyncio.sleep(0.01)
+    assert json.loads(socket.sent[-1])["event"] == "resync_required"
+    await manager.disconnect_all()
+
+    store.flush()
+    assert store.trim_ws_events(base + 5) == 3
+    assert [row[0] for row in store.get_ws_events(base, base + 10, 10)] == [base + 5]